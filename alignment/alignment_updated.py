@@ -14,18 +14,42 @@ def load_sentences_and_labels(sentence_file, label_file):
 
     return sentences, labels
 
+def read_artifact(cluster_file):
+    """
+    Vocab keys and cluster ids of a .npz clustering artifact (see clustering/artifacts.py),
+    read from its arrays with numpy alone
+    """
+    import numpy as np
+
+    with np.load(cluster_file) as artifact:
+        if int(artifact["format_version"]) > 1:
+            raise ValueError(f"{cluster_file}: unsupported artifact format {int(artifact['format_version'])}")
+        labels = artifact["labels"].tolist()
+        offsets = artifact["vocab_offsets"].tolist()
+        blob = artifact["vocab_bytes"].tobytes()
+    return [blob[a:b].decode('utf-8') for a, b in zip(offsets[:-1], offsets[1:])], labels
+
 def load_clusters(cluster_file):
     clusters = []
 
+    if cluster_file.endswith('.npz'):
+        # versioned clustering artifact: labels come from its arrays, no cluster text to parse
+        for key, cluster_id in zip(*read_artifact(cluster_file)):
+            word, word_frequency, sentence_index, word_index = key.split("|||")
+            clusters.append((word, word_frequency, int(sentence_index), int(word_index), str(cluster_id)))
+        return clusters
+
     with open(cluster_file, 'r') as f_clusters:
-        for line in f_clusters:
-            parts = line.strip().split("|||")
-            word = parts[0]
-            word_frequency = parts[1]
-            sentence_index = int(parts[2])
-            word_index = int(parts[3])
-            cluster_id = parts[4].split()[-1]
-            clusters.append((word, word_frequency, sentence_index, word_index, cluster_id))
+        lines = f_clusters.read().splitlines()
+
+    for line in lines:
+        parts = line.strip().split("|||")
+        word = parts[0]
+        word_frequency = parts[1]
+        sentence_index = int(parts[2])
+        word_index = int(parts[3])
+        cluster_id = parts[4].split()[-1]
+        clusters.append((word, word_frequency, sentence_index, word_index, cluster_id))
 
     return clusters
 
@@ -5,6 +5,12 @@ from pathlib import Path
 from utils import read_cluster_data, read_annotations, read_sentences, load_all_cluster_data
 app = Flask(__name__) 
 
+def clusters_file(layer_id):
+    """The layer's clustering artifact (clusters-500.npz) when present, else clusters-500.txt"""
+    layer_path = Path(DATA_PATH) / f"layer{layer_id}"
+    artifact = layer_path / "clusters-500.npz"
+    return artifact if artifact.exists() else layer_path / "clusters-500.txt"
+
 
 @app.route("/")
 def index(): 
@@ -15,7 +21,7 @@ def get_cluster(cluster_id, layer_id):
 
     cluster_id=int(cluster_id)
     temp = "c" + str(cluster_id)
-    clusters_path = Path(DATA_PATH) / f"layer{layer_id}" / "clusters-500.txt"
+    clusters_path = clusters_file(layer_id)
     annotations_path = Path(DATA_PATH) / f"layer{layer_id}" / "annotations.json"
     cluster_to_words = read_cluster_data(clusters_path)
     if temp not in list(cluster_to_words.keys()): 
@@ -36,7 +42,7 @@ def get_sentences():
     word = word.strip() 
     temp = "c" + str(cluster_id)
 
-    clusters_path = Path(DATA_PATH) / f"layer{layer_id}" / "clusters-500.txt"
+    clusters_path = clusters_file(layer_id)
 
     clusters = load_all_cluster_data(clusters_path=clusters_path)
 
@@ -7,6 +7,58 @@ import argparse
 from collections import Counter, defaultdict
 from typing import Dict, List
 
+def read_artifact(fname):
+    """
+    Vocab keys and cluster ids of a .npz clustering artifact (see clustering/artifacts.py),
+    read from its arrays with numpy alone.
+
+    Parameters
+    ----------
+    fname : str
+        Path to a .npz clustering artifact.
+
+    Returns
+    -------
+    keys: List
+        word|||count|||sentence|||token keys of the entries.
+    labels: List
+        Cluster id of every entry.
+    """
+    import numpy as np
+
+    with np.load(fname) as artifact:
+        if int(artifact["format_version"]) > 1:
+            raise ValueError(f"{fname}: unsupported artifact format {int(artifact['format_version'])}")
+        labels = artifact["labels"].tolist()
+        offsets = artifact["vocab_offsets"].tolist()
+        blob = artifact["vocab_bytes"].tobytes()
+    return [blob[a:b].decode('utf-8') for a, b in zip(offsets[:-1], offsets[1:])], labels
+
+def cluster_entries(fname):
+    """
+    Entries of a latent concepts file. A .npz clustering artifact is read from its
+    label and vocab arrays, without writing out and re-parsing text lines.
+
+    Parameters
+    ----------
+    fname : str
+        Path to a clusters .txt file or a .npz clustering artifact.
+
+    Returns
+    -------
+    entries: Iterable
+        (token, sentence id, token id, cluster id) of every entry.
+    """
+    if str(fname).endswith(".npz"):
+        for key, cluster_idx in zip(*read_artifact(fname)):
+            token, _, sentence_idx, token_idx = key.split("|||")
+            yield token, int(sentence_idx), int(token_idx), cluster_idx
+        return
+    with open(fname, encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\r\n').split("|||")
+            yield parts[0], int(parts[2]), int(parts[3]), int(parts[4])
+
 def cluster_read(fname):
     """
     Given a txt file containing the latent concepts of a corresponding layer, The
@@ -37,14 +89,11 @@ def cluster_read(fname):
     words_idx = []
     cluster_idx = []
     sent_idx = []
-    with open(fname,encoding='utf-8') as f:
-        for line in f:
-            line  = line.rstrip('\r\n')
-            parts = line.split("|||")
-            words.append(parts[0])
-            cluster_idx.append(int(parts[4]))
-            words_idx.append(int(parts[3]))
-            sent_idx.append(int(parts[2]))
+    for token, sentence_idx, token_idx, cluster in cluster_entries(fname):
+        words.append(token)
+        cluster_idx.append(cluster)
+        words_idx.append(token_idx)
+        sent_idx.append(sentence_idx)
     return words, words_idx, sent_idx, cluster_idx
 
 def read_cluster_data(fname):
@@ -134,15 +183,8 @@ def load_all_cluster_data(clusters_path):
         A dictionary containing the cluster data. 
     """
     clusters = defaultdict(list)
-    with open(clusters_path) as fp:
-        for line_idx, line in enumerate(fp):
-            token, _, sentence_idx, token_idx, cluster_idx = line.strip().rsplit("|||")
-
-            sentence_idx = int(sentence_idx)
-            token_idx = int(token_idx)
-            cluster_idx = int(cluster_idx)
-
-            clusters["c" + str(cluster_idx)].append((token, sentence_idx, token_idx))
+    for token, sentence_idx, token_idx, cluster_idx in cluster_entries(clusters_path):
+        clusters["c" + str(cluster_idx)].append((token, sentence_idx, token_idx))
     return clusters
 
 
@@ -1,15 +1,20 @@
+import argparse
 import numpy as np
-from sklearn.cluster import AgglomerativeClustering
+from sklearn.cluster import AgglomerativeClustering, ward_tree
+from scipy import sparse
 from scipy.cluster.hierarchy import linkage, fcluster  # Added fcluster import
 from collections import defaultdict
-import dill as pickle
 import time
 import os  # Added to handle directories
 from datetime import datetime
 from .logger import log_start_time, log_end_time, log_runtime, log_cluster_summary, log_environment, log_input_data_summary
+from .logger import RunTelemetry, phase, timed_iter
 from .synthetic_data import generate_synthetic_data, save_synthetic_data
 from .visualization import plot_dendrogram, plot_clusters
-from .label_mapping import map_labels
+from .dedup import deduplicate, expand_labels, save_dedup
+from .artifacts import save_artifact
+from .writer import write_clusters, read_labels
+from .cli import parse_cluster_sizes
 
 output_file = "memory-profile-agg.txt"
 
@@ -26,58 +31,311 @@ def create_linkage_matrix(points, output_path, K):
     np.save(f"{output_path}/agg_linkage_matrix_{K}.npy", linkage_matrix)
     return linkage_matrix
 
+def build_linkage(points, output_path=None, ref=''):
+    """Build the Ward linkage once; it does not depend on K and is saved as agg_linkage_matrix{ref}.npy."""
+    linkage_matrix = linkage(points, method='ward')
+    if output_path is not None:
+        os.makedirs(output_path, exist_ok=True)
+        np.save(f"{output_path}/agg_linkage_matrix{ref}.npy", linkage_matrix)
+    return linkage_matrix
+
+def exact_knn(points, n_neighbors, block_size=512):
+    """Exact k nearest neighbours (excluding the point itself), computed block by block with BLAS."""
+    points = np.asarray(points, dtype=np.float32)
+    sq_norms = np.einsum('ij,ij->i', points, points)
+    neighbors = np.empty((len(points), n_neighbors), dtype=np.int64)
+    for start in range(0, len(points), block_size):
+        block = points[start:start + block_size]
+        dist = sq_norms[start:start + block_size, None] - 2 * block @ points.T + sq_norms[None, :]
+        dist[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        nearest = np.argpartition(dist, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        order = np.take_along_axis(dist, nearest, axis=1).argsort(axis=1)
+        neighbors[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+    return neighbors
+
+def annoy_knn(points, n_neighbors, n_trees=50):
+    """Approximate k nearest neighbours (excluding the point itself) from an Annoy index."""
+    from annoy import AnnoyIndex
+
+    index = AnnoyIndex(points.shape[1], 'euclidean')
+    for i in range(len(points)):
+        index.add_item(i, points[i])
+    index.build(n_trees)
+    neighbors = np.empty((len(points), n_neighbors), dtype=np.int64)
+    for i in range(len(points)):
+        found = [j for j in index.get_nns_by_item(i, n_neighbors + 1) if j != i][:n_neighbors]
+        found += found[-1:] * (n_neighbors - len(found))
+        neighbors[i] = found
+    return neighbors
+
+def knn_connectivity(points, n_neighbors=10, method='exact', block_size=512, n_trees=50):
+    """Symmetric sparse kNN connectivity graph; method is 'exact' (blocked) or 'annoy' (approximate)."""
+    n_neighbors = min(n_neighbors, len(points) - 1)
+    if method == 'exact':
+        neighbors = exact_knn(points, n_neighbors, block_size)
+    elif method == 'annoy':
+        neighbors = annoy_knn(points, n_neighbors, n_trees)
+    else:
+        raise ValueError(f"Unknown neighbour search method: {method}")
+    rows = np.repeat(np.arange(len(points)), n_neighbors)
+    graph = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, neighbors.ravel())), shape=(len(points),) * 2)
+    return ((graph + graph.T) > 0).astype(np.int8)
+
+def children_to_linkage(children, distances, n):
+    """Convert sklearn's children_/distances_ into a scipy-style linkage matrix in merge order."""
+    counts = np.ones(2 * n - 1)
+    for i, (a, b) in enumerate(children):
+        counts[n + i] = counts[a] + counts[b]
+    return np.column_stack([children, distances, counts[n:]]).astype(np.float64)
+
+def build_sparse_linkage(points, n_neighbors=10, method='exact', output_path=None, ref='', block_size=512, n_trees=50):
+    """
+    Ward linkage constrained to a kNN connectivity graph, in O(n * n_neighbors) memory.
+    Merge distances need not be monotonic, so cut the result with cut_linkage rather than fcluster.
+    """
+    connectivity = knn_connectivity(points, n_neighbors, method, block_size, n_trees)
+    children, _, n_leaves, _, distances = ward_tree(points, connectivity=connectivity, return_distance=True)
+    linkage_matrix = children_to_linkage(children, distances, n_leaves)
+    if output_path is not None:
+        os.makedirs(output_path, exist_ok=True)
+        np.save(f"{output_path}/agg_linkage_matrix{ref}.npy", linkage_matrix)
+    return linkage_matrix
+
+def _ancestor_table(linkage_matrix):
+    """Binary lifting table: row j holds every node's 2**j-th ancestor (the root is its own parent)."""
+    n = len(linkage_matrix) + 1
+    parent = np.arange(2 * n - 1, dtype=np.int64)
+    children = linkage_matrix[:, :2].astype(np.int64)
+    parent[children[:, 0]] = np.arange(n, 2 * n - 1)
+    parent[children[:, 1]] = np.arange(n, 2 * n - 1)
+    table = [parent]
+    for _ in range(max(int(np.ceil(np.log2(n))), 1)):
+        table.append(table[-1][table[-1]])
+    return table
+
+def _cut(table, n, K):
+    """Labels of the n leaves after the first n-K merges, numbered by their cluster's node id."""
+    # Node ids grow towards the root, so a leaf's cluster is its highest ancestor below the limit
+    limit = 2 * n - K
+    nodes = np.arange(n, dtype=np.int64)
+    for ancestors in reversed(table):
+        candidate = ancestors[nodes]
+        nodes = np.where(candidate < limit, candidate, nodes)
+    return np.unique(nodes, return_inverse=True)[1]
+
+def cut_linkage(linkage_matrix, K):
+    """Cut a linkage matrix into exactly K clusters; labels are 0..K-1."""
+    return next(cut_linkage_many(linkage_matrix, [K]))[1]
+
+def cut_linkage_many(linkage_matrix, Ks):
+    """Yield (K, labels) for every K, cutting the same tree without refitting."""
+    n = len(linkage_matrix) + 1
+    table = _ancestor_table(linkage_matrix)
+    for K in Ks:
+        if not 1 <= K <= n:
+            raise ValueError(f"Cannot cut {n} points into {K} clusters")
+        yield K, _cut(table, n, K)
+
+def agglomerative_sweep(points, vocab, Ks, output_path, ref='', linkage_matrix=None):
+    """Build (or reuse) the Ward linkage once and write clusters-agg-{K}{ref}.txt for every K."""
+    if linkage_matrix is None:
+        with phase("fit"):
+            linkage_matrix = build_linkage(points, output_path, ref)
+    os.makedirs(output_path, exist_ok=True)
+    cluster_files = []
+    for K, labels in timed_iter("cut", cut_linkage_many(linkage_matrix, Ks)):
+        cluster_file = f"{output_path}/clusters-agg-{K}{ref}.txt"
+        cluster_files.append(write_clusters(vocab, labels, cluster_file))
+    return cluster_files
+
+def weighted_ward_linkage(points, weights):
+    """
+    Ward linkage of points that each stand for <weights> identical observations.
+    Uses the nearest-neighbour chain with Lance-Williams updates on a dense distance
+    matrix and returns a scipy-style linkage matrix (the last column counts points, not
+    weights, so scipy accepts it); with unit weights it matches linkage(points, method='ward').
+    """
+    points = np.asarray(points, dtype=np.float64)
+    sizes = np.asarray(weights, dtype=np.float64).copy()
+    n = len(points)
+    if n < 2:
+        return np.empty((0, 4))
 
+    # dist[i, j] holds the squared Ward distance 2 * wi * wj / (wi + wj) * ||xi - xj||^2
+    sq_norms = np.einsum('ij,ij->i', points, points)
+    dist = np.maximum(sq_norms[:, None] - 2 * points @ points.T + sq_norms[None, :], 0)
+    dist *= 2 * sizes[:, None] * sizes[None, :] / (sizes[:, None] + sizes[None, :])
+    np.fill_diagonal(dist, np.inf)
+
+    active = np.ones(n, dtype=bool)
+    merges = []
+    chain = []
+    while len(merges) < n - 1:
+        if not chain:
+            chain.append(int(np.flatnonzero(active)[0]))
+        a = chain[-1]
+        b = int(np.argmin(dist[a]))
+        if len(chain) > 1 and dist[a, chain[-2]] <= dist[a, b]:
+            b = chain[-2]
+        if len(chain) < 2 or b != chain[-2]:
+            chain.append(b)
+            continue
+
+        chain = chain[:-2]
+        merges.append((a, b, np.sqrt(dist[a, b])))
+        # Lance-Williams update, the merged cluster takes slot a
+        total = sizes + sizes[a] + sizes[b]
+        updated = ((sizes + sizes[a]) * dist[a] + (sizes + sizes[b]) * dist[b] - sizes * dist[a, b]) / total
+        updated[~active] = np.inf
+        active[b] = False
+        updated[a] = updated[b] = np.inf
+        dist[a, :] = updated
+        dist[:, a] = updated
+        dist[b, :] = np.inf
+        dist[:, b] = np.inf
+        sizes[a] += sizes[b]
+
+    # Sort the merges by distance and relabel the slots into scipy cluster ids
+    merges.sort(key=lambda m: m[2])
+    parent = np.arange(n)
+    cluster_id = np.arange(n)
+    counts = np.ones(n)
+    linkage_matrix = np.empty((n - 1, 4))
+    for i, (a, b, d) in enumerate(merges):
+        roots = []
+        for x in (a, b):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            roots.append(x)
+        ra, rb = roots
+        counts[ra] += counts[rb]
+        linkage_matrix[i] = [min(cluster_id[ra], cluster_id[rb]), max(cluster_id[ra], cluster_id[rb]), d, counts[ra]]
+        parent[rb] = ra
+        cluster_id[ra] = n + i
+    return linkage_matrix
+
+def dedup_agglomerative_sweep(points, vocab, Ks, output_path, ref='', decimals=None, threshold=0.0):
+    """
+    Collapse duplicate rows (see dedup.py), build weighted Ward on the representatives once, saved
+    as agg_linkage_matrix{ref}.npy, and write clusters-agg-{K}{ref}.txt for every K with the labels
+    expanded back to every original row.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    with phase("dedup"):
+        representatives, weights, mapping = deduplicate(points, decimals, threshold)
+        save_dedup(representatives, weights, mapping, output_path, ref)
+    print(f"Clustering {len(representatives)} unique rows of {len(points)}")
+
+    with phase("fit"):
+        linkage_matrix = weighted_ward_linkage(representatives, weights)
+        np.save(f"{output_path}/agg_linkage_matrix{ref}.npy", linkage_matrix)
+    cluster_files = []
+    for K, labels in timed_iter("cut", cut_linkage_many(linkage_matrix, Ks)):
+        cluster_file = f"{output_path}/clusters-agg-{K}{ref}.txt"
+        cluster_files.append(write_clusters(vocab, expand_labels(labels, mapping), cluster_file))
+    return cluster_files
+
+def dedup_agglomerative_cluster(points, vocab, K, output_path, ref='', decimals=None, threshold=0.0):
+    """dedup_agglomerative_sweep for a single K; returns the labels of every original row."""
+    cluster_file, = dedup_agglomerative_sweep(points, vocab, [K], output_path, ref, decimals, threshold)
+    return read_labels(cluster_file, mmap_mode=None)
 
 def agglomerative_cluster(points, vocab, K, output_path, ref=''):
-    """Perform clustering and log details."""
+    """
+    Build the Ward linkage once (saved as agg_linkage_matrix{ref}.npy), cut it into K clusters and
+    log details. Returns the labels and the linkage matrix.
+    """
     # Log start time and environment
     log_start_time(output_file)
     log_environment(output_file)
     log_input_data_summary(points, vocab, output_file)
 
-    # Perform clustering with sklearn
+    # One Ward tree gives both the merges and the labels
     start_time = time.time()
-    clustering = perform_agglomerative_clustering(points, K)
+    linkage_matrix = build_linkage(points, output_path, ref)
+    labels = cut_linkage(linkage_matrix, K)
     end_time = time.time()
     log_runtime(start_time, end_time, output_file)
 
-    # Perform clustering with scipy for comparison
-    linkage_matrix = linkage(points, method='ward')
-    scipy_labels = fcluster(linkage_matrix, t=K, criterion='maxclust')
-
-    # Map SciPy labels to match sklearn labels
-    mapped_scipy_labels = map_labels(scipy_labels, clustering.labels_)
-
     # Log cluster results summary
     clusters = defaultdict(list)
-    for i, label in enumerate(mapped_scipy_labels):
+    for i, label in enumerate(labels):
         clusters[label].append(vocab[i])
 
     log_cluster_summary(clusters, output_file)
 
     # Save the results
-    save_clustering_results(clustering, clusters, output_path, K, ref)
+    save_clustering_results(linkage_matrix, vocab, labels, output_path, K, ref)
 
     log_end_time(output_file)
 
-    return mapped_scipy_labels, clustering.labels_
+    return labels, linkage_matrix
 
-def save_clustering_results(clustering, clusters, output_path, K, ref):
-    """Save clustering results and clusters."""
+def save_clustering_results(linkage_matrix, vocab, labels, output_path, K, ref):
+    """
+    Save clustering results and clusters. The tree is kept as a versioned .npz artifact
+    (labels, merges, vocab, parameters) that loads without scikit-learn; the clusters
+    file is streamed with its labels sidecar. Returns the clusters file.
+    """
     # Ensure output directory exists
     os.makedirs(output_path, exist_ok=True)
 
-    model_file = f"{output_path}/model-{K}-agglomerative-clustering{ref}.pkl"
-    with open(model_file, "wb") as fp:
-        pickle.dump(clustering, fp)
+    model_file = f"{output_path}/model-{K}-agglomerative-clustering{ref}.npz"
+    params = {"n_clusters": K, "linkage": "ward", "n_leaves": len(linkage_matrix) + 1}
+    save_artifact(model_file, labels, vocab, linkage_matrix[:, :2], linkage_matrix[:, 2], params)
 
-    cluster_output = "\n".join([f"{word}|||{key}" for key, words in clusters.items() for word in words])
-    cluster_file = f"{output_path}/clusters-agg-{K}{ref}.txt"
-    with open(cluster_file, 'w') as f:
-        f.write(cluster_output)
+    return write_clusters(vocab, labels, f"{output_path}/clusters-agg-{K}{ref}.txt")
 
 def main():
     """Main function to execute agglomerative clustering and save results."""
+    parser = argparse.ArgumentParser(description="Ward clustering: build the linkage once and cut it for every K")
+    parser.add_argument("--vocab-file", "-v", help="vocab file with complete path")
+    parser.add_argument("--point-file", "-p", help="point file with complete path; runs the synthetic demo if omitted")
+    parser.add_argument("--output-path", "-o", default="./output", help="output path for the linkage and cluster files")
+    parser.add_argument("--cluster", "-k", default="5", help="cluster numbers comma separated (e.g. 5,10,15)")
+    parser.add_argument("--range", "-r", action="store_true", help="read --cluster as start,end,step (e.g. 5,1000,5)")
+    parser.add_argument("--linkage-file", "-l", default=None, help="reuse a saved agg_linkage_matrix.npy instead of building it")
+    parser.add_argument("--ref", default='', help="suffix of the output files")
+    parser.add_argument("--backend", choices=['dense', 'sparse'], default='dense',
+                        help="dense Ward (O(n^2) memory) or Ward constrained to a kNN connectivity graph")
+    parser.add_argument("--n-neighbors", type=int, default=10, help="neighbours per point of the sparse backend")
+    parser.add_argument("--neighbors-method", choices=['exact', 'annoy'], default='exact',
+                        help="blocked exact or approximate (Annoy) neighbour search for the sparse backend")
+    parser.add_argument("--dedup", action="store_true",
+                        help="cluster the unique rows with weighted Ward and expand the labels to every row")
+    parser.add_argument("--dedup-decimals", type=int, default=None, help="round rows to this many decimals before collapsing")
+    parser.add_argument("--dedup-threshold", type=float, default=0.0, help="also collapse rows closer than this distance")
+    parser.add_argument("--telemetry-file", default=None, help="JSON-lines run telemetry (default <output-path>/telemetry.jsonl)")
+    args = parser.parse_args()
+    if args.dedup and (args.linkage_file or args.backend == 'sparse'):
+        parser.error("--dedup builds its own weighted dense linkage; it cannot be combined with --linkage-file or --backend sparse")
+
+    if args.point_file:
+        Ks = parse_cluster_sizes(args.cluster, args.range)
+        telemetry_file = args.telemetry_file or f"{args.output_path}/telemetry.jsonl"
+        with RunTelemetry(telemetry_file, f"agglomerative-{args.backend}", vars(args)) as run:
+            with phase("load"):
+                vocab = np.load(args.vocab_file)
+                points = np.load(args.point_file, mmap_mode='r')
+                run.set_input(points, vocab)
+            start_time = time.time()
+            if args.dedup:
+                cluster_files = dedup_agglomerative_sweep(points, vocab, Ks, args.output_path, args.ref,
+                                                          args.dedup_decimals, args.dedup_threshold)
+            else:
+                if args.linkage_file:
+                    with phase("load"):
+                        linkage_matrix = np.load(args.linkage_file)
+                elif args.backend == 'sparse':
+                    with phase("fit"):
+                        linkage_matrix = build_sparse_linkage(points, args.n_neighbors, args.neighbors_method, args.output_path, args.ref)
+                else:
+                    linkage_matrix = None
+                cluster_files = agglomerative_sweep(points, vocab, Ks, args.output_path, args.ref, linkage_matrix)
+        print(f"Wrote {len(cluster_files)} cluster files in {time.time() - start_time:.2f} sec")
+        return
+
     # Generate synthetic data for testing
     points, vocab = generate_synthetic_data(num_points=100, num_dims=5, vocab_size=100)
     save_synthetic_data(points, vocab, point_file='synthetic_points.npy', vocab_file='synthetic_vocab.npy')
@@ -92,22 +350,11 @@ def main():
     vocab = np.load(vocab_file)
     points = np.load(point_file)
 
-    # Create linkage matrix and visualize dendrogram
-    linkage_matrix = create_linkage_matrix(points, output_path, cluster)
+    # Build the Ward tree once, cut it and visualize the dendrogram and the clusters
+    labels, linkage_matrix = agglomerative_cluster(points, vocab, cluster, output_path)
     plot_dendrogram(linkage_matrix, output_path)
-
-    # Perform agglomerative clustering and visualize the clusters
-    mapped_scipy_labels, sklearn_labels = agglomerative_cluster(points, vocab, cluster, output_path)
-    plot_clusters(points, mapped_scipy_labels, output_path, method="pca")
-
-    # Compare mapped SciPy labels and scikit-learn labels
-    print("Mapped SciPy Labels:", mapped_scipy_labels)
-    print("Scikit-learn Labels:", sklearn_labels)
-
-    if np.array_equal(mapped_scipy_labels, sklearn_labels):
-        print("The mapped SciPy labels match the scikit-learn labels.")
-    else:
-        print("The labels are different, check the mapping.")
+    plot_clusters(points, labels, output_path, method="pca")
+    print("Labels:", labels)
 
 # This ensures the script runs when executed directly
 if __name__ == "__main__":
@@ -0,0 +1,208 @@
+import os
+import json
+import struct
+import zipfile
+import argparse
+import numpy as np
+
+# Versioned clustering artifact: an uncompressed .npz holding
+#   format_version  int32 scalar
+#   labels          int32 (n,)      cluster id of every vocab entry
+#   children        int32 (n-1, 2)  merges of the tree, in sklearn's children_ layout (optional)
+#   distances       float64 (n-1,)  merge distances (optional)
+#   vocab_bytes     uint8           utf-8 encoded vocab keys, concatenated
+#   vocab_offsets   int64 (n+1,)    key i is vocab_bytes[vocab_offsets[i]:vocab_offsets[i + 1]]
+#   params          uint8           utf-8 encoded JSON of the run parameters
+# Members are stored uncompressed so the loader can memory-map them in place.
+FORMAT_VERSION = 1
+
+# Local file header of a zip member: fixed 30 bytes, then the file name and extra field
+_LOCAL_HEADER = 30
+
+def encode_vocab(vocab):
+    """Concatenated utf-8 bytes and offsets of the vocab keys."""
+    encoded = [str(key).encode('utf-8') for key in vocab]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(key) for key in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def save_artifact(path, labels, vocab=None, children=None, distances=None, params=None):
+    """
+    Save clustering results to a versioned .npz artifact. vocab (aligned with labels),
+    children / distances of the tree and the run parameters are optional.
+    """
+    labels = np.asarray(labels)
+    arrays = {
+        "format_version": np.array(FORMAT_VERSION, dtype=np.int32),
+        "labels": labels.astype(np.int32),
+        "params": np.frombuffer(json.dumps(params or {}, sort_keys=True).encode('utf-8'), dtype=np.uint8),
+    }
+    if vocab is not None:
+        if len(vocab) != len(labels):
+            raise ValueError(f"vocab has {len(vocab)} entries but there are {len(labels)} labels")
+        arrays["vocab_bytes"], arrays["vocab_offsets"] = encode_vocab(vocab)
+    if children is not None:
+        arrays["children"] = np.asarray(children).astype(np.int32)
+    if distances is not None:
+        arrays["distances"] = np.asarray(distances, dtype=np.float64)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # np.savez appends .npz to names without it; write through a handle to keep <path> as given
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+    return path
+
+def member_offsets(path):
+    """Map each array of an uncompressed .npz to (offset, shape, fortran_order, dtype) of its data."""
+    members = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: member {info.filename} is compressed and cannot be memory-mapped")
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + _LOCAL_HEADER + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            members[os.path.splitext(info.filename)[0]] = (f.tell(), shape, fortran_order, dtype)
+    return members
+
+class ClusteringArtifact:
+    """
+    Lazy reader of a clustering artifact. Arrays are memory-mapped on first access, so opening
+    only reads the zip directory and the array headers; nothing here needs scikit-learn.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.members = member_offsets(path)
+        self._arrays = {}
+        self.version = int(self.array("format_version"))
+        if self.version > FORMAT_VERSION:
+            raise ValueError(f"{path}: artifact format {self.version} is newer than supported ({FORMAT_VERSION})")
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def __len__(self):
+        return len(self.labels)
+
+    def array(self, name):
+        """Memory-mapped (read-only) array <name>, or None if the artifact does not have it."""
+        if name not in self.members:
+            return None
+        if name not in self._arrays:
+            offset, shape, fortran_order, dtype = self.members[name]
+            if not shape or 0 in shape:
+                # np.memmap cannot map scalars or empty arrays; these are tiny, read them directly
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    count = int(np.prod(shape))
+                    data = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+            else:
+                data = np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                                 order='F' if fortran_order else 'C')
+            self._arrays[name] = data
+        return self._arrays[name]
+
+    @property
+    def labels(self):
+        return self.array("labels")
+
+    @property
+    def children(self):
+        return self.array("children")
+
+    @property
+    def distances(self):
+        return self.array("distances")
+
+    @property
+    def params(self):
+        return json.loads(self.array("params").tobytes().decode('utf-8'))
+
+    def key(self, i):
+        """Vocab key of entry i, decoded on its own."""
+        offsets = self.array("vocab_offsets")
+        return self.array("vocab_bytes")[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+    def vocab(self):
+        """All vocab keys, decoded in one pass."""
+        if "vocab_offsets" not in self:
+            return []
+        offsets = self.array("vocab_offsets")
+        blob = self.array("vocab_bytes").tobytes()
+        return [blob[a:b].decode('utf-8') for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    def cluster_lines(self):
+        """Lines of the matching clusters-*.txt file: key|||cluster id, in vocab order."""
+        return [f"{key}|||{label}" for key, label in zip(self.vocab(), self.labels.tolist())]
+
+    def clusters(self):
+        """Map each cluster id to the indices of its vocab entries."""
+        labels = np.asarray(self.labels)
+        order = np.argsort(labels, kind='stable')
+        values, starts = np.unique(labels[order], return_index=True)
+        return dict(zip(values.tolist(), np.split(order, starts[1:])))
+
+def load_artifact(path):
+    """Open a clustering artifact for lazy reading."""
+    return ClusteringArtifact(path)
+
+def read_cluster_file(cluster_file):
+    """Vocab keys and integer cluster ids of a clusters-*.txt file."""
+    vocab, labels = [], []
+    with open(cluster_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            key, label = line.rsplit("|||", 1)
+            vocab.append(key)
+            labels.append(int(label))
+    return vocab, np.array(labels, dtype=np.int32)
+
+def convert_pickle(pickle_file, output_file, vocab=None):
+    """
+    Convert a dill-pickled AgglomerativeClustering model (the former model-*.pkl output) into
+    an artifact. Unpickling needs dill and scikit-learn; reading the result needs neither.
+    """
+    import dill as pickle
+
+    with open(pickle_file, 'rb') as fp:
+        model = pickle.load(fp)
+    params = {"n_clusters": int(model.n_clusters_) if hasattr(model, "n_clusters_") else None,
+              "linkage": getattr(model, "linkage", None), "source": os.path.basename(pickle_file)}
+    return save_artifact(output_file, model.labels_, vocab, model.children_,
+                         getattr(model, "distances_", None), params)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert clustering outputs into a versioned .npz artifact")
+    parser.add_argument("--pickle-file", help="dill-pickled AgglomerativeClustering model (model-*.pkl)")
+    parser.add_argument("--cluster-file", help="clusters-*.txt file (key|||cluster id per line)")
+    parser.add_argument("--vocab-file", help="vocab .npy aligned with the pickled model's labels")
+    parser.add_argument("--linkage-file", help="scipy linkage matrix (.npy) whose merges are stored with the labels")
+    parser.add_argument("--output-file", "-o", required=True, help="artifact file to write (.npz)")
+    args = parser.parse_args()
+
+    if bool(args.pickle_file) == bool(args.cluster_file):
+        parser.error("give exactly one of --pickle-file and --cluster-file")
+
+    if args.pickle_file:
+        vocab = np.load(args.vocab_file) if args.vocab_file else None
+        convert_pickle(args.pickle_file, args.output_file, vocab)
+    else:
+        vocab, labels = read_cluster_file(args.cluster_file)
+        children = distances = None
+        if args.linkage_file:
+            linkage_matrix = np.load(args.linkage_file)
+            children, distances = linkage_matrix[:, :2], linkage_matrix[:, 2]
+        save_artifact(args.output_file, labels, vocab, children, distances,
+                      {"n_clusters": int(len(np.unique(labels))), "source": os.path.basename(args.cluster_file)})
+    print(f"Wrote {args.output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from .synthetic_data import write_synthetic_data, generate_activations
+from .logger import RunTelemetry, environment_info, read_runs
+from .writer import read_labels
+
+SIZES = (1000, 10000, 100000, 1000000)
+NUM_DIMS = 768
+
+# Every backend takes (points, vocab, K, output_path, options) and returns the cluster file it wrote
+
+def _agglomerative(points, vocab, K, output_path, options):
+    from .agglomerative import agglomerative_sweep
+    return agglomerative_sweep(points, vocab, [K], output_path)[0]
+
+def _kmeans(points, vocab, K, output_path, options):
+    from .kmeans import kmeans_cluster
+    return kmeans_cluster(points, vocab, K, output_path)
+
+def _kmeans_streaming(points, vocab, K, output_path, options):
+    from .kmeans import streaming_kmeans_cluster
+    return streaming_kmeans_cluster(points, vocab, K, output_path, seed=options.get("seed", 0))
+
+def _leaders_exact(points, vocab, K, output_path, options):
+    from .leaders import leaders_cluster
+    return leaders_cluster(points, vocab, K, output_path, is_fast=False, seed=options.get("seed", 0))[0]
+
+def _leaders_fast(points, vocab, K, output_path, options):
+    from .leaders import leaders_cluster
+    return leaders_cluster(points, vocab, K, output_path, is_fast=True, neighbors=options.get("neighbors", "ivf"),
+                           seed=options.get("seed", 0))[0]
+
+def _two_stage(points, vocab, K, output_path, options):
+    from .two_stage import two_stage_cluster
+    # at most 2000 micro-clusters, and no more than half the points
+    n_micro = max(K, min(2000, len(points) // 2))
+    return two_stage_cluster(points, vocab, [K], output_path, n_micro=n_micro, seed=options.get("seed", 0))[0]
+
+BACKENDS = {
+    'agglomerative': _agglomerative,
+    'kmeans': _kmeans,
+    'kmeans-streaming': _kmeans_streaming,
+    'leaders-exact': _leaders_exact,
+    'leaders-fast': _leaders_fast,
+    'two-stage': _two_stage,
+}
+DEFAULT_BACKENDS = ('agglomerative', 'kmeans', 'leaders-exact', 'leaders-fast')
+
+# Dataset generators: isotropic Gaussian blobs, or activations with Zipf-distributed tokens and anisotropic concepts
+GENERATORS = {'blobs': write_synthetic_data, 'activations': generate_activations}
+
+# Settings of a run copied into its result record
+RECORD_KEYS = ("backend", "num_points", "num_dims", "num_clusters", "seed", "generator")
+
+def dataset_files(data_path, num_points, num_dims, num_clusters, seed=0, generator='activations'):
+    """Point, vocab and ground-truth label files of a synthetic dataset."""
+    base = f"{data_path}/{generator}-{num_points}x{num_dims}-{num_clusters}-{seed}"
+    return f"{base}-points.npy", f"{base}-vocab.npy", f"{base}-labels.npy"
+
+def ensure_dataset(data_path, num_points, num_dims, num_clusters, seed=0, generator='activations'):
+    """Generate the synthetic dataset unless it already exists; returns its files."""
+    files = dataset_files(data_path, num_points, num_dims, num_clusters, seed, generator)
+    if not all(os.path.exists(f) for f in files):
+        os.makedirs(data_path, exist_ok=True)
+        labels = GENERATORS[generator](files[0], files[1], num_points, num_dims, num_clusters, seed=seed)
+        np.save(files[2], labels)
+    return files
+
+def cluster_quality(points, labels, truth, silhouette_sample=5000, seed=0):
+    """Agreement with the ground truth (ARI, NMI) and the sampled silhouette of a clustering."""
+    from sklearn.metrics import adjusted_rand_score, normalized_mutual_info_score, silhouette_score
+
+    quality = {
+        "ari": float(adjusted_rand_score(truth, labels)),
+        "nmi": float(normalized_mutual_info_score(truth, labels)),
+        "found_clusters": int(len(np.unique(labels))),
+        "silhouette": None,
+    }
+    if 1 < quality["found_clusters"] < len(labels):
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(labels), size=min(silhouette_sample, len(labels)), replace=False))
+        if len(np.unique(labels[sample])) > 1:
+            quality["silhouette"] = float(silhouette_score(np.asarray(points[sample], dtype=np.float64), labels[sample]))
+    return quality
+
+def _run_one(spec, result_file):
+    """Run one backend on one dataset (in a child process) and write its timings and quality to <result_file>."""
+    sys.stdout = sys.stderr = open(os.path.join(spec["output_path"], "run.log"), 'w')
+    points = np.load(spec["point_file"], mmap_mode='r')
+    vocab = np.load(spec["vocab_file"])
+    truth = np.load(spec["labels_file"])
+
+    telemetry_file = os.path.join(spec["output_path"], "telemetry.jsonl")
+    with RunTelemetry(telemetry_file, spec["backend"], spec) as run:
+        run.set_input(points, vocab)
+        cluster_file = BACKENDS[spec["backend"]](points, vocab, spec["num_clusters"], spec["output_path"], spec)
+    record = read_runs(telemetry_file)[-1]
+
+    result = {"seconds": record["total_seconds"], "phases": record["phases"], "peak_rss_mb": record["peak_rss_mb"]["total"]}
+    result.update(cluster_quality(points, np.asarray(read_labels(cluster_file)), truth, seed=spec["seed"]))
+    with open(result_file, 'w') as f:
+        json.dump(result, f)
+
+def _kill_tree(process):
+    import psutil
+
+    try:
+        children = psutil.Process(process.pid).children(recursive=True)
+    except psutil.Error:
+        children = []
+    for child in children:
+        child.kill()
+    process.kill()
+
+def run_backend(spec, time_budget=None, memory_budget=None, poll_interval=0.2):
+    """
+    Run one backend in a fresh process, killing it (and its workers) once it exceeds <time_budget> seconds
+    or a resident set of <memory_budget> MB. Returns the result record with its status: ok, timeout,
+    memory or error.
+    """
+    import psutil
+
+    os.makedirs(spec["output_path"], exist_ok=True)
+    result_file = os.path.join(spec["output_path"], "result.json")
+    if os.path.exists(result_file):
+        os.remove(result_file)
+
+    process = multiprocessing.get_context('spawn').Process(target=_run_one, args=(spec, result_file))
+    start_time = time.time()
+    process.start()
+    status, observed_rss = None, 0.0
+    while process.is_alive():
+        try:
+            tree = psutil.Process(process.pid)
+            rss = sum(p.memory_info().rss for p in [tree] + tree.children(recursive=True)) / 2 ** 20
+        except psutil.Error:
+            rss = 0.0
+        observed_rss = max(observed_rss, rss)
+        if time_budget and time.time() - start_time > time_budget:
+            status = 'timeout'
+        elif memory_budget and rss > memory_budget:
+            status = 'memory'
+        if status:
+            _kill_tree(process)
+            break
+        process.join(poll_interval)
+    process.join()
+
+    record = {key: spec[key] for key in RECORD_KEYS}
+    record.update(wall_seconds=time.time() - start_time, observed_rss_mb=observed_rss)
+    if status is None:
+        status = 'ok' if process.exitcode == 0 and os.path.exists(result_file) else 'error'
+    record["status"] = status
+    if status == 'ok':
+        with open(result_file) as f:
+            record.update(json.load(f))
+    return record
+
+def run_benchmarks(sizes, backends, output_path, results_file=None, num_dims=NUM_DIMS, num_clusters=50, time_budget=None,
+                   memory_budget=None, seed=0, data_path=None, options=None, generator='activations'):
+    """
+    Run every backend on synthetic datasets of every size (smallest first) made by <generator> (see GENERATORS),
+    appending one JSON line per run to <results_file>. A backend that exceeds a budget is skipped for the larger sizes. Returns the records.
+    """
+    results_file = results_file or f"{output_path}/results.jsonl"
+    data_path = data_path or f"{output_path}/data"
+    os.makedirs(output_path, exist_ok=True)
+    environment = environment_info()
+
+    records, over_budget = [], set()
+    for num_points in sorted(sizes):
+        point_file, vocab_file, labels_file = ensure_dataset(data_path, num_points, num_dims, num_clusters, seed, generator)
+        for backend in backends:
+            spec = dict(options or {}, backend=backend, num_points=num_points, num_dims=num_dims,
+                        num_clusters=num_clusters, seed=seed, generator=generator, point_file=point_file,
+                        vocab_file=vocab_file, labels_file=labels_file,
+                        output_path=f"{output_path}/runs/{generator}/{backend}-{num_points}x{num_dims}-{num_clusters}")
+            if backend in over_budget:
+                record = {key: spec[key] for key in RECORD_KEYS}
+                record["status"] = 'skipped'
+            else:
+                record = run_backend(spec, time_budget, memory_budget)
+                if record["status"] in ('timeout', 'memory'):
+                    over_budget.add(backend)
+            record["environment"] = environment
+            records.append(record)
+            with open(results_file, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+            print(format_record(record))
+    return records
+
+def format_record(record):
+    line = f"{record['backend']:>16} n={record['num_points']:<8} {record['status']:>8}"
+    if record["status"] == 'ok':
+        line += (f" {record['seconds']:9.2f}s {record['peak_rss_mb']:9.1f}MB ari={record['ari']:.3f}"
+                 f" nmi={record['nmi']:.3f}")
+    return line
+
+def load_results(results_file):
+    """Latest record of every (backend, num_points, num_dims, generator) in a results file."""
+    latest = {}
+    for record in read_runs(results_file):
+        # results from before the generator choice were made on blobs
+        latest[(record["backend"], record["num_points"], record["num_dims"], record.get("generator", "blobs"))] = record
+    return latest
+
+def compare_results(results, baseline, time_tolerance=0.25, memory_tolerance=0.25, quality_tolerance=0.02, time_slack=0.5):
+    """
+    Regressions of <results> against <baseline> (both as returned by load_results): runs that no longer finish,
+    are more than <time_tolerance> slower (and at least <time_slack> seconds), use <memory_tolerance> more
+    peak memory, or lose more than <quality_tolerance> ARI or NMI.
+    """
+    regressions = []
+    for key, record in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None or base["status"] != 'ok':
+            continue
+        name = f"{key[0]} n={key[1]} d={key[2]} {key[3]}"
+        if record["status"] != 'ok':
+            regressions.append(f"{name}: {record['status']} (baseline ok)")
+            continue
+        if record["seconds"] > base["seconds"] * (1 + time_tolerance) and record["seconds"] - base["seconds"] > time_slack:
+            regressions.append(f"{name}: {record['seconds']:.2f}s vs {base['seconds']:.2f}s")
+        if record["peak_rss_mb"] > base["peak_rss_mb"] * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak RSS {record['peak_rss_mb']:.1f}MB vs {base['peak_rss_mb']:.1f}MB")
+        for metric in ("ari", "nmi"):
+            if record[metric] < base[metric] - quality_tolerance:
+                regressions.append(f"{name}: {metric} {record[metric]:.3f} vs {base[metric]:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the clustering backends on synthetic data")
+    parser.add_argument("--output-path", "-o", default="./benchmark", help="datasets, run outputs and results")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma separated numbers of points")
+    parser.add_argument("--dims", type=int, default=NUM_DIMS, help="dimensions of the synthetic points")
+    parser.add_argument("--clusters", "-k", type=int, default=50, help="ground-truth clusters, also the K asked for")
+    parser.add_argument("--backends", default=",".join(DEFAULT_BACKENDS),
+                        help=f"comma separated backends out of {', '.join(BACKENDS)}")
+    parser.add_argument("--generator", choices=sorted(GENERATORS), default='activations',
+                        help="synthetic data: Zipf-distributed tokens with anisotropic concepts, or isotropic blobs")
+    parser.add_argument("--neighbors", default='ivf', help="neighbour search of leaders-fast")
+    parser.add_argument("--time-budget", type=float, default=3600, help="seconds per run before it is killed")
+    parser.add_argument("--memory-budget", type=float, default=None, help="resident MB per run before it is killed, 80%% of RAM by default")
+    parser.add_argument("--results", default=None, help="results file (default <output-path>/results.jsonl)")
+    parser.add_argument("--data-path", default=None, help="where the datasets are generated (default <output-path>/data)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", default=None, help="baseline results file to flag regressions against")
+    parser.add_argument("--no-run", action='store_true', help="only compare the existing results with the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="allowed relative peak RSS increase")
+    parser.add_argument("--quality-tolerance", type=float, default=0.02, help="allowed ARI / NMI drop")
+    args = parser.parse_args()
+
+    results_file = args.results or f"{args.output_path}/results.jsonl"
+    if not args.no_run:
+        backends = args.backends.split(',')
+        unknown = set(backends) - set(BACKENDS)
+        if unknown:
+            parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+        memory_budget = args.memory_budget
+        if memory_budget is None:
+            import psutil
+            memory_budget = 0.8 * psutil.virtual_memory().total / 2 ** 20
+        run_benchmarks([int(n) for n in args.sizes.split(',')], backends, args.output_path, results_file, args.dims,
+                       args.clusters, args.time_budget, memory_budget, args.seed, args.data_path,
+                       {"neighbors": args.neighbors}, args.generator)
+
+    if args.compare:
+        regressions = compare_results(load_results(results_file), load_results(args.compare), args.time_tolerance,
+                                      args.memory_tolerance, args.quality_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions against {args.compare}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+def parse_cluster_sizes(cluster, is_range=False):
+    """Parse "5,10,15" into [5, 10, 15], or with is_range "start,end,step" into an inclusive range."""
+    Ks = [int(k) for k in cluster.split(',')]
+    if is_range:
+        Ks = list(range(Ks[0], Ks[1] + 1, Ks[2]))
+    return Ks
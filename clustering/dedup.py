@@ -0,0 +1,141 @@
+import os
+import argparse
+import numpy as np
+
+def collapse_exact_duplicates(points, decimals=None, block_size=65536):
+    """
+    Collapse identical rows (optionally after rounding to <decimals>) into one representative.
+    Rows are compared as raw bytes in one np.unique over a void view. Returns the representatives
+    (in order of first appearance), their multiplicity weights and the mapping from every original
+    row to its representative.
+    """
+    num_rows = len(points)
+    keyed = np.empty((num_rows, int(np.prod(points.shape[1:]))), dtype=points.dtype)
+    for start in range(0, num_rows, block_size):
+        block = np.asarray(points[start:start + block_size]).reshape(-1, keyed.shape[1])
+        block = np.round(block, decimals) if decimals is not None else block
+        keyed[start:start + len(block)] = block + 0.0  # + 0.0 turns -0.0 into 0.0 so both compare alike
+    rows = np.ascontiguousarray(keyed).view(np.dtype((np.void, keyed.dtype.itemsize * keyed.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+
+    # number the representatives in order of first appearance
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    mapping = rank[inverse.ravel()]
+    representatives = np.asarray(points[np.sort(first)]).reshape(len(first), *points.shape[1:])
+    return representatives, np.bincount(mapping, minlength=len(first)).astype(np.int64), mapping
+
+def _first_within(block, block_sq, reps, reps_sq, threshold_sq, rep_block=8192):
+    """Index of the first representative within the threshold of every block row, -1 if none."""
+    first = np.full(len(block), -1, dtype=np.int64)
+    for start in range(0, len(reps), rep_block):
+        pending = np.flatnonzero(first < 0)
+        if not len(pending):
+            break
+        chunk = reps[start:start + rep_block]
+        dist_sq = block_sq[pending, None] - 2 * block[pending] @ chunk.T + reps_sq[None, start:start + rep_block]
+        close = dist_sq <= threshold_sq
+        found = close.any(axis=1)
+        first[pending[found]] = start + close[found].argmax(axis=1)
+    return first
+
+def collapse_near_duplicates(points, weights=None, threshold=0.0, block_size=1024):
+    """
+    Collapse rows that lie within <threshold> (Euclidean) of an earlier representative.
+    Rows are visited in order and join the first representative they are close to, otherwise
+    they become a representative themselves. Returns the representatives, their summed weights
+    and the mapping from every input row to its representative.
+    """
+    if weights is None:
+        weights = np.ones(len(points), dtype=np.int64)
+    if threshold <= 0:
+        return np.asarray(points), np.asarray(weights), np.arange(len(points))
+
+    threshold_sq = threshold ** 2
+    rep_rows = []
+    reps = np.empty((min(len(points), block_size), points.shape[1]), dtype=np.float64)
+    reps_sq = np.empty(len(reps), dtype=np.float64)
+    mapping = np.empty(len(points), dtype=np.int64)
+
+    for start in range(0, len(points), block_size):
+        block = np.asarray(points[start:start + block_size], dtype=np.float64)
+        block_sq = np.einsum('ij,ij->i', block, block)
+        num_reps = len(rep_rows)
+
+        # Representatives found before this block are checked with blocked BLAS distances
+        first = _first_within(block, block_sq, reps[:num_reps], reps_sq[:num_reps], threshold_sq)
+
+        # Representatives created inside this block are resolved in order
+        inner_sq = block_sq[:, None] - 2 * block @ block.T + block_sq[None, :]
+        new_reps = np.empty(len(block), dtype=np.int64)
+        num_new = 0
+        for i in np.flatnonzero(first < 0):
+            hits = np.flatnonzero(inner_sq[i, new_reps[:num_new]] <= threshold_sq)
+            if len(hits):
+                first[i] = num_reps + hits[0]
+            else:
+                new_reps[num_new] = i
+                first[i] = num_reps + num_new
+                num_new += 1
+        new_reps = new_reps[:num_new]
+        mapping[start:start + len(block)] = first
+        rep_rows.extend((start + new_reps).tolist())
+
+        if len(rep_rows) > len(reps):
+            capacity = max(2 * len(reps), len(rep_rows))
+            reps = np.resize(reps, (capacity, reps.shape[1]))
+            reps_sq = np.resize(reps_sq, capacity)
+        reps[num_reps:len(rep_rows)] = block[new_reps]
+        reps_sq[num_reps:len(rep_rows)] = block_sq[new_reps]
+
+    rep_weights = np.bincount(mapping, weights=weights, minlength=len(rep_rows)).astype(np.asarray(weights).dtype)
+    return np.asarray(points[rep_rows]), rep_weights, mapping
+
+def deduplicate(points, decimals=None, threshold=0.0):
+    """Collapse exact then near duplicates; returns representatives, weights and mapping."""
+    representatives, weights, mapping = collapse_exact_duplicates(points, decimals)
+    representatives, weights, near_mapping = collapse_near_duplicates(representatives, weights, threshold)
+    return representatives, weights, near_mapping[mapping]
+
+def expand_labels(labels, mapping):
+    """Expand cluster labels of representatives back to every original row."""
+    return np.asarray(labels)[mapping]
+
+def expand_members(member_indices, mapping):
+    """Expand groups of representative indices to the original rows mapped to them, in row order."""
+    mapping = np.asarray(mapping)
+    rep_group = np.full(int(mapping.max()) + 1 if len(mapping) else 0, -1, dtype=np.int64)
+    for group, members in enumerate(member_indices):
+        rep_group[members] = group
+    row_group = rep_group[mapping]
+    order = np.argsort(row_group, kind='stable')
+    return np.split(order, np.cumsum(np.bincount(row_group, minlength=len(member_indices)))[:-1])
+
+def save_dedup(representatives, weights, mapping, output_path, ref=''):
+    """Save the representatives, weights and mapping files."""
+    os.makedirs(output_path, exist_ok=True)
+    np.save(f"{output_path}/dedup-point{ref}.npy", representatives)
+    np.save(f"{output_path}/dedup-weights{ref}.npy", weights)
+    np.save(f"{output_path}/dedup-mapping{ref}.npy", mapping.astype(np.int32))
+
+def load_dedup(output_path, ref=''):
+    """Load the files written by save_dedup."""
+    return (np.load(f"{output_path}/dedup-point{ref}.npy"),
+            np.load(f"{output_path}/dedup-weights{ref}.npy"),
+            np.load(f"{output_path}/dedup-mapping{ref}.npy"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Collapse duplicate activation rows before clustering")
+    parser.add_argument("--point-file", "-p", help="point file with complete path", required=True)
+    parser.add_argument("--output-path", "-o", help="output path for the dedup-*.npy files", required=True)
+    parser.add_argument("--decimals", "-d", type=int, default=None, help="round rows to this many decimals before hashing")
+    parser.add_argument("--threshold", "-t", type=float, default=0.0, help="collapse rows closer than this distance")
+    args = parser.parse_args()
+
+    points = np.load(args.point_file, mmap_mode='r')
+    representatives, weights, mapping = deduplicate(points, args.decimals, args.threshold)
+    save_dedup(representatives, weights, mapping, args.output_path)
+    print(f"Collapsed {len(points)} rows into {len(representatives)} representatives")
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,245 @@
 import numpy as np
 import time
-from memory_profiler import profile
-import argparse 
-from sklearn.cluster import KMeans
+import argparse
+from sklearn.cluster import KMeans, MiniBatchKMeans, kmeans_plusplus
+from sklearn.metrics import silhouette_score
+from .cli import parse_cluster_sizes
+from .writer import write_clusters, grouped_order
+from .logger import memory_profile, RunTelemetry, phase
 
-print("USAGE: create_kmeans_clustering.py -p <POINT_FILE> -v <VOCAB_FILE> -k <CLUSTERS> -o <OUTPUT_FOLDER>")
 
-
-@profile
+@memory_profile
 def kmeans_cluster(P, V, K, output_path, ref=''):
     """
     Uses the point.npy P, vocab.npy V files of a layer (generated using https://github.com/hsajjad/ConceptX/ library) to produce a clustering of <K> clusters at <output_path> named clusters-kmeans-{K}.txt
     """
     kmeans = KMeans(n_clusters=K, verbose=3, )
-    output = kmeans.fit(P)
-    
-    out_file =  f"{output_path}/clusters-kmeans-{K}{ref}.txt"
-
-    clusters = {i:[] for i in range(K)}
-    for v, l in zip(V, output.labels_):
-       clusters[l].append(f'{v}|||{l}')
-
-    out = ""
-    for k,v in clusters.items():
-        out += '\n'.join(v) + '\n'
-
-    with open(out_file, 'w') as f2:
-        f2.write(out)
-
-    return out
-
-
+    with phase("fit"):
+        output = kmeans.fit(P)
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--vocab-file","-v", help="output vocab file with complete path")
-parser.add_argument("--point-file","-p", help="output point file with complete path")
-parser.add_argument("--output-path","-o", help="output path clustering model and result files")
-parser.add_argument("--cluster","-k", help="cluster number")
-parser.add_argument("--count","-c", help="point count ratio", default=-1)
+    return write_kmeans_clusters(V, output.labels_, K, output_path, ref)
 
+def write_kmeans_clusters(V, labels, K, output_path, ref=''):
+    """
+    Writes the vocab V grouped by cluster label to <output_path>/clusters-kmeans-{K}{ref}.txt (with its
+    labels sidecar) and returns the path of the file
+    """
+    out_file =  f"{output_path}/clusters-kmeans-{K}{ref}.txt"
+    return write_clusters(V, labels, out_file, order=grouped_order(labels, sort_labels=True))
 
-args2 = parser.parse_args()
-vocab_file = args2.vocab_file
-point_file = args2.point_file
-output_path = args2.output_path
-K = int(args2.cluster)
-point_count_ratio = float(args2.count)
-
-P = np.load(point_file)
-V= np.load(vocab_file)
-
-useable_count = int(point_count_ratio*len(V)) if point_count_ratio != -1 else -1
-
-P= P[:useable_count, :]
-V= V[:useable_count]
-
-start_time = time.time()
-ref = '-' + str(point_count_ratio) if point_count_ratio > 0 else ''
-kmeans_cluster(P, V, K, output_path, ref)
-end_time = time.time()
+def kmeanspp_init(P, K, sample_size=100000, seed=0):
+    """
+    k-means++ initial centres computed on a seeded sample of at most <sample_size> rows of P
+    """
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(P), size=min(max(sample_size, K), len(P)), replace=False))
+    centers, _ = kmeans_plusplus(np.asarray(P[sample], dtype=np.float32), K, random_state=seed)
+    return centers
 
-print(f"Runtime: {end_time - start_time}")
+def streaming_kmeans(P, K, batch_size=4096, max_iter=10, init_sample=100000, seed=0, keep_labels=False, init=None):
+    """
+    Mini-batch k-means over P (typically a memmapped point file) read in chunks of <batch_size> float32
+    rows: k-means++ on a sample, then <max_iter> passes of partial_fit over the chunks in a seeded
+    random order. With keep_labels, the labels assigned during the last pass are returned as well
+    (no extra pass over P, but assigned against the centres of that moment). <init> replaces the
+    k-means++ centres, e.g. to warm start. Returns (model, labels).
+    """
+    rng = np.random.default_rng(seed)
+    if init is None:
+        init = kmeanspp_init(P, K, init_sample, seed)
+    model = MiniBatchKMeans(n_clusters=K, init=init, n_init=1,
+                            batch_size=batch_size, random_state=seed)
+    starts = np.arange(0, len(P), batch_size)
+    labels = np.empty(len(P), dtype=np.int32) if keep_labels else None
+    for iteration in range(max_iter):
+        for start in rng.permutation(starts):
+            model.partial_fit(np.asarray(P[start:start + batch_size], dtype=np.float32))
+            if keep_labels and iteration == max_iter - 1:
+                labels[start:start + batch_size] = model.labels_
+    return model, labels
+
+def assign_labels(P, centers, block_size=65536):
+    """
+    Exact nearest-centre labels of every row of P, computed block by block with BLAS; returns (labels, inertia)
+    """
+    centers = np.asarray(centers, dtype=np.float32)
+    center_sq = np.einsum('ij,ij->i', centers, centers)
+    labels = np.empty(len(P), dtype=np.int32)
+    inertia = 0.0
+    for start in range(0, len(P), block_size):
+        block = np.asarray(P[start:start + block_size], dtype=np.float32)
+        dist_sq = center_sq[None, :] - 2 * block @ centers.T
+        labels[start:start + len(block)] = nearest = dist_sq.argmin(axis=1)
+        inertia += float((np.take_along_axis(dist_sq, nearest[:, None], axis=1)[:, 0]
+                          + np.einsum('ij,ij->i', block, block)).astype(np.float64).sum())
+    return labels, inertia
+
+def streaming_kmeans_cluster(P, V, K, output_path, ref='', batch_size=4096, max_iter=10, init_sample=100000,
+                             assign=True, block_size=65536, seed=0):
+    """
+    Streaming counterpart of kmeans_cluster for point files that do not fit in memory; writes the same
+    clusters-kmeans-{K}{ref}.txt. With <assign>, the final labels come from an exact blocked pass over P
+    against the final centres, otherwise from the last mini-batch pass.
+    """
+    with phase("fit"):
+        model, labels = streaming_kmeans(P, K, batch_size, max_iter, init_sample, seed, keep_labels=not assign)
+    if assign:
+        with phase("assign"):
+            labels, inertia = assign_labels(P, model.cluster_centers_, block_size)
+        print(f"Inertia: {inertia}")
+    return write_kmeans_clusters(V, labels, K, output_path, ref)
+
+def warm_start_centers(centers, sample, K, seed=0):
+    """
+    Initial centres for K clusters from the centres of a previous K: to grow, the cluster with the largest
+    squared error on <sample> is split in two with 2-means on its sample points; to shrink, the two closest
+    centres are merged into their size-weighted mean
+    """
+    sample = np.asarray(sample, dtype=np.float64)
+    labels, _ = assign_labels(sample, centers)
+    dist_sq = ((sample - np.asarray(centers, dtype=np.float64)[labels]) ** 2).sum(axis=1)
+    centers = list(np.asarray(centers, dtype=np.float64))
+    sizes = list(np.bincount(labels, minlength=len(centers)).astype(np.float64))
+    errors = list(np.bincount(labels, weights=dist_sq, minlength=len(centers)))
+
+    while len(centers) < K:
+        c = int(np.argmax(errors))
+        members = np.flatnonzero(labels == c)
+        if len(members) < 2:
+            # nothing left to split: start the new centre at the worst fitted sample point
+            far = int(np.argmax(dist_sq))
+            dist_sq[far] = 0
+            centers.append(sample[far])
+            sizes.append(1.0)
+            errors.append(0.0)
+            continue
+        halves = KMeans(n_clusters=2, n_init=3, random_state=seed).fit(sample[members])
+        new = len(centers)
+        labels[members[halves.labels_ == 1]] = new
+        centers[c] = halves.cluster_centers_[0]
+        centers.append(halves.cluster_centers_[1])
+        for k, half in [(c, 0), (new, 1)]:
+            part = members[halves.labels_ == half]
+            dist_sq[part] = ((sample[part] - halves.cluster_centers_[half]) ** 2).sum(axis=1)
+            if k == c:
+                sizes[c], errors[c] = len(part), dist_sq[part].sum()
+            else:
+                sizes.append(len(part))
+                errors.append(dist_sq[part].sum())
+    while len(centers) > K:
+        stacked = np.array(centers)
+        pair_sq = ((stacked[:, None] - stacked[None]) ** 2).sum(axis=2)
+        np.fill_diagonal(pair_sq, np.inf)
+        a, b = sorted(np.unravel_index(np.argmin(pair_sq), pair_sq.shape))
+        total = sizes[a] + sizes[b]
+        centers[a] = (sizes[a] * centers[a] + sizes[b] * centers[b]) / max(total, 1)
+        sizes[a] = total
+        del centers[b], sizes[b], errors[b]
+    return np.array(centers)
+
+def elbow_k(Ks, inertias):
+    """
+    K at the elbow of the inertia curve: the point farthest below the line joining its two ends
+    """
+    if len(Ks) < 3:
+        return Ks[0]
+    x = (np.asarray(Ks, dtype=np.float64) - Ks[0]) / (Ks[-1] - Ks[0])
+    y = np.asarray(inertias, dtype=np.float64)
+    y = (y - y[-1]) / max(y[0] - y[-1], 1e-12)
+    return Ks[int(np.argmax((1 - x) - y))]
+
+def kmeans_sweep(P, V, Ks, output_path, ref='', streaming=False, batch_size=4096, max_iter=None,
+                 init_sample=100000, silhouette_sample=10000, seed=0):
+    """
+    Runs k-means for every K (in increasing order) on the points loaded once, warm-starting each K from the
+    previous centres. Writes clusters-kmeans-{K}{ref}.txt for every K and a kmeans-sweep{ref}.tsv table with
+    inertia, iterations, time, sampled silhouette and the elbow K. Returns the table rows.
+    """
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(P[np.sort(rng.choice(len(P), size=min(init_sample, len(P)), replace=False))], dtype=np.float32)
+    rows = []
+    centers = None
+    for K in sorted(Ks):
+        start_time = time.time()
+        with phase("fit"):
+            init = kmeanspp_init(sample, K, init_sample, seed) if centers is None else warm_start_centers(centers, sample, K, seed)
+            if streaming:
+                model, _ = streaming_kmeans(P, K, batch_size, max_iter or 10, init_sample, seed, init=init)
+                labels, inertia = assign_labels(P, model.cluster_centers_)
+                n_iter = max_iter or 10
+            else:
+                model = KMeans(n_clusters=K, init=init, n_init=1, max_iter=max_iter or 300, random_state=seed).fit(P)
+                labels, inertia, n_iter = model.labels_, model.inertia_, model.n_iter_
+        centers = model.cluster_centers_
+        seconds = time.time() - start_time
+
+        silhouette = float('nan')
+        if 1 < K < len(P):
+            with phase("score"):
+                silhouette = silhouette_score(P, labels, sample_size=min(silhouette_sample, len(P)), random_state=seed)
+        write_kmeans_clusters(V, labels, K, output_path, ref)
+        rows.append({"K": K, "inertia": float(inertia), "n_iter": int(n_iter), "seconds": seconds, "silhouette": float(silhouette)})
+        print(f"K={K} inertia={inertia:.2f} iterations={n_iter} silhouette={silhouette:.4f} time={seconds:.2f}s")
+
+    elbow = elbow_k([r["K"] for r in rows], [r["inertia"] for r in rows])
+    with open(f"{output_path}/kmeans-sweep{ref}.tsv", 'w') as f:
+        f.write("K\tinertia\tn_iter\tseconds\tsilhouette\telbow\n")
+        for r in rows:
+            f.write(f"{r['K']}\t{r['inertia']}\t{r['n_iter']}\t{r['seconds']:.3f}\t{r['silhouette']}\t{int(r['K'] == elbow)}\n")
+    print(f"Elbow at K={elbow}")
+    return rows
+
+def main():
+    print("USAGE: create_kmeans_clustering.py -p <POINT_FILE> -v <VOCAB_FILE> -k <CLUSTERS> -o <OUTPUT_FOLDER>")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vocab-file","-v", help="output vocab file with complete path")
+    parser.add_argument("--point-file","-p", help="output point file with complete path")
+    parser.add_argument("--output-path","-o", help="output path clustering model and result files")
+    parser.add_argument("--cluster","-k", help="cluster number, or comma separated numbers for a sweep")
+    parser.add_argument("--range","-r", action='store_true', help="sweep over --cluster given as start,end,step")
+    parser.add_argument("--count","-c", help="point count ratio", default=-1)
+    parser.add_argument("--streaming", action='store_true', help="mini-batch k-means over the memmapped point file")
+    parser.add_argument("--batch-size", type=int, default=4096, help="rows per mini-batch in streaming mode")
+    parser.add_argument("--max-iter", type=int, default=None, help="passes over the points in streaming mode (10 by default), iteration cap of a sweep")
+    parser.add_argument("--init-sample", type=int, default=100000, help="rows sampled for the k-means++ init in streaming mode")
+    parser.add_argument("--no-assign", action='store_true', help="skip the final exact label assignment pass in streaming mode")
+    parser.add_argument("--silhouette-sample", type=int, default=10000, help="points sampled for the silhouette of a sweep")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--telemetry-file", default=None, help="JSON-lines run telemetry (default <output-path>/telemetry.jsonl)")
+
+    args2 = parser.parse_args()
+    vocab_file = args2.vocab_file
+    point_file = args2.point_file
+    output_path = args2.output_path
+    Ks = parse_cluster_sizes(args2.cluster, args2.range)
+    point_count_ratio = float(args2.count)
+
+    method = 'kmeans-sweep' if len(Ks) > 1 else 'kmeans-streaming' if args2.streaming else 'kmeans'
+    with RunTelemetry(args2.telemetry_file or f"{output_path}/telemetry.jsonl", method, vars(args2)) as run:
+        with phase("load"):
+            P = np.load(point_file, mmap_mode='r' if args2.streaming else None)
+            V= np.load(vocab_file)
+
+            useable_count = int(point_count_ratio*len(V)) if point_count_ratio != -1 else None
+
+            P= P[:useable_count, :]
+            V= V[:useable_count]
+            run.set_input(P, V)
+
+        start_time = time.time()
+        ref = '-' + str(point_count_ratio) if point_count_ratio > 0 else ''
+        if len(Ks) > 1:
+            kmeans_sweep(P, V, Ks, output_path, ref, args2.streaming, args2.batch_size, args2.max_iter, args2.init_sample,
+                         args2.silhouette_sample, args2.seed)
+        elif args2.streaming:
+            streaming_kmeans_cluster(P, V, Ks[0], output_path, ref, args2.batch_size, args2.max_iter or 10, args2.init_sample,
+                                     assign=not args2.no_assign, seed=args2.seed)
+        else:
+            kmeans_cluster(P, V, Ks[0], output_path, ref)
+        end_time = time.time()
+
+    print(f"Runtime: {end_time - start_time}")
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,76 @@
 import numpy as np
+from scipy import sparse
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
 
-def map_labels(scipy_labels, sklearn_labels):
-    """Map SciPy labels to match scikit-learn labels."""
-    scipy_labels = np.array(scipy_labels).flatten()  # Flatten the labels to 1D arrays
-    sklearn_labels = np.array(sklearn_labels).flatten()  # Flatten the labels to 1D arrays
+# Above this many cells the contingency table is built as a sparse matrix
+DENSE_CELLS = 2 ** 24
 
-    max_label = int(max(scipy_labels.max(), sklearn_labels.max())) + 1  # Ensure max_label is an integer
+def contingency_table(labels_a, labels_b, dense_cells=DENSE_CELLS):
+    """
+    Count co-occurrences of two labelings with arbitrary, non-contiguous label values.
+    Returns the table (dense, or a sparse CSR matrix when it would exceed <dense_cells> cells),
+    the label values of its rows and columns, and the row index of every sample.
+    """
+    values_a, index_a = np.unique(np.asarray(labels_a).ravel(), return_inverse=True)
+    values_b, index_b = np.unique(np.asarray(labels_b).ravel(), return_inverse=True)
+    shape = (len(values_a), len(values_b))
 
-    contingency_matrix = np.zeros((max_label, max_label), dtype=int)
+    if shape[0] * shape[1] <= dense_cells:
+        keys = index_a.astype(np.int64) * shape[1] + index_b
+        table = np.bincount(keys, minlength=shape[0] * shape[1]).reshape(shape)
+    else:
+        table = sparse.csr_matrix((np.ones(len(index_a), dtype=np.int64), (index_a, index_b)), shape=shape)
+        table.sum_duplicates()
+    return table, values_a, values_b, index_a
 
-    # Populate the contingency matrix
-    for scipy_label, sklearn_label in zip(scipy_labels, sklearn_labels):
-        contingency_matrix[int(scipy_label), int(sklearn_label)] += 1
+def _match(table):
+    """Row and column indices of the assignment that maximises the matched counts."""
+    if not sparse.issparse(table):
+        return linear_sum_assignment(-table)
+    # A maximum weight matching that may leave labels unmatched, as a full matching of a padded graph:
+    # every row and column gets a dummy partner at cost D, and the dummies of a matched (row, column)
+    # pair pair up with each other at cost 1 along the transposed edges. A full matching then costs
+    # D * (rows + columns) - (sum of matched counts), so minimising it maximises the counts.
+    # All weights stay positive, as the sparse solver treats explicit zeros as missing edges.
+    table = sparse.csr_matrix(table)
+    n_rows, n_cols = table.shape
+    D = table.data.max() + 1
+    edges = table.copy()
+    edges.data = 2 * D - 1 - table.data
+    dummies = table.T.tocsr()
+    dummies.data = np.ones_like(dummies.data)
+    padded = sparse.bmat([[edges, D * sparse.identity(n_rows, dtype=edges.dtype)],
+                          [D * sparse.identity(n_cols, dtype=edges.dtype), dummies]], format='csr')
+    row_ind, col_ind = min_weight_full_bipartite_matching(padded)
+    real = (row_ind < n_rows) & (col_ind < n_cols)
+    return row_ind[real], col_ind[real]
+
+def map_labels(scipy_labels, sklearn_labels, return_score=False):
+    """
+    Map SciPy labels to match scikit-learn labels.
+    Labels left without a partner (when the first labeling has more clusters) get new label values
+    above the largest scikit-learn label. With return_score, also returns the fraction of samples
+    whose mapped label agrees.
+    """
+    table, scipy_values, sklearn_values, scipy_index = contingency_table(scipy_labels, sklearn_labels)
 
     # Apply the Hungarian algorithm to find the best label mapping
-    row_ind, col_ind = linear_sum_assignment(-contingency_matrix)
+    row_ind, col_ind = _match(table)
 
     # Create a mapping from SciPy labels to sklearn labels
-    label_mapping = {row: col for row, col in zip(row_ind, col_ind)}
+    label_mapping = np.empty(len(scipy_values), dtype=sklearn_values.dtype)
+    unmatched = np.ones(len(scipy_values), dtype=bool)
+    label_mapping[row_ind] = sklearn_values[col_ind]
+    unmatched[row_ind] = False
+    if unmatched.any():
+        label_mapping[unmatched] = sklearn_values.max() + 1 + np.arange(unmatched.sum())
 
     # Map the SciPy labels to match the scikit-learn labels
-    mapped_scipy_labels = np.array([label_mapping[int(label)] for label in scipy_labels])
+    mapped_scipy_labels = label_mapping[scipy_index]
 
+    if return_score:
+        matched = table[row_ind, col_ind]
+        score = float(np.asarray(matched).sum()) / max(len(scipy_index), 1)
+        return mapped_scipy_labels, score
     return mapped_scipy_labels
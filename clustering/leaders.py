@@ -1,129 +1,341 @@
 import numpy as np
 from sklearn.cluster import AgglomerativeClustering
-from collections import defaultdict
 import argparse
+import os
 import time
-from memory_profiler import profile
-from annoy import AnnoyIndex
-import statistics
+import tempfile
+from multiprocessing import Pool
+from .neighbors import NEIGHBOR_METHODS, ExactNeighbors, IVFFlatNeighbors, build_neighbors
+from .writer import write_clusters, grouped_order
+from .dedup import deduplicate, expand_members, save_dedup
+from .logger import memory_profile, RunTelemetry, phase
+from .tau import estimate_tau, search_tau, tau_cache_file, load_cached_tau, save_cached_tau, data_fingerprint
 
-print("USAGE: create_leaders_clustering.py -p <POINT_FILE> -v <VOCAB_FILE> -k <CLUSTERS> -o <OUTPUT_FOLDER> -t <TAU> --fast")
+# Neighbour arguments that do not change the neighbours found, left out of the tau cache key
+NON_KEY_ARGS = ('n_jobs', 'ann_file', 'save_file', 'block_size')
 
-class Clique:
+def exact_leaders(points, tau, block_size=1024, slack=1e-8):
     """
-    A clique of follower points for a leader point
+    Exact leaders pass: every point joins the first clique (in creation order) whose centroid
+    is closer than <tau>, or starts a new clique. Cliques are kept in preallocated centroid,
+    count and running-sum arrays, and each block of points is compared with all centroids in
+    one BLAS distance computation. Only cliques that changed within the block, and candidates
+    within <slack> of tau, are re-checked exactly, which keeps the first-match semantics of
+    the per-point loop. Returns the centroids, member counts and the clique of every point.
     """
-    def __init__(self, p, j):
-        """
-        Initialize a clique by adding the leader and its index
-        """
-        self.members = [p]
-        self.member_indices = [j]
-        self.centroid = p
+    num_dims = points.shape[1]
+    capacity = 1024
+    sums = np.zeros((capacity, num_dims))
+    centroids = np.zeros((capacity, num_dims))
+    counts = np.zeros(capacity, dtype=np.int64)
+    labels = np.empty(len(points), dtype=np.int64)
+    num_cliques = 0
+    tau_sq = tau ** 2
 
-    def __len__(self):
-        return len(self.members)
+    for start in range(0, len(points), block_size):
+        block = np.asarray(points[start:start + block_size], dtype=np.float64)
+        block_sq = np.einsum('ij,ij->i', block, block)
+        num_before = num_cliques
+        cent_sq = np.einsum('ij,ij->i', centroids[:num_before], centroids[:num_before])
+        dist_sq = block_sq[:, None] - 2 * block @ centroids[:num_before].T + cent_sq[None, :]
+        # cancellation in the expansion above is bounded by a small multiple of the norms
+        candidates = np.zeros((len(block), num_before + len(block)), dtype=bool)
+        candidates[:, :num_before] = dist_sq < tau_sq + slack * (block_sq[:, None] + cent_sq[None, :])
 
-    def add(self, p, j):
-        """
-        Add a new follower to the clique and update the centroid
-        """
-        self.centroid = (self.centroid * len(self.members) + p) / (1 + len(self.members))
-        self.members.append(p)
-        self.member_indices.append(j)
+        # cliques updated or created in this block are always re-checked exactly
+        recheck = np.zeros(num_before + len(block), dtype=bool)
+        for i, p in enumerate(block):
+            check = np.flatnonzero(candidates[i] | recheck)
+            found = -1
+            if len(check):
+                close = np.flatnonzero(np.linalg.norm(centroids[check] - p, axis=1) < tau)
+                if len(close):
+                    found = check[close[0]]
 
-    def dist(self, p):
-        """
-        Returns the distance of point p to the centroid of the clique
-        """
-        return np.linalg.norm(p - self.centroid)
+            if found < 0:
+                if num_cliques == capacity:
+                    capacity *= 2
+                    sums = np.resize(sums, (capacity, num_dims))
+                    centroids = np.resize(centroids, (capacity, num_dims))
+                    counts = np.resize(counts, capacity)
+                found = num_cliques
+                num_cliques += 1
+                sums[found] = 0
+                counts[found] = 0
 
-@profile
-def leaders_cluster(points, vocab, K, output_path, tau=None, ref='', is_fast=True, ann_file=None):
+            recheck[found] = True
+            sums[found] += p
+            counts[found] += 1
+            centroids[found] = sums[found] / counts[found]
+            labels[start + i] = found
+
+    return centroids[:num_cliques].copy(), counts[:num_cliques].copy(), labels
+
+def radius_leaders(points, index, tau, batch_size=1024, verbose=True):
+    """
+    Fast leaders pass: every point not yet in a clique leads a new clique of all free points within <tau> of it,
+    found with batched radius queries on the neighbour <index>. Returns the points in the order they joined
+    (grouped by clique, leader first), the size of every clique and the index of every leader.
+    """
+    num_points = points.shape[0]
+    used = np.zeros(num_points, dtype=bool)
+    join_order = []
+    counts = []
+    leaders = []
+    num_used = 0
+    next_point = 0
+    while next_point < num_points:
+        # Query the next batch of unused points; points used by an earlier clique of the batch are skipped
+        batch = []
+        while next_point < num_points and len(batch) < batch_size:
+            if not used[next_point]:
+                batch.append(next_point)
+            next_point += 1
+        if not batch:
+            break
+        for i, (neighbours, _) in zip(batch, index.radius_neighbors(batch, tau)):
+            if used[i]:
+                continue
+            members = neighbours[~used[neighbours] & (neighbours != i)]
+            used[i] = True
+            used[members] = True
+            join_order.append([i])
+            join_order.append(members)
+            counts.append(1 + len(members))
+            leaders.append(i)
+            num_used += counts[-1]
+            if verbose and len(counts) % 100 == 0:
+                print(f'Cliques {len(counts)} -- Points {num_used}/{num_points}')
+    join_order = np.concatenate(join_order).astype(np.int64) if join_order else np.empty(0, dtype=np.int64)
+    return join_order, np.array(counts, dtype=np.int64), np.array(leaders, dtype=np.int64)
+
+def clique_centroids(points, join_order, counts, chunk_size=65536):
+    """Centroids of the cliques given by <join_order> and <counts>, summed in chunks of points."""
+    labels = np.repeat(np.arange(len(counts)), counts)
+    sums = np.zeros((len(counts), points.shape[1]))
+    order = np.argsort(join_order, kind='stable')
+    for start in range(0, len(order), chunk_size):
+        rows = order[start:start + chunk_size]
+        np.add.at(sums, labels[rows], np.asarray(points[join_order[rows]], dtype=np.float64))
+    return sums / counts[:, None]
+
+def write_leaders_clusters(centroids, member_indices, vocab, K, output_path, tau, ref='', mapping=None):
+    """
+    Cluster the clique centroids into K clusters and write clusters-leaders-{K}-{tau}{ref}.txt with
+    its labels sidecar; returns the path of the file.
+    With a dedup <mapping> the members are representatives and are expanded to every original row.
+    """
+    if mapping is not None:
+        member_indices = expand_members(member_indices, mapping)
+    with phase("fit"):
+        clustering = AgglomerativeClustering(n_clusters=K, compute_distances=True).fit(centroids)
+
+    # every point takes its clique's label; lines are grouped by cluster, cliques in their join order
+    labels = np.full(len(vocab), -1, dtype=np.int32)
+    for clique, members in enumerate(member_indices):
+        labels[members] = clustering.labels_[clique]
+    order = np.concatenate([member_indices[c] for c in grouped_order(clustering.labels_)])
+
+    return write_clusters(vocab, labels, f'{output_path}/clusters-leaders-{K}-{tau}{ref}.txt', order=order)
+
+def find_tau(points, index, cache_file, is_fast=True, quantile=0.5, sample_size=1000, target_cliques=None,
+             target_ratio=None, seed=0, neighbors=None):
+    """
+    Returns the cached tau for these settings, or estimates it (a nearest neighbour distance quantile, or a search
+    for a target clique count) and caches it in <cache_file>
+    the cache is keyed on a fingerprint of the points and on <neighbors>, the neighbour method and its parameters
+    """
+    params = {"num_points": len(points), "data": data_fingerprint(points), "neighbors": neighbors,
+              "sample_size": sample_size, "seed": seed}
+    if target_cliques is None and target_ratio is None:
+        params["quantile"] = quantile
+    else:
+        params.update(target_cliques=target_cliques, target_ratio=target_ratio, fast=is_fast)
+    tau = load_cached_tau(cache_file, params)
+    if tau is not None:
+        print(f"Using cached tau {tau} from {cache_file}")
+        return tau
+
+    quantiles = None
+    if "quantile" in params:
+        tau, quantiles = estimate_tau(index if index is not None else build_neighbors('exact', points),
+                                      len(points), sample_size, seed, quantile)
+        print("Nearest neighbour distance quantiles:", quantiles)
+    else:
+        tau = search_tau(points, target_cliques, target_ratio, sample_size, seed, is_fast=is_fast)
+    save_cached_tau(cache_file, tau, params, quantiles)
+    return tau
+
+@memory_profile
+def leaders_cluster(points, vocab, K, output_path, tau=None, ref='', is_fast=True, ann_file=None,
+                    neighbors='annoy', n_trees=1000, n_jobs=-1, batch_size=1024, tau_quantile=0.5, tau_sample=1000,
+                    target_cliques=None, target_ratio=None, seed=0, mapping=None, **neighbor_args):
     """
     Uses the point.npy, vocab.npy files of a layer (generated using https://github.com/hsajjad/ConceptX/ library) to produce a clustering of <K> clusters for threshold <tau> at <output_path> named clusters-leaders-{K}-{tau}.txt
-    If the threshold tau is not provided, it's estimated
-    is_fast uses approximate nearest neighbor for efficiency and generate a '<output_path>/leaders_{ref}.ann' index file
+    If the threshold tau is not provided, it's estimated as the <tau_quantile> of nearest neighbour distances over a
+    sample of <tau_sample> points, or searched for <target_cliques> (or a cliques / points <target_ratio>); the estimate
+    is cached next to the '.ann' file and reused by reruns on the same points with the same settings
+    is_fast uses a nearest neighbour index (<neighbors>: 'annoy', 'exact' or 'ivf', see neighbors.py) queried in batches of <batch_size> points
+    the annoy index is built with <n_trees> trees on <n_jobs> threads and saved as '<output_path>/leaders_{ref}.ann'
     if the '.ann' index file has been generated, it could be passed to the function to skip regeneration
+    with a dedup <mapping> (see dedup.py) the points are the unique rows and every vocab entry takes the label of its row
+    Returns the path of the cluster file and tau
     """
-    cliques = []
-
-    if not is_fast:
-        if tau is None:
-            raise ValueError("Tau must be provided when not using fast mode.")
-        for j, p in enumerate(points):
-            if (j - 1) % 1000 == 0: print(j - 1, np.round(len(cliques) / j * 100, 2))
-            found = False
-            for c in cliques:
-                if c.dist(p) < tau:
-                    c.add(p, j)
-                    found = True
-                    break
-            if not found:
-                cliques.append(Clique(p, j))
+    index = None
+    if is_fast:
+        if neighbors == 'annoy':
+            neighbor_args.update(n_trees=n_trees, n_jobs=n_jobs, ann_file=ann_file,
+                                 save_file=None if ann_file else f'{output_path}/leaders_{ref}.ann')
+        with phase("index"):
+            index = build_neighbors(neighbors, points, **neighbor_args)
+
+    # Estimate tau if not provided
+    if tau is None:
+        with phase("tau"):
+            neighbor_params = {"method": neighbors if is_fast else 'exact',
+                               **{k: v for k, v in neighbor_args.items() if k not in NON_KEY_ARGS}}
+            tau = find_tau(points, index, tau_cache_file(ann_file or f'{output_path}/leaders_{ref}.ann'), is_fast,
+                           tau_quantile, tau_sample, target_cliques, target_ratio, seed, neighbor_params)
+
+    with phase("fit"):
+        if not is_fast:
+            centroids, counts, labels = exact_leaders(points, tau)
+            # members of each clique in the order they joined
+            member_indices = np.split(np.argsort(labels, kind='stable'), np.cumsum(counts)[:-1])
 
-    else:
-        t = AnnoyIndex(points.shape[1], 'euclidean')
-        if not ann_file:
-            for i, p in enumerate(points):
-                t.add_item(i, p)
-            t.build(1000)
-            t.save(f'{output_path}/leaders_{ref}.ann')
         else:
-            t.load(ann_file)
+            join_order, counts, _ = radius_leaders(points, index, tau, batch_size)
+            centroids = clique_centroids(points, join_order, counts)
+            member_indices = np.split(join_order, np.cumsum(counts)[:-1])
 
-        # Estimate tau if not provided
-        if tau is None:
-            m = np.random.choice(range(points.shape[0]), replace=False, size=(1000))
-            dists_tau = [t.get_nns_by_item(i, 2, include_distances=True)[1] for i in m]
-            tau = statistics.median([d[1] for d in dists_tau])
+    cluster_file = write_leaders_clusters(centroids, member_indices, vocab, K, output_path, tau, ref, mapping)
 
-        used_indices = [0] * points.shape[0]
-        for i, p in enumerate(points):
-            if used_indices[i] != 0:
+    return cluster_file, tau
+
+def coarse_shards(points, num_shards, seed=0):
+    """
+    Partition the points with a coarse k-means quantizer. Returns the quantizer centroids and
+    the point indices of every shard, in increasing order.
+    """
+    quantizer = IVFFlatNeighbors(points, n_lists=num_shards, n_probe=1, train_size=20000, seed=seed)
+    shards = np.split(quantizer.order, quantizer.offsets[1:-1])
+    return quantizer.centroids, [np.sort(shard) for shard in shards]
+
+def _shard_leaders(task):
+    """Worker: run the fast leaders pass on one shard of the read-only point memmap."""
+    point_file, indices, tau, batch_size, neighbors, neighbor_args = task
+    shard = np.asarray(np.load(point_file, mmap_mode='r')[indices], dtype=np.float64)
+    index = build_neighbors(neighbors, shard, **neighbor_args)
+    join_order, counts, leaders = radius_leaders(shard, index, tau, batch_size, verbose=False)
+    sums = clique_centroids(shard, join_order, counts) * counts[:, None]
+    return indices[join_order], counts, indices[leaders], sums
+
+def reconcile_boundary_cliques(points, shard_centroids, clique_shards, leaders, tau, batch_size=1024):
+    """
+    Merge cliques whose leaders lie within <tau> of a leader from another shard, as the sequential
+    pass would have absorbed the later one. Only leaders within tau of a shard boundary (the bisector
+    between their quantizer centroid and another one) are compared, with radius queries in batches of
+    <batch_size> leaders. Returns the clique each clique is merged into.
+    """
+    target = np.arange(len(leaders))
+    leader_points = np.asarray(points[leaders], dtype=np.float64)
+    dist_sq = (np.einsum('ij,ij->i', leader_points, leader_points)[:, None] - 2 * leader_points @ shard_centroids.T
+               + np.einsum('ij,ij->i', shard_centroids, shard_centroids)[None, :])
+    own = dist_sq[np.arange(len(leaders)), clique_shards]
+    centroid_gap = np.stack([np.linalg.norm(shard_centroids - c, axis=1) for c in shard_centroids])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        margin = (dist_sq - own[:, None]) / (2 * centroid_gap[clique_shards])
+    margin[np.arange(len(leaders)), clique_shards] = np.inf
+    boundary = np.flatnonzero((margin < tau).any(axis=1))
+    if len(boundary) < 2:
+        return target
+
+    # Visit boundary cliques in the order of their leaders, as the sequential pass would
+    boundary = boundary[np.argsort(leaders[boundary], kind='stable')]
+    index = ExactNeighbors(leader_points[boundary])
+    for start in range(0, len(boundary), batch_size):
+        batch = np.arange(start, min(start + batch_size, len(boundary)))
+        for b, (neighbours, _) in zip(batch, index.radius_neighbors(batch, tau)):
+            c = boundary[b]
+            if target[c] != c:
                 continue
-            ul = 100
-            found = False
-            while not found:
-                neighbours, dists = t.get_nns_by_item(i, ul, include_distances=True)
-                if dists[-1] < tau:
-                    ul *= 2
-                else:
-                    for j in range(len(neighbours)):
-                        if dists[j] > tau:
-                            ul = j
-                            found = True
-                            break
-
-            cliques.append(Clique(points[neighbours[0], :], neighbours[0]))
-            used_indices[neighbours[0]] = 1
-            for n in neighbours[1:ul]:
-                if used_indices[n] == 1:
-                    continue
-                cliques[-1].add(points[n, :], n)
-                used_indices[n] = 1
-            if len(cliques) % 100 == 0:
-                print(f'Cliques {len(cliques)} -- Points {sum(used_indices)}/{points.shape[0]}')
-
-    centroids = [c.centroid for c in cliques]
-
-    clustering = AgglomerativeClustering(n_clusters=K, compute_distances=True).fit(centroids)
-
-    word_clusters = defaultdict(list)
-    for i, label in enumerate(clustering.labels_):
-        word_clusters[label].extend([vocab[u] for u in cliques[i].member_indices])
-
-    out = ""
-    for key, words in word_clusters.items():
-        for word in words:
-            out += f"{word}|||{key}\n"
-
-    with open(f'{output_path}/clusters-leaders-{K}-{tau}{ref}.txt', 'w') as of:
-        of.write(out)
-
-    return out, tau
+            for n in boundary[neighbours[neighbours > b]]:
+                if target[n] == n and clique_shards[n] != clique_shards[c]:
+                    target[n] = c
+    return target
+
+def clique_quality(points, member_indices, centroids):
+    """Quality metrics of a clique partition: clique count, mean and max member distance to the centroid."""
+    dists = np.concatenate([np.linalg.norm(np.asarray(points[np.sort(m)], dtype=np.float64) - c, axis=1)
+                            for m, c in zip(member_indices, centroids)])
+    return {"num_cliques": len(centroids), "mean_radius": float(dists.mean()), "max_radius": float(dists.max())}
+
+def sharded_leaders(points, tau, num_shards=8, workers=None, batch_size=1024, point_file=None, seed=0,
+                    neighbors='exact', **neighbor_args):
+    """
+    Parallel fast leaders: shard the points with a coarse quantizer, run leaders within each shard on a
+    process pool reading a shared read-only memmap (<point_file>, or a temporary copy of <points>), then
+    reconcile cliques along shard boundaries. Every shard builds its own <neighbors> index (see neighbors.py)
+    with <neighbor_args>. Returns the clique centroids, the members of every clique and the number of
+    cliques found in every shard.
+    """
+    if neighbor_args.get('ann_file') or neighbor_args.get('save_file'):
+        raise ValueError("Sharded leaders builds one index per shard and cannot load or save an '.ann' file")
+    shard_centroids, shards = coarse_shards(points, num_shards, seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if point_file is None:
+            point_file = os.path.join(tmp_dir, "points.npy")
+            np.save(point_file, points)
+        tasks = [(point_file, shard, tau, batch_size, neighbors, neighbor_args) for shard in shards if len(shard)]
+        with Pool(workers) as pool:
+            results = pool.map(_shard_leaders, tasks)
+
+    shard_counts = [len(counts) for _, counts, _, _ in results]
+    clique_shards = np.repeat(np.arange(len(results)), shard_counts)
+    shard_centroids = shard_centroids[[i for i, shard in enumerate(shards) if len(shard)]]
+    leaders = np.concatenate([l for _, _, l, _ in results])
+    counts = np.concatenate([c for _, c, _, _ in results])
+    sums = np.concatenate([s for _, _, _, s in results])
+    members = [m for join_order, c, _, _ in results for m in np.split(join_order, np.cumsum(c)[:-1])]
+
+    target = reconcile_boundary_cliques(points, shard_centroids, clique_shards, leaders, tau, batch_size)
+    kept = np.flatnonzero(target == np.arange(len(target)))
+    merged = {c: [members[c]] for c in kept}
+    for c in np.flatnonzero(target != np.arange(len(target))):
+        merged[target[c]].append(members[c])
+    print(f"Merged {len(target) - len(kept)} cliques along shard boundaries")
+    moved = np.flatnonzero(target != np.arange(len(target)))
+    np.add.at(sums, target[moved], sums[moved])
+    np.add.at(counts, target[moved], counts[moved])
+
+    # Order the cliques by leader like the sequential pass
+    kept = kept[np.argsort(leaders[kept], kind='stable')]
+    centroids = sums[kept] / counts[kept, None]
+    member_indices = [np.concatenate(merged[c]) for c in kept]
+    return centroids, member_indices, shard_counts
+
+def sharded_leaders_cluster(points, vocab, K, output_path, tau=None, ref='', num_shards=8, workers=None,
+                            batch_size=1024, point_file=None, tau_quantile=0.5, tau_sample=1000, target_cliques=None,
+                            target_ratio=None, seed=0, neighbors='exact', mapping=None, **neighbor_args):
+    """
+    leaders_cluster with the fast pass run in parallel over <num_shards> spatial shards (see sharded_leaders);
+    writes the same clusters-leaders-{K}-{tau}{ref}.txt file
+    """
+    if tau is None:
+        with phase("tau"):
+            # the quantile estimate queries an exact index over all points, the target search a sample
+            tau = find_tau(points, None, f'{output_path}/leaders_{ref}.tau.json', True, tau_quantile, tau_sample,
+                           target_cliques, target_ratio, seed, neighbors={"method": 'exact'})
+    with phase("fit"):
+        centroids, member_indices, shard_counts = sharded_leaders(points, tau, num_shards, workers, batch_size, point_file,
+                                                                  seed, neighbors, **neighbor_args)
+    print(f"Cliques per shard: {shard_counts}, {len(centroids)} after reconciling shard boundaries")
+    cluster_file = write_leaders_clusters(centroids, member_indices, vocab, K, output_path, tau, ref, mapping)
+    return cluster_file, tau, shard_counts
 
 def main():
+    print("USAGE: create_leaders_clustering.py -p <POINT_FILE> -v <VOCAB_FILE> -k <CLUSTERS> -o <OUTPUT_FOLDER> -t <TAU> --fast")
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--vocab-file", "-v", help="input vocab file with complete path")
     parser.add_argument("--point-file", "-p", help="output point file with complete path")
@@ -133,8 +345,27 @@ def main():
     parser.add_argument("--tau", "-t", help="Leaders threshold")
     parser.add_argument("--fast", action='store_true')
     parser.add_argument("--ann", '-a', help="ann file to load")
+    parser.add_argument("--neighbors", choices=sorted(NEIGHBOR_METHODS), default='annoy', help="neighbour search of the fast mode")
+    parser.add_argument("--trees", type=int, default=1000, help="number of annoy trees")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="threads building and querying the annoy index, -1 for all cores")
+    parser.add_argument("--n-lists", type=int, default=None, help="ivf lists, sqrt(n) by default")
+    parser.add_argument("--n-probe", type=int, default=8, help="ivf lists scanned per query")
+    parser.add_argument("--batch-size", type=int, default=1024, help="points per batched neighbour query")
+    parser.add_argument("--tau-quantile", type=float, default=0.5, help="nearest neighbour distance quantile used as tau")
+    parser.add_argument("--tau-sample", type=int, default=1000, help="points sampled to estimate tau")
+    parser.add_argument("--target-cliques", type=int, default=None, help="search tau for about this many cliques")
+    parser.add_argument("--target-ratio", type=float, default=None, help="search tau for this cliques / points ratio")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the tau sample")
+    parser.add_argument("--shards", type=int, default=1, help="run the fast pass in parallel over this many spatial shards")
+    parser.add_argument("--workers", type=int, default=None, help="processes of the sharded pass, all cores by default")
+    parser.add_argument("--dedup", action="store_true", help="run leaders on the unique rows and expand the labels to every row")
+    parser.add_argument("--dedup-decimals", type=int, default=None, help="round rows to this many decimals before collapsing")
+    parser.add_argument("--dedup-threshold", type=float, default=0.0, help="also collapse rows closer than this distance")
+    parser.add_argument("--telemetry-file", default=None, help="JSON-lines run telemetry (default <output-path>/telemetry.jsonl)")
 
     args2 = parser.parse_args()
+    if args2.dedup and args2.ann:
+        parser.error("--dedup indexes the unique rows; it cannot reuse an --ann index of all rows")
     vocab_file = args2.vocab_file
     point_file = args2.point_file
     output_path = args2.output_path
@@ -144,19 +375,49 @@ def main():
     point_count_ratio = float(args2.count)
     K = int(args2.cluster)
 
-    vocab = np.load(vocab_file)
-    original_count = len(vocab)
-    useable_count = int(point_count_ratio * original_count) if point_count_ratio != -1 else -1
-    vocab = np.load(vocab_file)[:useable_count]
+    method = 'leaders-sharded' if args2.shards > 1 else f'leaders-{args2.neighbors}' if is_fast else 'leaders-exact'
+    with RunTelemetry(args2.telemetry_file or f"{output_path}/telemetry.jsonl", method, vars(args2)) as run:
+        with phase("load"):
+            vocab = np.load(vocab_file)
+            original_count = len(vocab)
+            useable_count = int(point_count_ratio * original_count) if point_count_ratio != -1 else None
+            vocab = vocab[:useable_count]
 
-    points = np.load(point_file)[:useable_count, :]
+            points = np.load(point_file, mmap_mode='r')[:useable_count, :]
+            run.set_input(points, vocab)
 
-    tau = float(args2.tau) if args2.tau is not None else None
-    ref = "-" + str(point_count_ratio) if point_count_ratio > 0 else ""
+        tau = float(args2.tau) if args2.tau is not None else None
+        ref = "-" + str(point_count_ratio) if point_count_ratio > 0 else ""
 
-    start_time = time.time()
-    output, estimated_tau = leaders_cluster(points, vocab, K, output_path, tau, ref, is_fast=is_fast, ann_file=ann_file)
-    end_time = time.time()
+        mapping = None
+        if args2.dedup:
+            with phase("dedup"):
+                points, weights, mapping = deduplicate(points, args2.dedup_decimals, args2.dedup_threshold)
+                save_dedup(points, weights, mapping, output_path, ref)
+            print(f"Clustering {len(points)} unique rows of {len(vocab)}")
+
+        start_time = time.time()
+        neighbor_args = {'n_lists': args2.n_lists, 'n_probe': args2.n_probe} if args2.neighbors == 'ivf' else {}
+        if args2.shards > 1:
+            if args2.neighbors == 'annoy':
+                # one index per shard, each built on a single thread of its worker
+                neighbor_args = {'n_trees': args2.trees, 'n_jobs': 1}
+            cluster_file, estimated_tau, _ = sharded_leaders_cluster(points, vocab, K, output_path, tau, ref, args2.shards,
+                                                                     args2.workers, args2.batch_size,
+                                                                     point_file if useable_count is None and mapping is None else None,
+                                                                     args2.tau_quantile, args2.tau_sample,
+                                                                     args2.target_cliques, args2.target_ratio, args2.seed,
+                                                                     args2.neighbors, mapping, **neighbor_args)
+        else:
+            cluster_file, estimated_tau = leaders_cluster(points, vocab, K, output_path, tau, ref, is_fast=is_fast,
+                                                          ann_file=ann_file, neighbors=args2.neighbors, n_trees=args2.trees,
+                                                          n_jobs=args2.n_jobs, batch_size=args2.batch_size,
+                                                          tau_quantile=args2.tau_quantile, tau_sample=args2.tau_sample,
+                                                          target_cliques=args2.target_cliques,
+                                                          target_ratio=args2.target_ratio, seed=args2.seed, mapping=mapping,
+                                                          **neighbor_args)
+        run.record["tau"] = estimated_tau
+        end_time = time.time()
 
     print(f"Runtime: {end_time - start_time}")
     print(f"Estimated tau: {estimated_tau}")
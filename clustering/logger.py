@@ -1,8 +1,22 @@
+import os
 import sys
+import json
+import time
 import platform
+import contextlib
 import numpy as np
+import scipy
+import sklearn
 from datetime import datetime
 
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Set to enable memory_profiler's line-by-line profiling of the functions decorated with memory_profile
+MEMORY_PROFILE_ENV = "CONCEPTX_MEMORY_PROFILE"
+
 def log_environment(output_file):
     """Log system, environment, and library details."""
     env_info = (
@@ -40,10 +54,10 @@ def log_end_time(output_file):
     with open(output_file, "a") as f:
         f.write(f"End Time: {end_time_str}\n")
 
-def log_runtime(runtime, output_file):
+def log_runtime(start_time, end_time, output_file):
     """Log runtime of the clustering process."""
     with open(output_file, "a") as f:
-        f.write(f"Clustering Runtime: {runtime:.2f} seconds\n")
+        f.write(f"Clustering Runtime: {end_time - start_time:.2f} seconds\n")
 
 def log_cluster_summary(clusters, output_file):
     """Log a summary of the clusters."""
@@ -52,3 +66,124 @@ def log_cluster_summary(clusters, output_file):
         cluster_summary += f"Cluster {cluster_id}: {len(members)} items\n"
     with open(output_file, "a") as f:
         f.write(cluster_summary)
+
+def memory_profile(func):
+    """
+    memory_profiler's line-by-line profile of func when the CONCEPTX_MEMORY_PROFILE environment
+    variable is set; otherwise func itself, so the profiler costs nothing by default.
+    """
+    if not os.environ.get(MEMORY_PROFILE_ENV):
+        return func
+    from memory_profiler import profile
+    return profile(func)
+
+def peak_rss_mb(children=False):
+    """Peak resident set size of this process (or of its finished child processes) in MB, None if unknown."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+def environment_info():
+    """System and library versions."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "sklearn": sklearn.__version__,
+        "system": f"{platform.system()} {platform.release()}",
+        "processor": platform.processor(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def input_summary(points, vocab=None):
+    """Shape, dtype and storage of the points, and the vocab size."""
+    return {
+        "shape": list(points.shape),
+        "dtype": str(points.dtype),
+        "memmap": isinstance(points, np.memmap),
+        "vocab_size": None if vocab is None else len(vocab),
+    }
+
+# The run that phase() records into
+_active_run = None
+
+class RunTelemetry:
+    """
+    Structured telemetry of one clustering run: named phase timers (load, fit, cut, write, ...) with the
+    peak RSS after each, the input summary, the parameters and the environment. Used as a context
+    manager; on exit the run is appended as one JSON line to <output_file>. Phases are timed with
+    phase(), which does nothing outside a run, and repeated phases add up.
+    """
+
+    def __init__(self, output_file, method, params=None):
+        self.output_file = output_file
+        self.record = {
+            "method": method,
+            "start_time": datetime.now().isoformat(timespec='seconds'),
+            "params": params or {},
+            "environment": environment_info(),
+            "input": None,
+            "phases": {},
+            "peak_rss_mb": {},
+        }
+        self._previous = None
+        self._start = None
+
+    def set_input(self, points, vocab=None):
+        self.record["input"] = input_summary(points, vocab)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases = self.record["phases"]
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+            self.record["peak_rss_mb"][name] = peak_rss_mb()
+
+    def __enter__(self):
+        global _active_run
+        self._previous, _active_run = _active_run, self
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_run
+        _active_run = self._previous
+        self.record["total_seconds"] = time.perf_counter() - self._start
+        self.record["peak_rss_mb"]["total"] = peak_rss_mb()
+        self.record["peak_rss_mb"]["children"] = peak_rss_mb(children=True)
+        self.record["status"] = "ok" if exc_type is None else exc_type.__name__
+        self.write()
+        return False
+
+    def write(self):
+        """Append the record as one JSON line."""
+        directory = os.path.dirname(self.output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.output_file, "a") as f:
+            f.write(json.dumps(self.record, default=str) + "\n")
+
+def phase(name):
+    """Time the enclosed block as phase <name> of the active run; a no-op when no run is active."""
+    return _active_run.phase(name) if _active_run is not None else contextlib.nullcontext()
+
+def timed_iter(name, iterable):
+    """Yield from iterable, timing the production of every item as phase <name>."""
+    iterator = iter(iterable)
+    while True:
+        with phase(name):
+            item = next(iterator, StopIteration)
+        if item is StopIteration:
+            return
+        yield item
+
+def read_runs(output_file):
+    """Records of a telemetry JSON-lines file."""
+    with open(output_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,178 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# Every index answers batched queries by point index:
+#   radius_neighbors(indices, tau) -> list of (neighbours, distances) within tau, nearest first
+#   kneighbors(indices, k)         -> (neighbours, distances) arrays of shape (len(indices), k)
+# A point is its own nearest neighbour at distance 0.
+
+def _sq_norms(x):
+    return np.einsum('ij,ij->i', x, x)
+
+def _within(dists, neighbours, tau):
+    """Sort neighbours by distance and keep those within tau."""
+    keep = dists <= tau
+    neighbours, dists = neighbours[keep], dists[keep]
+    order = np.argsort(dists, kind='stable')
+    return neighbours[order], dists[order]
+
+class ExactNeighbors:
+    """Exact search: blocked BLAS distances from a batch of queries to all points."""
+
+    def __init__(self, points, block_size=4096):
+        self.points = points
+        self.block_size = block_size
+        self.sq_norms = None
+
+    def _norms(self):
+        if self.sq_norms is None:
+            self.sq_norms = np.concatenate([_sq_norms(np.asarray(self.points[s:s + self.block_size], dtype=np.float64))
+                                            for s in range(0, len(self.points), self.block_size)])
+        return self.sq_norms
+
+    def _distances(self, indices):
+        """Yield (start, block distances) of the queries to each block of points."""
+        sq_norms = self._norms()
+        queries = np.asarray(self.points[indices], dtype=np.float64)
+        for start in range(0, len(self.points), self.block_size):
+            block = np.asarray(self.points[start:start + self.block_size], dtype=np.float64)
+            dist_sq = sq_norms[indices, None] - 2 * queries @ block.T + sq_norms[None, start:start + len(block)]
+            dists = np.sqrt(np.maximum(dist_sq, 0))
+            # a point's distance to itself is exactly 0
+            rows = np.flatnonzero((indices >= start) & (indices < start + len(block)))
+            dists[rows, indices[rows] - start] = 0
+            yield start, dists
+
+    def radius_neighbors(self, indices, tau):
+        indices = np.asarray(indices, dtype=np.int64)
+        rows, neighbours, distances = [], [], []
+        for start, dists in self._distances(indices):
+            r, c = np.nonzero(dists <= tau)
+            rows.append(r)
+            neighbours.append(start + c)
+            distances.append(dists[r, c])
+        rows, neighbours, distances = np.concatenate(rows), np.concatenate(neighbours), np.concatenate(distances)
+        order = np.lexsort((distances, rows))
+        bounds = np.searchsorted(rows[order], np.arange(len(indices) + 1))
+        return [(neighbours[order[a:b]], distances[order[a:b]]) for a, b in zip(bounds, bounds[1:])]
+
+    def kneighbors(self, indices, k):
+        indices = np.asarray(indices, dtype=np.int64)
+        best_idx = np.empty((len(indices), 0), dtype=np.int64)
+        best_dist = np.empty((len(indices), 0))
+        for start, dists in self._distances(indices):
+            cand_idx = np.concatenate([best_idx, np.broadcast_to(np.arange(start, start + dists.shape[1]), dists.shape)], axis=1)
+            cand_dist = np.concatenate([best_dist, dists], axis=1)
+            order = np.argsort(cand_dist, axis=1, kind='stable')[:, :k]
+            best_idx = np.take_along_axis(cand_idx, order, axis=1)
+            best_dist = np.take_along_axis(cand_dist, order, axis=1)
+        return best_idx, best_dist
+
+class IVFFlatNeighbors:
+    """
+    Inverted-file index: points are bucketed by their nearest of <n_lists> k-means centroids
+    and a query scans the <n_probe> buckets nearest to it. Approximate unless n_probe == n_lists.
+    """
+
+    def __init__(self, points, n_lists=None, n_probe=8, train_size=50000, iterations=10, seed=0, block_size=4096):
+        self.points = points
+        self.n_probe = n_probe
+        n_lists = n_lists or max(1, int(np.sqrt(len(points))))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(points), size=min(train_size, len(points)), replace=False))
+        train = np.asarray(points[sample], dtype=np.float64)
+        self.centroids = train[rng.choice(len(train), size=min(n_lists, len(train)), replace=False)]
+        for _ in range(iterations):
+            assign = self._nearest_lists(train, 1)[:, 0]
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, train)
+            sizes = np.bincount(assign, minlength=len(self.centroids))
+            filled = sizes > 0
+            self.centroids[filled] = sums[filled] / sizes[filled, None]
+
+        assign = np.concatenate([self._nearest_lists(np.asarray(points[s:s + block_size], dtype=np.float64), 1)[:, 0]
+                                 for s in range(0, len(points), block_size)])
+        self.order = np.argsort(assign, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(self.centroids)))])
+
+    def _nearest_lists(self, x, n):
+        dist_sq = _sq_norms(x)[:, None] - 2 * x @ self.centroids.T + _sq_norms(self.centroids)[None, :]
+        n = min(n, len(self.centroids))
+        nearest = np.argpartition(dist_sq, n - 1, axis=1)[:, :n]
+        return np.take_along_axis(nearest, np.take_along_axis(dist_sq, nearest, axis=1).argsort(axis=1), axis=1)
+
+    def _candidates(self, probe):
+        return np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in probe])
+
+    def _search(self, indices):
+        queries = np.asarray(self.points[np.asarray(indices, dtype=np.int64)], dtype=np.float64)
+        for q, query, probe in zip(indices, queries, self._nearest_lists(queries, self.n_probe)):
+            candidates = np.sort(self._candidates(probe))
+            dists = np.linalg.norm(np.asarray(self.points[candidates], dtype=np.float64) - query, axis=1)
+            dists[candidates == q] = 0
+            yield candidates, dists
+
+    def radius_neighbors(self, indices, tau):
+        return [_within(dists, candidates, tau) for candidates, dists in self._search(indices)]
+
+    def kneighbors(self, indices, k):
+        neighbours = np.full((len(indices), k), -1, dtype=np.int64)
+        distances = np.full((len(indices), k), np.inf)
+        for row, (candidates, dists) in enumerate(self._search(indices)):
+            order = np.argsort(dists, kind='stable')[:k]
+            neighbours[row, :len(order)] = candidates[order]
+            distances[row, :len(order)] = dists[order]
+        return neighbours, distances
+
+class AnnoyNeighbors:
+    """
+    Approximate search with an Annoy forest of <n_trees> trees, built on <n_jobs> threads
+    (-1 for all cores) or loaded from <ann_file>. Radius queries ask for growing numbers of
+    neighbours until one falls outside tau.
+    """
+
+    def __init__(self, points, n_trees=1000, n_jobs=-1, ann_file=None, save_file=None, initial_k=100):
+        from annoy import AnnoyIndex
+
+        self.points = points
+        self.n_jobs = n_jobs
+        self.initial_k = initial_k
+        self.index = AnnoyIndex(points.shape[1], 'euclidean')
+        if ann_file:
+            self.index.load(ann_file)
+        else:
+            for i in range(len(points)):
+                self.index.add_item(i, points[i])
+            self.index.build(n_trees, n_jobs=n_jobs)
+            if save_file:
+                self.index.save(save_file)
+
+    def _map(self, fn, indices):
+        workers = None if self.n_jobs == -1 else self.n_jobs
+        if workers == 1 or len(indices) == 1:
+            return [fn(i) for i in indices]
+        with ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(fn, indices))
+
+    def _radius(self, i, tau):
+        k = self.initial_k
+        while True:
+            neighbours, dists = self.index.get_nns_by_item(int(i), k, include_distances=True)
+            if len(neighbours) < k or dists[-1] > tau:
+                return _within(np.array(dists), np.array(neighbours, dtype=np.int64), tau)
+            k *= 2
+
+    def radius_neighbors(self, indices, tau):
+        return self._map(lambda i: self._radius(i, tau), indices)
+
+    def kneighbors(self, indices, k):
+        found = self._map(lambda i: self.index.get_nns_by_item(int(i), k, include_distances=True), indices)
+        return np.array([n for n, _ in found], dtype=np.int64), np.array([d for _, d in found])
+
+NEIGHBOR_METHODS = {'annoy': AnnoyNeighbors, 'exact': ExactNeighbors, 'ivf': IVFFlatNeighbors}
+
+def build_neighbors(method, points, **kwargs):
+    """Build the neighbour index <method> ('annoy', 'exact' or 'ivf') over points."""
+    if method not in NEIGHBOR_METHODS:
+        raise ValueError(f"Unknown neighbour search method: {method}")
+    return NEIGHBOR_METHODS[method](points, **kwargs)
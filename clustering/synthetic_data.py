@@ -14,3 +14,91 @@ def save_synthetic_data(points, vocab, point_file='synthetic_points.npy', vocab_
     """Save synthetic data to files."""
     np.save(point_file, points)
     np.save(vocab_file, vocab)
+
+def write_synthetic_data(point_file, vocab_file, num_points=100000, num_dims=768, num_clusters=50, center_scale=1.0,
+                         spread=1.0, chunk_size=16384, seed=0, dtype=np.float32):
+    """
+    Stream a mixture of <num_clusters> Gaussian blobs into memmapped .npy point and vocab files, <chunk_size>
+    rows at a time, so datasets larger than memory can be generated. Vocab entries use the word|||count|||sent|||tok
+    key format. Returns the ground-truth cluster of every point.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=center_scale, size=(num_clusters, num_dims))
+    labels = rng.integers(num_clusters, size=num_points).astype(np.int32)
+
+    points = np.lib.format.open_memmap(point_file, mode='w+', dtype=dtype, shape=(num_points, num_dims))
+    width = len(f"word_{num_points}|||1|||{num_points}|||0")
+    vocab = np.lib.format.open_memmap(vocab_file, mode='w+', dtype=f'<U{width}', shape=(num_points,))
+    for start in range(0, num_points, chunk_size):
+        stop = min(start + chunk_size, num_points)
+        points[start:stop] = centers[labels[start:stop]] + rng.normal(scale=spread, size=(stop - start, num_dims))
+        vocab[start:stop] = [f"word_{i}|||1|||{i}|||0" for i in range(start, stop)]
+    points.flush()
+    vocab.flush()
+    return labels
+
+def zipf_probabilities(vocab_size, exponent=1.1):
+    """Zipf's law: the probability of the word of frequency rank r is proportional to 1 / r ** exponent."""
+    weights = 1.0 / np.arange(1, vocab_size + 1) ** exponent
+    return weights / weights.sum()
+
+def generate_activations(point_file, vocab_file, num_points=100000, num_dims=768, num_clusters=50, vocab_size=10000,
+                         zipf_exponent=1.1, polysemy=0.1, anisotropy=5.0, rank=32, center_scale=1.0, spread=1.0,
+                         mean_sentence_length=25, chunk_size=16384, seed=0, dtype=np.float32):
+    """
+    Stream synthetic layer activations into memmapped .npy point and vocab files, <chunk_size> rows at a time.
+
+    Tokens are drawn from <vocab_size> word types with Zipf-distributed frequencies and laid out in sentences
+    of Poisson(<mean_sentence_length>) tokens. Every word type has a main concept (cluster) and, for a <polysemy>
+    fraction of its occurrences, a second one. The activation of a token is drawn from its concept's Gaussian:
+    isotropic noise of standard deviation <spread> plus <rank> random principal axes whose standard deviation
+    decays from <anisotropy> * spread to spread. Vocab entries are word|||count|||sentence|||token keys, where
+    count is the running occurrence number of the word (1, 2, 3, ... in data order), as in the real vocab files.
+
+    Returns the ground-truth concept of every token.
+    """
+    rng = np.random.default_rng(seed)
+    rank = min(rank, num_dims)
+
+    # concepts: centres and principal axes
+    centers = rng.normal(scale=center_scale, size=(num_clusters, num_dims))
+    bases = np.stack([np.linalg.qr(rng.normal(size=(num_dims, rank)))[0].T for _ in range(num_clusters)])
+    # extra standard deviation along each axis on top of the isotropic noise
+    axis_scales = spread * np.sqrt(np.maximum(np.geomspace(anisotropy, 1, rank) ** 2 - 1, 0))
+
+    # tokens: Zipf-distributed word types, each with a main and a second concept
+    words = np.searchsorted(np.cumsum(zipf_probabilities(vocab_size, zipf_exponent)), rng.random(num_points))
+    words = np.minimum(words, vocab_size - 1)
+    senses = rng.integers(num_clusters, size=(vocab_size, 2))
+    labels = senses[words, (rng.random(num_points) < polysemy).astype(np.int64)].astype(np.int32)
+    counts = np.bincount(words, minlength=vocab_size)
+    # running occurrence number of every token's word
+    order = np.argsort(words, kind='stable')
+    occurrences = np.empty(num_points, dtype=np.int64)
+    occurrences[order] = np.arange(num_points) - np.searchsorted(words[order], words[order]) + 1
+
+    # sentences of at least one token
+    lengths = rng.poisson(mean_sentence_length - 1, size=num_points // max(mean_sentence_length, 1) + 2) + 1
+    while lengths.sum() < num_points:
+        lengths = np.concatenate([lengths, rng.poisson(mean_sentence_length - 1, size=len(lengths)) + 1])
+    sentence_ids = np.repeat(np.arange(len(lengths)), lengths)[:num_points]
+    token_ids = np.arange(num_points) - np.repeat(np.cumsum(lengths) - lengths, lengths)[:num_points]
+
+    points = np.lib.format.open_memmap(point_file, mode='w+', dtype=dtype, shape=(num_points, num_dims))
+    width = len(f"word{vocab_size}|||{counts.max()}|||{sentence_ids[-1]}|||{token_ids.max()}")
+    vocab = np.lib.format.open_memmap(vocab_file, mode='w+', dtype=f'<U{width}', shape=(num_points,))
+    for start in range(0, num_points, chunk_size):
+        stop = min(start + chunk_size, num_points)
+        chunk_labels = labels[start:stop]
+        block = centers[chunk_labels] + rng.normal(scale=spread, size=(stop - start, num_dims))
+        projections = rng.normal(size=(stop - start, rank)) * axis_scales
+        for concept in np.unique(chunk_labels):
+            rows = np.flatnonzero(chunk_labels == concept)
+            block[rows] += projections[rows] @ bases[concept]
+        points[start:stop] = block
+        vocab[start:stop] = [f"word{w}|||{c}|||{s}|||{t}" for w, c, s, t in
+                             zip(words[start:stop].tolist(), occurrences[start:stop].tolist(),
+                                 sentence_ids[start:stop].tolist(), token_ids[start:stop].tolist())]
+    points.flush()
+    vocab.flush()
+    return labels
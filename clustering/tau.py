@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+def sample_indices(num_points, sample_size=1000, seed=0):
+    """Seeded sample of at most <sample_size> point indices, in increasing order."""
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(num_points, size=min(sample_size, num_points), replace=False))
+
+def nn_distances(index, indices):
+    """Distance of every sampled point to its nearest other point, in one batched query."""
+    return index.kneighbors(indices, 2)[1][:, 1]
+
+def distance_quantiles(dists, quantiles=QUANTILES):
+    """Map each quantile to its value over <dists>."""
+    return dict(zip(quantiles, np.quantile(dists, quantiles).tolist()))
+
+def estimate_tau(index, num_points, sample_size=1000, seed=0, quantile=0.5):
+    """
+    Estimate tau as the <quantile> (the median by default) of the nearest-neighbour distances
+    of a seeded sample. Returns tau and the distance quantiles of the sample.
+    """
+    if num_points < 2:
+        raise ValueError("Estimating tau needs at least two points")
+    dists = nn_distances(index, sample_indices(num_points, sample_size, seed))
+    return float(np.quantile(dists, quantile)), distance_quantiles(dists)
+
+def _radius_clique_count(dist, tau):
+    """Cliques of the fast leaders pass: every unused point takes all unused points within tau."""
+    used = np.zeros(len(dist), dtype=bool)
+    count = 0
+    for i in range(len(dist)):
+        if not used[i]:
+            used |= dist[i] <= tau
+            count += 1
+    return count
+
+def search_tau(points, target_cliques=None, target_ratio=None, sample_size=2000, seed=0, iterations=30, is_fast=True):
+    """
+    Pick tau for a desired number of cliques (or cliques / points ratio). Leaders is run on a
+    seeded sample for candidate taus, bisected on a log scale, and the sample's clique ratio is
+    extrapolated linearly to all points. is_fast selects the radius (fast) or centroid (exact)
+    leaders pass on the sample.
+    """
+    num_points = len(points)
+    if target_ratio is None:
+        if target_cliques is None:
+            raise ValueError("Either target_cliques or target_ratio must be given")
+        target_ratio = target_cliques / num_points
+    sample = np.asarray(points[sample_indices(num_points, sample_size, seed)], dtype=np.float64)
+
+    sq_norms = np.einsum('ij,ij->i', sample, sample)
+    dist = np.sqrt(np.maximum(sq_norms[:, None] - 2 * sample @ sample.T + sq_norms[None, :], 0))
+    if is_fast:
+        ratio = lambda tau: _radius_clique_count(dist, tau) / len(sample)
+    else:
+        from .leaders import exact_leaders
+        ratio = lambda tau: len(exact_leaders(sample, tau)[1]) / len(sample)
+
+    positive = dist[dist > 0]
+    if not len(positive):
+        return 0.0
+    lo, hi = np.log(positive.min() / 2), np.log(dist.max() * 2)
+    best_tau, best_error = None, np.inf
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        r = ratio(np.exp(mid))
+        if abs(r - target_ratio) < best_error:
+            best_tau, best_error = float(np.exp(mid)), abs(r - target_ratio)
+        # larger tau -> fewer cliques
+        if r > target_ratio:
+            lo = mid
+        else:
+            hi = mid
+    return best_tau
+
+def data_fingerprint(points, num_rows=256):
+    """Hash of the shape, dtype and <num_rows> evenly spaced rows of <points>, telling datasets apart without reading them all."""
+    rows = np.unique(np.linspace(0, len(points) - 1, num=min(num_rows, len(points))).astype(np.int64))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((tuple(points.shape), str(points.dtype))).encode())
+    digest.update(np.ascontiguousarray(points[rows]).tobytes())
+    return digest.hexdigest()
+
+def tau_cache_file(ann_file):
+    """Cache file kept next to the .ann index file."""
+    return os.path.splitext(ann_file)[0] + ".tau.json"
+
+def load_cached_tau(cache_file, params):
+    """Return the cached tau if it was estimated with the same parameters, else None."""
+    if not os.path.exists(cache_file):
+        return None
+    with open(cache_file) as f:
+        cached = json.load(f)
+    return cached["tau"] if cached.get("params") == params else None
+
+def save_cached_tau(cache_file, tau, params, quantiles=None):
+    """Save tau with the parameters (and sample quantiles) it was estimated with."""
+    with open(cache_file, 'w') as f:
+        json.dump({"tau": tau, "params": params, "quantiles": quantiles}, f, indent=2)
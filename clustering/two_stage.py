@@ -0,0 +1,114 @@
+import os
+import time
+import argparse
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans, Birch
+from .agglomerative import weighted_ward_linkage, cut_linkage_many
+from .cli import parse_cluster_sizes
+from .writer import write_clusters
+from .logger import RunTelemetry, phase, timed_iter
+
+def iter_chunks(points, chunk_size):
+    """Yield (start, chunk) pairs of at most <chunk_size> rows, read one at a time from a memmap."""
+    for start in range(0, len(points), chunk_size):
+        yield start, np.asarray(points[start:start + chunk_size], dtype=np.float64)
+
+def fit_micro_clusterer(points, n_micro=2000, method='kmeans', chunk_size=10000, passes=1, threshold=0.5, seed=0):
+    """
+    Stage one: fit a streaming micro-clusterer with partial_fit over chunks of <points>.
+    method is 'kmeans' (MiniBatchKMeans with <n_micro> centres) or 'birch' (CF tree whose
+    subclusters have radius below <threshold>).
+    """
+    if method == 'kmeans':
+        # The first chunk initialises all centres, so it must hold at least n_micro rows
+        chunk_size = max(chunk_size, n_micro)
+        model = MiniBatchKMeans(n_clusters=n_micro, batch_size=chunk_size, random_state=seed, n_init=3)
+    elif method == 'birch':
+        model = Birch(threshold=threshold, n_clusters=None)
+        passes = 1
+    else:
+        raise ValueError(f"Unknown micro-clustering method: {method}")
+
+    for _ in range(passes):
+        for _, chunk in iter_chunks(points, chunk_size):
+            model.partial_fit(chunk)
+    return model
+
+def assign_micro_clusters(model, points, chunk_size=10000):
+    """
+    Assign every point to its micro-cluster chunk by chunk. Empty micro-clusters are dropped;
+    returns the exact centroids, their weights (point counts) and the int32 label of every point.
+    """
+    labels = np.empty(len(points), dtype=np.int32)
+    num_micro = len(model.cluster_centers_) if hasattr(model, 'cluster_centers_') else len(model.subcluster_centers_)
+    sums = np.zeros((num_micro, points.shape[1]))
+    for start, chunk in iter_chunks(points, chunk_size):
+        chunk_labels = model.predict(chunk)
+        labels[start:start + len(chunk)] = chunk_labels
+        one_hot = sparse.csr_matrix((np.ones(len(chunk)), (chunk_labels, np.arange(len(chunk)))), shape=(num_micro, len(chunk)))
+        sums += one_hot @ chunk
+
+    weights = np.bincount(labels, minlength=num_micro)
+    used = np.flatnonzero(weights)
+    remap = np.full(num_micro, -1, dtype=np.int32)
+    remap[used] = np.arange(len(used))
+    return sums[used] / weights[used, None], weights[used], remap[labels]
+
+def two_stage_cluster(points, vocab, Ks, output_path, ref='', n_micro=2000, method='kmeans', chunk_size=10000,
+                      passes=1, threshold=0.5, seed=0):
+    """
+    Cluster points out of core: micro-cluster them in chunks, run weighted Ward on the
+    micro-cluster centroids, and write clusters-twostage-{K}{ref}.txt for every K with a
+    label for every original token. Returns the list of written cluster files.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    start_time = time.time()
+    with phase("fit"):
+        model = fit_micro_clusterer(points, n_micro, method, chunk_size, passes, threshold, seed)
+    with phase("assign"):
+        centroids, weights, micro_labels = assign_micro_clusters(model, points, chunk_size)
+    print(f"Stage one: {len(points)} points into {len(centroids)} micro-clusters in {time.time() - start_time:.2f} sec")
+
+    start_time = time.time()
+    with phase("fit"):
+        linkage_matrix = weighted_ward_linkage(centroids, weights)
+    np.save(f"{output_path}/twostage_linkage_matrix{ref}.npy", linkage_matrix)
+    np.save(f"{output_path}/twostage-micro-labels{ref}.npy", micro_labels)
+    print(f"Stage two: weighted Ward on {len(centroids)} centroids in {time.time() - start_time:.2f} sec")
+
+    cluster_files = []
+    for K, labels in timed_iter("cut", cut_linkage_many(linkage_matrix, Ks)):
+        cluster_file = f"{output_path}/clusters-twostage-{K}{ref}.txt"
+        cluster_files.append(write_clusters(vocab, labels[micro_labels], cluster_file))
+    return cluster_files
+
+def main():
+    parser = argparse.ArgumentParser(description="Two-stage clustering: streaming micro-clusters, then weighted Ward")
+    parser.add_argument("--vocab-file", "-v", help="vocab file with complete path", required=True)
+    parser.add_argument("--point-file", "-p", help="point file with complete path", required=True)
+    parser.add_argument("--output-path", "-o", help="output path for the cluster files", required=True)
+    parser.add_argument("--cluster", "-k", help="cluster numbers comma separated (e.g. 5,10,15)", required=True)
+    parser.add_argument("--range", "-r", action="store_true", help="read --cluster as start,end,step")
+    parser.add_argument("--method", choices=['kmeans', 'birch'], default='kmeans', help="stage one micro-clusterer")
+    parser.add_argument("--micro-clusters", "-m", type=int, default=2000, help="number of mini-batch k-means micro-clusters")
+    parser.add_argument("--threshold", type=float, default=0.5, help="BIRCH subcluster radius")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows read from the point file at a time")
+    parser.add_argument("--passes", type=int, default=1, help="mini-batch k-means passes over the points")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ref", default='', help="suffix of the output files")
+    parser.add_argument("--telemetry-file", default=None, help="JSON-lines run telemetry (default <output-path>/telemetry.jsonl)")
+    args = parser.parse_args()
+
+    Ks = parse_cluster_sizes(args.cluster, args.range)
+    with RunTelemetry(args.telemetry_file or f"{args.output_path}/telemetry.jsonl", f"twostage-{args.method}", vars(args)) as run:
+        with phase("load"):
+            vocab = np.load(args.vocab_file)
+            points = np.load(args.point_file, mmap_mode='r')
+            run.set_input(points, vocab)
+        cluster_files = two_stage_cluster(points, vocab, Ks, args.output_path, args.ref, args.micro_clusters, args.method,
+                                          args.chunk_size, args.passes, args.threshold, args.seed)
+    print(f"Wrote {len(cluster_files)} cluster files")
+
+if __name__ == "__main__":
+    main()
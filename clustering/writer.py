@@ -0,0 +1,48 @@
+import os
+import numpy as np
+from .logger import phase
+
+# Lines formatted and written per chunk
+CHUNK_LINES = 65536
+
+def labels_file_for(cluster_file):
+    """The int32 labels sidecar written next to a clusters-*.txt file: clusters-*.labels.npy"""
+    return os.path.splitext(cluster_file)[0] + ".labels.npy"
+
+def grouped_order(labels, sort_labels=False):
+    """
+    Row indices grouped by label, rows in vocab order within a group. Groups come in order of first
+    appearance, or of label value with <sort_labels>.
+    """
+    labels = np.asarray(labels)
+    if sort_labels:
+        return np.argsort(labels, kind='stable')
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return np.argsort(rank[inverse.ravel()], kind='stable')
+
+def write_clusters(vocab, labels, cluster_file, order=None, chunk_lines=CHUNK_LINES):
+    """
+    Write word|||cluster lines for every vocab entry to <cluster_file> in buffered chunks, grouped by
+    cluster (or in the given row <order>), and the labels, aligned to the vocab, as an int32 .npy sidecar.
+    Returns the path of the cluster file.
+    """
+    labels = np.asarray(labels)
+    if len(vocab) != len(labels):
+        raise ValueError(f"vocab has {len(vocab)} entries but there are {len(labels)} labels")
+    vocab = np.asarray(vocab)
+    if order is None:
+        order = grouped_order(labels)
+
+    with phase("write"):
+        with open(cluster_file, 'w', encoding='utf-8') as f:
+            for start in range(0, len(order), chunk_lines):
+                rows = order[start:start + chunk_lines]
+                f.write("".join([f"{word}|||{label}\n" for word, label in zip(vocab[rows].tolist(), labels[rows].tolist())]))
+        np.save(labels_file_for(cluster_file), labels.astype(np.int32))
+    return cluster_file
+
+def read_labels(cluster_file, mmap_mode='r'):
+    """Labels of the vocab entries of <cluster_file>, from its sidecar and without parsing text."""
+    return np.load(labels_file_for(cluster_file), mmap_mode=mmap_mode)
@@ -0,0 +1,96 @@
+import itertools
+from multiprocessing import Pool
+
+import javalang
+
+# dictionary to convert javalang output type to the format of training 
+dictionary = {"::": "DOUBLECOLON","--":"DOUBLEMINUS","++":"DOUBLEPLUS","false":"BOOL","true":"BOOL","Modifier":"MODIFIER", "BasicType":"TYPE", "null":"IDENT","Keyword": "KEYWORD", "Identifier": "IDENT","DecimalInteger":"NUMBER","DecimalFloatingPoint":"NUMBER",
+              "String":"STRING", "(": "LPAR", ")": "RPAR","[":"LSQB", "]":"RSQB",",":"COMMA", "?":"CONDITIONOP",
+                  ";":"SEMI","+":"PLUS","-":"MINUS","*":"STAR","/":"SLASH", ".": "DOT",  "=": "EQUAL",":": "COLON", 
+                  "|":"VBAR","&":"AMPER", "<":"LESS",">":"GREATER","%":"PERCENT","{":"LBRACE","}":"RBRACE",
+                   "==":"EQEQUAL","!=":"NOTEQUAL","<=":"LESSEQUAL",">=":"GREATEREQUAL", "~":"TILDE","^":"CIRCUMFLEX",
+                   "<<":"LEFTSHIFT",">>":"RIGHTSHIFT", "**":"DOUBLESTAR","+=":"PLUSEUQAL","-=":"MINEQUAL","*=":"STAREQUAL",
+                   "/=":"SLASHEQUAL","%=":"PERCENTEQUAL","&=":"AMPEREQUAL","|=":"VBAREQUAL","^=":"CIRCUMFLEXEQUAL",
+                   "<<=":"LEFTSHIFTEQUAL",">>=":"RIGHTSHIFTEQUAL","**=":"DOUBLESTAREQUAL","//":"DOUBLESLASH","//=":"DOUBLESLASHEQUAL",
+                   "@":"AT","@=":"ATEQUAL","->":"RARROW","...":"ELLIPSIS",":=":"COLONEQUAL","&&":"AND","!":"NOT","||":"OR"}
+
+# token types labelled by their class, every other token is labelled by its value
+TYPE_CLASSES = ["Modifier", "Keyword", "BasicType", "Identifier", "DecimalInteger", "DecimalFloatingPoint", "String"]
+
+# precomputed javalang token class -> label table
+CLASS_LABELS = {getattr(javalang.tokenizer, name): dictionary[name] for name in TYPE_CLASSES}
+
+
+def label_token(token):
+    """Label of a javalang token: by class for the type classes, else by value, else UNKNOWN."""
+    label = CLASS_LABELS.get(type(token))
+    if label is None:
+        label = dictionary.get(token.value, "UNKNOWN")
+    return label
+
+
+def tokenize_line(line):
+    """Tokenize one line of code and return its token values and labels."""
+    tokens = list(javalang.tokenizer.tokenize(line))
+    return [token.value for token in tokens], [label_token(token) for token in tokens]
+
+
+def tokenize_lines(lines):
+    """Tokenize a chunk of lines, leading whitespace removed as in read_file."""
+    return [tokenize_line(line.lstrip()) for line in lines]
+
+
+def read_chunks(file_name, chunk_size):
+    """Yield lists of at most <chunk_size> lines of <file_name>."""
+    with open(file_name, 'r') as file:
+        while True:
+            chunk = list(itertools.islice(file, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+class TokenLabelWriter:
+    """Writes tokens and labels line by line, skipping lines without tokens."""
+
+    def __init__(self, code_file, label_file):
+        self.code_fp = open(code_file, "w")
+        self.label_fp = open(label_file, "w")
+        self.num_lines = 0
+
+    def write(self, values, labels):
+        if not values:
+            return
+        self.code_fp.write("".join(value + " " for value in values) + "\n")
+        self.label_fp.write("".join(label + " " for label in labels) + "\n")
+        self.num_lines += 1
+
+    def close(self):
+        self.code_fp.close()
+        self.label_fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def tokenize_file(input_file, code_file, label_file, workers=None, chunk_size=1000):
+    """
+    Tokenize every line of <input_file> and write tokens to <code_file> and labels to
+    <label_file>. Chunks of lines are tokenized on a pool of <workers> processes and
+    written as they come back, in input order. Returns the number of lines written.
+    """
+    chunks = read_chunks(input_file, chunk_size)
+    with TokenLabelWriter(code_file, label_file) as writer:
+        if workers == 1:
+            for result in map(tokenize_lines, chunks):
+                for values, labels in result:
+                    writer.write(values, labels)
+            return writer.num_lines
+        with Pool(workers) as pool:
+            for result in pool.imap(tokenize_lines, chunks):
+                for values, labels in result:
+                    writer.write(values, labels)
+    return writer.num_lines
@@ -1,127 +1,18 @@
-import javalang
-import json
-
-# read a file and return the array
-def read_file(file_name):
-    line_character_arr = []
-    with open(file_name, 'r') as file:
-        for line in file:
-            # line.strip()
-            # if not line.strip(): 
-            #     continue
-            line_character_arr.append(line.lstrip())
-        return line_character_arr
-
-
-# # extract code from the json file
-# file_name = "CodeSyntax_java.json"
-# result = []
-
-# f = open(file_name,"r")
-# data = json.load(f)
-
-# for i in range(len(data)):
-#     result.append(data[i]['code'])
-
-# f.close()
-
-# # write java code from json file to a .txt file
-# f = open("code_result.txt", "w")
-# for j in result:
-#     f.write(j)
-# f.close()
-
-
-# tk = read_file("code_result.txt")
-
-# r1 = []
-# # remove empty lines from code_result.txt
-# for i in tk:
-#     if i != '\n':
-#         r1.append(i)
-
-# # store the codes without empty lines into java_code.txt
-# f = open("java_code.txt", "w")
-# for j in r1:
-#     f.write(j)
-# f.close()
-
-token = read_file("java_code.txt")
-code_result = []
-
-# use javalang to convert java code to token label
-for i in range(len(token)):
-    tokens = list(javalang.tokenizer.tokenize(token[i]))
-    # print(tokens)
-    temp_result = []
-
-    for j in range(len(tokens)):
-        x = str(type(tokens[j]))
-        y = x.split('.')
-        y = y[-1]
-        z = y.split('\'')
-        # print([tokens[j].value,z[0]])
-        temp_result.append(tuple([tokens[j].value,z[0]]))
-    
-    code_result.append(temp_result)
-
-# dictionary to convert javalang output type to the format of training 
-dictionary = {"::": "DOUBLECOLON","--":"DOUBLEMINUS","++":"DOUBLEPLUS","false":"BOOL","true":"BOOL","Modifier":"MODIFIER", "BasicType":"TYPE", "null":"IDENT","Keyword": "KEYWORD", "Identifier": "IDENT","DecimalInteger":"NUMBER","DecimalFloatingPoint":"NUMBER",
-              "String":"STRING", "(": "LPAR", ")": "RPAR","[":"LSQB", "]":"RSQB",",":"COMMA", "?":"CONDITIONOP",
-                  ";":"SEMI","+":"PLUS","-":"MINUS","*":"STAR","/":"SLASH", ".": "DOT",  "=": "EQUAL",":": "COLON", 
-                  "|":"VBAR","&":"AMPER", "<":"LESS",">":"GREATER","%":"PERCENT","{":"LBRACE","}":"RBRACE",
-                   "==":"EQEQUAL","!=":"NOTEQUAL","<=":"LESSEQUAL",">=":"GREATEREQUAL", "~":"TILDE","^":"CIRCUMFLEX",
-                   "<<":"LEFTSHIFT",">>":"RIGHTSHIFT", "**":"DOUBLESTAR","+=":"PLUSEUQAL","-=":"MINEQUAL","*=":"STAREQUAL",
-                   "/=":"SLASHEQUAL","%=":"PERCENTEQUAL","&=":"AMPEREQUAL","|=":"VBAREQUAL","^=":"CIRCUMFLEXEQUAL",
-                   "<<=":"LEFTSHIFTEQUAL",">>=":"RIGHTSHIFTEQUAL","**=":"DOUBLESTAREQUAL","//":"DOUBLESLASH","//=":"DOUBLESLASHEQUAL",
-                   "@":"AT","@=":"ATEQUAL","->":"RARROW","...":"ELLIPSIS",":=":"COLONEQUAL","&&":"AND","!":"NOT","||":"OR"}
-
-
-final_result = []
-
-# create empty array for final result
-for i in code_result:
-    temp_result = []
-    
-    for j in range(len(i)):
-        temp_result.append([])
-    
-    final_result.append(temp_result)
-
-# function convert takes an input of tuples (token, type) and modify to format for training
-def convert(info):
-    result = ""
-    if info[1] == "Modifier" or info[1] == "Keyword" or info[1] == "BasicType" or info[1] == "Identifier" or info[1] == "DecimalInteger" or info[1] == "DecimalFloatingPoint" or info[1] == "String":
-        result = dictionary[info[1]]
-        return result
-    else:
-        if info[0] in dictionary:
-            result = dictionary[info[0]]
-            return result
-        else:
-            return "UNKNOWN"
-
-# store the modified type into the final result
-for i in range(len(code_result)): 
-    for j in range(len(code_result[i])):
-        res = ""
-        res = convert(code_result[i][j])
-        final_result[i][j] = res
-
-# write the result into a final_result.txt
-f = open("code.txt", "w")
-for arr in code_result:
-    if arr != []:
-        for i in arr:
-            f.write(i[0] + " ")
-        f.write("\n")
-f.close()
-
-# write the result into a final_result.txt
-f = open("label.txt", "w")
-for arr in final_result:
-    if arr != []:
-        for i in arr:
-            f.write(i + " ")
-        f.write("\n")
-f.close()
+import argparse
+
+from java_tokenizer import tokenize_file
+
+# Tokenizes java_code.txt (one line of Java code per line) with javalang and
+# writes the tokens to code.txt and their training labels to label.txt; the
+# tokenization and the label mapping live in java_tokenizer.py
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-file", default="java_code.txt", help="Java code, one line per line")
+    parser.add_argument("--code-file", default="code.txt", help="output file with the tokens of every line")
+    parser.add_argument("--label-file", default="label.txt", help="output file with the labels of every token")
+    parser.add_argument("--workers", type=int, default=None, help="tokenizer processes, all cores by default")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="lines handed to a process at a time")
+    args = parser.parse_args()
+
+    num_lines = tokenize_file(args.input_file, args.code_file, args.label_file, args.workers, args.chunk_size)
+    print(f"Wrote {num_lines} lines to {args.code_file} and {args.label_file}")
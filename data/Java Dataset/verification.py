@@ -1,57 +1,16 @@
+import argparse
+import hashlib
+import itertools
 import os
+import sqlite3
 
-f = open('code.txt','r')
-code = f.readlines()
-f.close()
-f = open('label.txt','r')
-label = f.readlines()
-f.close()
-
-assert len(code) == len(label)
-
-# drop observations that the length of code does not
-# equal to the length of labels
-dropped_idx = 0
-f = open('codetest2.in','w')
-g = open('codetest2.label','w')
-
-for this_code, this_label in zip(code,label):
-    if len(this_code.split(" ")) != len(this_label.split(" ")):
-        dropped_idx+=1
-        continue
-    # elif max([len(i) for i in this_code.split(" ")]) > 512:
-    elif len(this_code.split(" ")) > 512:
-        dropped_idx+=1
-        continue
-    else:
-        f.writelines(this_code)
-        g.writelines(this_label)
-f.close()
-g.close()
-
-# SANITY CHECK: ensure the # of observations in both files are the same.
-with open("codetest2.in",'r') as f:
-    code = f.readlines()
-f.close()
-
-with open("codetest2.label",'r') as f:
-    label = f.readlines()
-f.close()
-
-assert len(code) == len(label)
-
+# Cleans code.txt / label.txt and splits them into train, valid and test sets in
+# a single streaming pass: samples whose code and labels differ in length or that
+# have more than 512 tokens are dropped, duplicate code samples are dropped, and
+# every remaining sample goes to one of the splits
 
 FOLDER = './'
 
-code_unique = []
-label_unique = []
-for this_code, this_label in zip(code, label):
-    if this_code not in code_unique:
-        code_unique.append(this_code)
-        label_unique.append(this_label)
-
-assert len(code_unique) == len(label_unique)
-
 per_train = 0.5
 OUTPUT_IN_TRAIN = "codetest2_train_unique.in"
 OUTPUT_LABEL_TRAIN = "codetest2_train_unique.label"
@@ -65,37 +24,114 @@ OUTPUT_LABEL_TEST = "codetest2_test_unique.label"
 per = [per_train,per_valid,per_test]
 files = [(OUTPUT_IN_TRAIN,OUTPUT_LABEL_TRAIN),(OUTPUT_IN_VALID,OUTPUT_LABEL_VALID),(OUTPUT_IN_TEST,OUTPUT_LABEL_TEST)]
 
-assert 1 == per_train + per_valid + per_test
-
-count = 0
-for idx,combo in enumerate(zip(per,files)):
-    this_per, this_file = combo
-    if idx == 0:
-        end = int(len(code_unique) * this_per)
-        this_code = code_unique[:end]
-        this_label = label_unique[:end]
-    elif idx == 1:
-        start = end
-        end = start + int(len(code_unique) * per[idx+1])
-        this_code = code_unique[start:end]
-        this_label = label_unique[start:end]
-    else:
-        start = end
-        this_code = code_unique[start:]
-        this_label = label_unique[start:]
-
-    count += len(this_label)
-    with open(os.path.join(FOLDER, this_file[0]),"w") as f:
-        for code in this_code:
-            f.writelines(f"{code}")
-    f.close()
-
-    with open(os.path.join(FOLDER, this_file[1]),"w") as f:
-        for label in this_label:
-            f.writelines(f"{label}")
-    f.close()
-
-assert count == len(code_unique), f"{count}!={len(code_unique)}"
-
-print(f"After removing redundant observations, {count} samples are\
-left and written to files")
+MAX_TOKENS = 512
+
+
+class SeenSet:
+    """
+    Set of sample digests, kept in memory or in an sqlite database for huge corpora.
+    The database only holds the digests of the current run and is emptied on opening.
+    """
+
+    def __init__(self, db_file=None):
+        self.db = None
+        self.seen = set()
+        if db_file is not None:
+            self.db = sqlite3.connect(db_file)
+            self.db.execute("PRAGMA journal_mode=OFF")
+            self.db.execute("PRAGMA synchronous=OFF")
+            # digests left by an earlier run would mark every sample as a duplicate
+            self.db.execute("DROP TABLE IF EXISTS seen")
+            self.db.execute("CREATE TABLE seen (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+
+    def add(self, digest):
+        """Adds <digest> and returns True if it was not in the set yet."""
+        if self.db is None:
+            if digest in self.seen:
+                return False
+            self.seen.add(digest)
+            return True
+        return self.db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (digest,)).rowcount == 1
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+
+
+def sample_digest(code):
+    return hashlib.blake2b(code.encode('utf-8'), digest_size=16).digest()
+
+
+def split_index(digest, seed, per):
+    """Deterministic split of a sample: its seeded hash picks the split by the proportions <per>."""
+    value = hashlib.blake2b(digest, key=str(seed).encode(), digest_size=8).digest()
+    u = int.from_bytes(value, 'little') / 2**64
+    cumulative = 0
+    for idx, this_per in enumerate(per):
+        cumulative += this_per
+        if u < cumulative:
+            return idx
+    return len(per) - 1
+
+
+def keep_sample(this_code, this_label, max_tokens=MAX_TOKENS):
+    """Drop observations whose code length differs from the label length or exceeds max_tokens."""
+    num_tokens = len(this_code.split(" "))
+    return num_tokens == len(this_label.split(" ")) and num_tokens <= max_tokens
+
+
+def prepare_dataset(code_file, label_file, folder=FOLDER, per=per, files=files, seed=0,
+                    max_tokens=MAX_TOKENS, db_file=None):
+    """
+    Streams <code_file> and <label_file> once, drops invalid and duplicate samples and
+    writes each unique sample to the split chosen by its seeded hash. Returns the number
+    of dropped, duplicate and written samples per split.
+    """
+    assert abs(1 - sum(per)) < 1e-9
+
+    seen = SeenSet(db_file)
+    outputs = [(open(os.path.join(folder, f_in), "w"), open(os.path.join(folder, f_label), "w")) for f_in, f_label in files]
+    counts = [0] * len(files)
+    dropped = duplicates = 0
+    try:
+        with open(code_file, 'r') as f, open(label_file, 'r') as g:
+            for line_idx, (this_code, this_label) in enumerate(itertools.zip_longest(f, g)):
+                # SANITY CHECK: ensure the # of observations in both files are the same.
+                assert this_code is not None and this_label is not None, \
+                    f"{code_file} and {label_file} differ in length at line {line_idx}"
+                if not keep_sample(this_code, this_label, max_tokens):
+                    dropped += 1
+                    continue
+                digest = sample_digest(this_code)
+                if not seen.add(digest):
+                    duplicates += 1
+                    continue
+                idx = split_index(digest, seed, per)
+                outputs[idx][0].write(this_code)
+                outputs[idx][1].write(this_label)
+                counts[idx] += 1
+    finally:
+        for f_in, f_label in outputs:
+            f_in.close()
+            f_label.close()
+        seen.close()
+    return dropped, duplicates, counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--code-file", default="code.txt")
+    parser.add_argument("--label-file", default="label.txt")
+    parser.add_argument("--output-folder", default=FOLDER)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the train/valid/test assignment")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS, help="drop samples with more tokens")
+    parser.add_argument("--dedup-db", default=None,
+                        help="keep the seen samples in this sqlite file instead of memory, for huge corpora (emptied on start)")
+    args = parser.parse_args()
+
+    dropped, duplicates, counts = prepare_dataset(args.code_file, args.label_file, args.output_folder,
+                                                  seed=args.seed, max_tokens=args.max_tokens, db_file=args.dedup_db)
+    print(f"Dropped {dropped} invalid and {duplicates} redundant observations")
+    print(f"After removing redundant observations, {sum(counts)} samples are\
+ left and written to files ({', '.join(f'{f_in}: {c}' for (f_in, _), c in zip(files, counts))})")
@@ -28,6 +28,8 @@ python -m neurox.data.extraction.transformers_extractor --decompose_layers --fil
 
 #4. Create a dataset file with word and sentence indexes
 python ${scriptDir}/create_data_single_layer.py --text-file ${working_file} --activation-file ${working_file}.activations-layer${layer}.json --output-prefix ${working_file}
+# Alternatively, add --output-format npy to stream ${working_file}-point.npy and ${working_file}-vocab.npy
+# directly; these can be clustered without the frequency filter and extract_data.py steps below.
 
 #5. Calculate vocabulary size
 python ${scriptDir}/frequency_count.py --input-file ${working_file} --output-file ${working_file}.words_freq
@@ -0,0 +1,477 @@
+"""
+Compact binary replacement for the <prefix>-dataset.json interchange files
+
+A concept dataset is a directory (by convention named <prefix>-dataset.cxd)
+holding one token per row:
+
+    header.json       {"format": "conceptx-dataset", "version": 1, "model": ...,
+                       "layer": ..., "dtype": "float32" | "float16",
+                       "num_tokens": N, "hidden_size": D}
+    types.json        interned token table, a JSON list of word types
+    tokens.bin        int32[N]    index of the word in types.json
+    counts.bin        int32[N]    occurrence number of the word (2nd key field)
+    sentences.bin     int32[N]    sentence index
+    positions.bin     int32[N]    token index inside the sentence
+    activations.bin   dtype[N, D] row-major activation block
+
+All .bin files are raw little-endian arrays without headers, so every column
+is opened with np.memmap and a row is read without touching the rest of the
+file. A row corresponds to the JSON entry [word|||count|||sent|||tok, activations].
+
+Usage:
+python concept_dataset.py --input-file <PREFIX>-dataset.json --output-file <PREFIX>-dataset.cxd --model bert-base-cased --layer 12
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+from numpy.lib import format as npy_format
+
+FORMAT_NAME = "conceptx-dataset"
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16")
+INDEX_COLUMNS = ("tokens", "counts", "sentences", "positions")
+
+
+def split_key(key):
+    """
+    Splits a word|||count|||sent|||tok key, allowing the word itself to contain |||
+    """
+    word, count, sentence, position = key.rsplit("|||", 3)
+    return word, int(count), int(sentence), int(position)
+
+
+def is_concept_dataset(path):
+    """
+    Returns True if <path> is a concept dataset directory
+    """
+    return os.path.isfile(os.path.join(path, "header.json"))
+
+
+class ConceptDatasetWriter:
+    """
+    Appends tokens to a new concept dataset at <path>; the header and the token
+    table are written on close()
+    """
+    def __init__(self, path, hidden_size, dtype="float32", model=None, layer=None):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got {dtype}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.hidden_size = int(hidden_size)
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.model = model
+        self.layer = layer
+        self.num_tokens = 0
+        self.types = {}
+        self._columns = {name: open(os.path.join(path, f"{name}.bin"), "wb") for name in INDEX_COLUMNS}
+        self._activations = open(os.path.join(path, "activations.bin"), "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _intern(self, word):
+        return self.types.setdefault(word, len(self.types))
+
+    def append_block(self, words, counts, sentences, positions, activations):
+        """
+        Appends len(words) tokens; activations is a [len(words), hidden_size] array
+        """
+        activations = np.asarray(activations)
+        if activations.shape != (len(words), self.hidden_size):
+            raise ValueError(f"Expected activations of shape {(len(words), self.hidden_size)}, got {activations.shape}")
+        columns = {
+            "tokens": [self._intern(w) for w in words],
+            "counts": counts,
+            "sentences": sentences,
+            "positions": positions,
+        }
+        for name, values in columns.items():
+            self._columns[name].write(np.asarray(values, dtype="<i4").tobytes())
+        self._activations.write(np.ascontiguousarray(activations, dtype=self.dtype).tobytes())
+        self.num_tokens += len(words)
+
+    def append(self, key, activations):
+        """
+        Appends a single word|||count|||sent|||tok key with its activations
+        """
+        word, count, sentence, position = split_key(key)
+        self.append_block([word], [count], [sentence], [position], np.asarray(activations).reshape(1, -1))
+
+    def close(self):
+        if self._activations.closed:
+            return
+        for fp in self._columns.values():
+            fp.close()
+        self._activations.close()
+        with open(os.path.join(self.path, "types.json"), "w", encoding="utf-8") as fp:
+            json.dump(list(self.types), fp, ensure_ascii=False)
+        header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "model": self.model,
+            "layer": self.layer,
+            "dtype": self.dtype.name,
+            "num_tokens": self.num_tokens,
+            "hidden_size": self.hidden_size,
+        }
+        with open(os.path.join(self.path, "header.json"), "w") as fp:
+            json.dump(header, fp, indent=2)
+
+
+class ConceptDataset:
+    """
+    Read-only, memory-mapped view of a concept dataset directory
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, "header.json")) as fp:
+            header = json.load(fp)
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not a concept dataset")
+        if header["version"] > FORMAT_VERSION:
+            raise ValueError(f"Unsupported concept dataset version {header['version']}")
+        with open(os.path.join(path, "types.json"), encoding="utf-8") as fp:
+            self.types = json.load(fp)
+
+        self.path = path
+        self.header = header
+        self.model = header["model"]
+        self.layer = header["layer"]
+        self.hidden_size = header["hidden_size"]
+        n = header["num_tokens"]
+        for name in INDEX_COLUMNS:
+            setattr(self, name, self._memmap(f"{name}.bin", "<i4", (n,)))
+        self.activations = self._memmap("activations.bin", np.dtype(header["dtype"]).newbyteorder("<"), (n, self.hidden_size))
+
+    def _memmap(self, name, dtype, shape):
+        # np.memmap refuses empty files
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self):
+        return self.header["num_tokens"]
+
+    def word(self, i):
+        return self.types[self.tokens[i]]
+
+    def key(self, i):
+        """
+        Returns the word|||count|||sent|||tok key of row i
+        """
+        return f"{self.types[self.tokens[i]]}|||{self.counts[i]}|||{self.sentences[i]}|||{self.positions[i]}"
+
+    def keys(self):
+        for i in range(len(self)):
+            yield self.key(i)
+
+    def __getitem__(self, i):
+        return self.key(i), self.activations[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def iter_json_array(fp, buffer_size=1 << 20):
+    """
+    Incrementally parses the top-level JSON array in the text file <fp> and
+    yields its elements one at a time, holding at most one element plus
+    <buffer_size> characters in memory
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def fill(buf, pos):
+        chunk = fp.read(buffer_size)
+        return buf[pos:] + chunk, 0, not chunk
+
+    def skip_whitespace(buf, pos, eof):
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf, pos, eof
+            buf, pos, eof = fill(buf, pos)
+
+    buf, pos, eof = skip_whitespace(buf, pos, eof)
+    if buf[pos:pos + 1] != "[":
+        raise ValueError("Expected a JSON array")
+    buf, pos, eof = skip_whitespace(buf, pos + 1, eof)
+    if buf[pos:pos + 1] == "]":
+        return
+
+    while True:
+        while True:
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                buf, pos, eof = fill(buf, pos)
+                continue
+            # a number cut at the buffer end decodes early, so only accept an
+            # element once the following separator is in the buffer
+            after = end
+            while after < len(buf) and buf[after] in " \t\r\n":
+                after += 1
+            if not eof and (after == len(buf) or buf[after] not in ",]"):
+                buf, pos, eof = fill(buf, pos)
+                continue
+            break
+        yield element
+
+        pos = after
+        separator = buf[pos:pos + 1]
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {separator!r}")
+        buf, pos, eof = skip_whitespace(buf, pos + 1, eof)
+
+
+def point_vocab_files(path):
+    """
+    Returns the (point_file, vocab_file) pair of a <prefix>-point.npy path, or None for other paths
+    """
+    if path.endswith("-point.npy"):
+        return path, path[:-len("-point.npy")] + "-vocab.npy"
+    return None
+
+
+def iter_dataset(path):
+    """
+    Yields (key, activations) entries from a concept dataset, a <prefix>-point.npy
+    file with its <prefix>-vocab.npy, or a legacy -dataset.json file
+    """
+    if is_concept_dataset(path):
+        yield from ConceptDataset(path)
+    elif point_vocab_files(path):
+        point_file, vocab_file = point_vocab_files(path)
+        points = np.load(point_file, mmap_mode="r")
+        vocab = np.load(vocab_file, mmap_mode="r")
+        for i in range(len(vocab)):
+            yield str(vocab[i]), points[i]
+    else:
+        with open(path) as fp:
+            for key, activations in iter_json_array(fp):
+                yield key, activations
+
+
+def iter_dataset_keys(path):
+    """
+    Yields only the keys of a dataset; cheap for concept datasets and point files
+    """
+    if is_concept_dataset(path):
+        yield from ConceptDataset(path).keys()
+    elif point_vocab_files(path):
+        vocab = np.load(point_vocab_files(path)[1], mmap_mode="r")
+        for i in range(len(vocab)):
+            yield str(vocab[i])
+    else:
+        for key, _ in iter_dataset(path):
+            yield key
+
+
+class NpyRowWriter:
+    """
+    Appends rows to a 2-D .npy file whose length is not known in advance; the
+    header is rewritten with the final row count on close(), so the result
+    can be loaded with np.load(..., mmap_mode='r')
+    """
+    def __init__(self, path, num_columns, dtype=np.float32):
+        self.path = path
+        self.num_columns = int(num_columns)
+        self.dtype = np.dtype(dtype)
+        self.num_rows = 0
+        self._fp = open(path, "wb")
+        self._write_header()
+        self._header_size = self._fp.tell()
+
+    def _write_header(self):
+        # numpy pads the header so that the first axis can grow without changing its size
+        npy_format.write_array_header_1_0(self._fp, {
+            "descr": npy_format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (self.num_rows, self.num_columns),
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        if rows.ndim != 2 or rows.shape[1] != self.num_columns:
+            raise ValueError(f"Expected rows with {self.num_columns} columns, got shape {rows.shape}")
+        self._fp.write(rows.tobytes())
+        self.num_rows += rows.shape[0]
+
+    def close(self):
+        if self._fp.closed:
+            return
+        self._fp.seek(0)
+        self._write_header()
+        if self._fp.tell() != self._header_size:
+            raise RuntimeError(f"Header of {self.path} changed size, the file is corrupt")
+        self._fp.close()
+
+
+class VocabWriter:
+    """
+    Collects keys in a temporary spool file and writes them on close() as a
+    unicode .npy array, the same file np.save(vocab_file, keys) produces
+    """
+    def __init__(self, vocab_file, chunk_size=65536):
+        self.vocab_file = vocab_file
+        self.chunk_size = chunk_size
+        self.num_keys = 0
+        self.max_length = 1
+        self._spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, key):
+        self._spool.write(json.dumps(key) + "\n")
+        self.num_keys += 1
+        self.max_length = max(self.max_length, len(key))
+
+    def close(self):
+        if self._spool.closed:
+            return
+        self._spool.seek(0)
+        vocab = npy_format.open_memmap(self.vocab_file, mode="w+", dtype=f"<U{self.max_length}", shape=(self.num_keys,))
+        for start in range(0, self.num_keys, self.chunk_size):
+            count = min(self.chunk_size, self.num_keys - start)
+            vocab[start:start + count] = [json.loads(self._spool.readline()) for _ in range(count)]
+        vocab.flush()
+        del vocab
+        self._spool.close()
+
+
+def save_vocab(keys, vocab_file):
+    """
+    Saves the strings in <keys> like np.save(vocab_file, list(keys)) without holding them all in memory
+    """
+    with VocabWriter(vocab_file) as writer:
+        for key in keys:
+            writer.append(key)
+    return writer.num_keys
+
+
+class JsonDatasetWriter:
+    """
+    Streams (key, activations) entries into a legacy -dataset.json file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.num_tokens = 0
+        self._fp = open(path, "w")
+        self._fp.write("[")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, key, activations):
+        if isinstance(activations, np.ndarray):
+            activations = activations.tolist()
+        self._fp.write((", " if self.num_tokens else "") + json.dumps([key, activations], ensure_ascii=False))
+        self.num_tokens += 1
+
+    def close(self):
+        if self._fp.closed:
+            return
+        self._fp.write("]")
+        self._fp.close()
+
+
+class PointFileWriter:
+    """
+    Streams (key, activations) entries into a <prefix>-point.npy / <prefix>-vocab.npy pair
+    """
+    def __init__(self, prefix, hidden_size, dtype=np.float32):
+        self.point_file = prefix + "-point.npy"
+        self.vocab_file = prefix + "-vocab.npy"
+        self._points = NpyRowWriter(self.point_file, hidden_size, dtype=dtype)
+        self._vocab = VocabWriter(self.vocab_file)
+
+    @property
+    def num_tokens(self):
+        return self._points.num_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, key, activations):
+        self._points.write(np.asarray(activations).reshape(1, -1))
+        self._vocab.append(key)
+
+    def close(self):
+        self._points.close()
+        self._vocab.close()
+
+
+def open_dataset_writer(prefix, output_format, hidden_size, dtype="float32"):
+    """
+    Opens a writer for <prefix>-dataset.json (json), <prefix>-dataset.cxd (cxd)
+    or <prefix>-point.npy and <prefix>-vocab.npy (npy)
+    """
+    if output_format == "json":
+        return JsonDatasetWriter(prefix + "-dataset.json")
+    if output_format == "cxd":
+        return ConceptDatasetWriter(prefix + "-dataset.cxd", hidden_size, dtype=dtype)
+    if output_format == "npy":
+        return PointFileWriter(prefix, hidden_size, dtype=dtype)
+    raise ValueError(f"Unknown output format {output_format}")
+
+
+def convert_json(input_file, output_path, model=None, layer=None, dtype="float32"):
+    """
+    Converts a legacy -dataset.json file to a concept dataset and returns the number of tokens
+    """
+    writer = None
+    with open(input_file) as fp:
+        for key, activations in iter_json_array(fp):
+            if writer is None:
+                writer = ConceptDatasetWriter(output_path, len(activations), dtype=dtype, model=model, layer=layer)
+            writer.append(key, activations)
+    if writer is None:
+        raise ValueError(f"{input_file} contains no tokens")
+    writer.close()
+    return writer.num_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a -dataset.json file to the binary concept dataset format")
+    parser.add_argument("--input-file", "-i", required=True, help="legacy -dataset.json file")
+    parser.add_argument("--output-file", "-o", required=True, help="output .cxd directory")
+    parser.add_argument("--model", default=None, help="model name recorded in the header")
+    parser.add_argument("--layer", type=int, default=None, help="layer recorded in the header")
+    parser.add_argument("--dtype", choices=DTYPES, default="float32")
+    args = parser.parse_args()
+
+    print("Converting " + args.input_file)
+    num_tokens = convert_json(args.input_file, args.output_file, args.model, args.layer, args.dtype)
+    print(f"Written {num_tokens} tokens to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Single-pass version of create_data_single_layer.py for several layers
+
+Reads a NeuroX activation file holding all layers once and writes every
+requested layer to <prefix>-layer<L>-point.npy, together with one shared
+<prefix>-vocab.npy (word|||count|||sent|||tok keys) and the usual
+<prefix>-sentences.json / <prefix>-labels.json files.
+
+Usage:
+python create_data_multi_layer.py --text-file <TEXT> --activation-file <ACTIVATIONS.json> --output-prefix <PREFIX> --layers 0-12 --workers 4
+"""
+
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from create_data_single_layer import data_loader, iter_token_keys
+
+
+def parse_layers(spec, num_layers):
+    """
+    Parses a layer specification such as "12", "0,4,8" or "0-3,8" (ranges are
+    inclusive); None selects every layer
+    """
+    num_layers = int(num_layers)
+    if spec is None:
+        return list(range(num_layers))
+    layers = []
+    for part in spec.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            layers.extend(range(int(start), int(end) + 1))
+        else:
+            layers.append(int(part))
+    for layer in layers:
+        if not 0 <= layer < num_layers:
+            raise ValueError(f"Layer {layer} out of range, the activation file has {num_layers} layers")
+    return sorted(set(layers))
+
+
+def load_layer_activations(activation_file, hidden_size=None, loader=data_loader):
+    """
+    Loads a NeuroX activation file and returns the activations, the number of layers
+    and the neurons per layer, both as ints (json activation files report the number
+    of layers as a float)
+    """
+    activations, num_layers = loader.load_activations(activation_file, num_neurons_per_layer=hidden_size)
+    num_layers = int(num_layers)
+    hidden_size = int(hidden_size or activations[0].shape[1] // num_layers)
+    return activations, num_layers, hidden_size
+
+
+def write_layer(activations, sentence_lengths, layer, hidden_size, point_file, dtype=np.float32):
+    """
+    Copies the <layer> slice of every sentence's activations into a memory-mapped <point_file>
+    """
+    points = open_memmap(point_file, mode='w+', dtype=dtype, shape=(sum(sentence_lengths), hidden_size))
+    start, end = layer * hidden_size, (layer + 1) * hidden_size
+    row = 0
+    for sentence_acts, num_tokens in zip(activations, sentence_lengths):
+        points[row:row + num_tokens] = sentence_acts[:num_tokens, start:end]
+        row += num_tokens
+    points.flush()
+    del points
+    return point_file
+
+
+def write_layers(activations, sentence_lengths, layers, hidden_size, output_prefix, workers=4):
+    """
+    Writes one point file per layer, at most <workers> layers at a time
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            layer: pool.submit(write_layer, activations, sentence_lengths, layer, hidden_size,
+                               f'{output_prefix}-layer{layer}-point.npy')
+            for layer in layers
+        }
+        for layer, future in futures.items():
+            print(f"layer {layer} point file: {future.result()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--text-file', type=str, required=True)
+    parser.add_argument('--activation-file', type=str, required=True)
+    parser.add_argument('--output-prefix', type=str, required=True)
+    parser.add_argument('--layers', type=str, default=None,
+                        help="layers to write, e.g. 12, 0,4,8 or 0-12 (inclusive); all layers by default")
+    parser.add_argument('--hidden-size', type=int, default=None,
+                        help="neurons per layer; detected from the activation file if omitted")
+    parser.add_argument('--workers', type=int, default=4, help="number of layers written concurrently")
+
+    args = parser.parse_args()
+
+    print("Loading activations...")
+    activations, num_layers, hidden_size = load_layer_activations(f'{args.activation_file}', args.hidden_size)
+    layers = parse_layers(args.layers, num_layers)
+    print(f"{num_layers} layers of {hidden_size} neurons, writing layers {layers}")
+
+    print("Loading tokens...")
+    tokens = data_loader.load_data(
+        f'{args.text_file}',
+        f'{args.text_file}',
+        activations,
+        1000
+    )
+
+    print("Writing datasets...")
+    sentences = [" ".join(source_line) for source_line in tokens['source']]
+    labels = [" ".join(label_line) for label_line in tokens['target']]
+    with open(f'{args.output_prefix}-sentences.json', 'w', encoding='utf-8') as fp:
+        json.dump(sentences, fp, ensure_ascii=False)
+    with open(f'{args.output_prefix}-labels.json', 'w') as fp:
+        json.dump(labels, fp)
+
+    vocab_file = f'{args.output_prefix}-vocab.npy'
+    np.save(vocab_file, [key for _, _, key in iter_token_keys(tokens)])
+    print(f"vocab file: {vocab_file}")
+
+    sentence_lengths = [len(label_line) for label_line in tokens['target']]
+    write_layers(activations, sentence_lengths, layers, hidden_size, args.output_prefix, workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
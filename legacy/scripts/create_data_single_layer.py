@@ -2,25 +2,98 @@ import argparse
 import json
 import sys
 
+import numpy as np
 from collections import Counter
+from numpy.lib.format import open_memmap
 from tqdm import tqdm
 
+from concept_dataset import ConceptDatasetWriter, DTYPES
+
 sys.path.append("/export/work/hsajjad/software/NeuroX/")
 
 import neurox.data.loader as data_loader
 #from aux_classifier import data_loader
 
+
+def iter_sentence_tokens(tokens):
+    """
+    Yields (line_idx, words, counts) for every sentence, where counts holds the
+    running occurrence number of each word over the whole dataset
+    """
+    selected_tokens = Counter()
+    for line_idx, label_line in enumerate(tokens['target']):
+        words = tokens['source'][line_idx][:len(label_line)]
+        counts = []
+        for token in words:
+            selected_tokens[token] += 1
+            counts.append(selected_tokens[token])
+        yield line_idx, words, counts
+
+
+def iter_token_keys(tokens):
+    """
+    Yields (line_idx, label_idx, key) for every token in dataset order, where key
+    is the word|||count|||sent|||tok representation used by the clustering files
+    """
+    for line_idx, words, counts in iter_sentence_tokens(tokens):
+        for label_idx, (token, count) in enumerate(zip(words, counts)):
+            yield line_idx, label_idx, f'{token}|||{count}|||{line_idx}|||{label_idx}'
+
+
+def write_point_files(tokens, activations, point_file, vocab_file, dtype=np.float32):
+    """
+    Streams the activations of every token into a memory-mapped <point_file> and
+    writes the matching keys to <vocab_file>, the same pair extract_data.py produces
+    from a -dataset.json file
+    """
+    num_tokens = sum(len(label_line) for label_line in tokens['target'])
+    hidden_size = activations[0].shape[1]
+    points = open_memmap(point_file, mode='w+', dtype=dtype, shape=(num_tokens, hidden_size))
+
+    row = 0
+    for line_idx, label_line in tqdm(enumerate(tokens['target'])):
+        num_labels = len(label_line)
+        points[row:row + num_labels] = activations[line_idx][:num_labels, :]
+        row += num_labels
+    points.flush()
+    del points
+
+    np.save(vocab_file, [key for _, _, key in iter_token_keys(tokens)])
+    return num_tokens, hidden_size
+
+
+def write_concept_dataset(tokens, activations, path, model=None, layer=None, dtype='float32'):
+    """
+    Streams every token into the binary concept dataset at <path> (see concept_dataset.py)
+    """
+    hidden_size = activations[0].shape[1]
+    with ConceptDatasetWriter(path, hidden_size, dtype=dtype, model=model, layer=layer) as writer:
+        for line_idx, words, counts in tqdm(iter_sentence_tokens(tokens)):
+            num_labels = len(words)
+            writer.append_block(words, counts, [line_idx] * num_labels, range(num_labels),
+                                activations[line_idx][:num_labels, :])
+    return writer.num_tokens, hidden_size
+
+
 def main():
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--text-file', type=str, required=True)
     parser.add_argument('--activation-file', type=str, required=True)
     parser.add_argument('--output-prefix', type=str, required=True)
+    parser.add_argument('--hidden-size', type=int, default=None,
+                        help="neurons per layer; detected from the activation file if omitted")
+    parser.add_argument('--output-format', choices=['json', 'npy', 'cxd'], default='json',
+                        help="json writes <prefix>-dataset.json; npy streams <prefix>-point.npy and <prefix>-vocab.npy "
+                             "directly, skipping the extract_data.py step; cxd writes the binary <prefix>-dataset.cxd")
+    parser.add_argument('--model', type=str, default=None, help="model name recorded in the cxd header")
+    parser.add_argument('--layer', type=int, default=None, help="layer recorded in the cxd header")
+    parser.add_argument('--dtype', choices=DTYPES, default='float32', help="activation dtype of the cxd output")
 
     args = parser.parse_args()
 
     print("Loading activations...")
-    activations, num_layers = data_loader.load_activations(f'{args.activation_file}', num_neurons_per_layer=768)
+    activations, num_layers = data_loader.load_activations(f'{args.activation_file}', num_neurons_per_layer=args.hidden_size)
     print("Loading tokens...")
     tokens = data_loader.load_data(
         f'{args.text_file}',
@@ -30,30 +103,36 @@ def main():
     )
 
     print("Preparing dataset...")
-    sentences = []
-    labels = []
-    selected_tokens = Counter()
-    token_dataset = []
+    sentences = [" ".join(source_line) for source_line in tokens['source']]
+    labels = [" ".join(label_line) for label_line in tokens['target']]
 
-    for line_idx, label_line in tqdm(enumerate(tokens['target'])):
-        sentences.append(" ".join(tokens['source'][line_idx]))
-        labels.append(" ".join(label_line))
-        for label_idx, label in enumerate(label_line):
-            token = tokens['source'][line_idx][label_idx]
-            selected_tokens[token] += 1
-            token_acts = activations[line_idx][label_idx, :]
-            token_acts = token_acts.tolist()
-            
-            final_tok_rep = f'{token}|||{selected_tokens[token]}|||{len(sentences)-1}|||{label_idx}'
-            token_dataset.append((final_tok_rep, token_acts))
-    
     print("Writing datasets...")
     with open(f'{args.output_prefix}-sentences.json', 'w', encoding='utf-8') as fp:
         json.dump(sentences, fp, ensure_ascii=False)
     
     with open(f'{args.output_prefix}-labels.json', 'w') as fp:
         json.dump(labels, fp)
-  
+
+    if args.output_format == 'npy':
+        point_file = f'{args.output_prefix}-point.npy'
+        vocab_file = f'{args.output_prefix}-vocab.npy'
+        num_tokens, hidden_size = write_point_files(tokens, activations, point_file, vocab_file)
+        print(f"point file: {point_file} ({num_tokens} x {hidden_size})")
+        print(f"vocab file: {vocab_file}")
+        return
+
+    if args.output_format == 'cxd':
+        dataset_path = f'{args.output_prefix}-dataset.cxd'
+        num_tokens, hidden_size = write_concept_dataset(tokens, activations, dataset_path,
+                                                        model=args.model, layer=args.layer, dtype=args.dtype)
+        print(f"dataset: {dataset_path} ({num_tokens} x {hidden_size})")
+        return
+
+    token_dataset = []
+    for line_idx, label_idx, final_tok_rep in tqdm(iter_token_keys(tokens)):
+        token_acts = activations[line_idx][label_idx, :]
+        token_dataset.append((final_tok_rep, token_acts.tolist()))
+
     with open(f'{args.output_prefix}-dataset.json', 'w') as fp:
         json.dump(token_dataset, fp)
 
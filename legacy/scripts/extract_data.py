@@ -1,46 +1,94 @@
-import json
 import numpy as np
 import argparse
 from tqdm import tqdm
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--input-file","-i", help="path to the json file")
-parser.add_argument("--output-path","-o", default="./", help="output path")
-parser.add_argument("--output-vocab-file","-v", default=None, help="output vocab file name")
-parser.add_argument("--output-point-file","-p", default=None, help="output points file name")
-args = parser.parse_args()
-
-input_file = args.input_file
-output_path = args.output_path
-output_vocab_file = args.output_vocab_file
-output_point_file = args.output_point_file
-
-print("Reading "+input_file)
-tokens = []
-points = []
-with open(input_file,'r') as f:
-        dataset = json.load(f)
-        for entry in dataset:
-            #word, d_wordcount, d_sentencecount, label_idx = entry[0].split('|||')
-            #representation = entry[1]
-            tokens.append(entry[0])
-            points.append(entry[1])
-
-points = np.array(points)
-
-if output_vocab_file == None:
-	fname=output_path+"/processed-vocab.npy"
-	print("vocab file: {}".format(fname))
-	np.save(output_path+"/processed-vocab.npy",tokens)
-else:
+from concept_dataset import ConceptDataset, NpyRowWriter, VocabWriter, is_concept_dataset, iter_json_array, save_vocab
+
+JSON_BUFFER_SIZE = 1 << 20
+
+
+def chunk_rows(hidden_size, chunk_size, max_memory=None):
+	"""
+	Returns the number of rows buffered per chunk, capped so that the chunk and
+	the JSON read buffer fit in <max_memory> bytes
+	"""
+	if max_memory is None:
+		return chunk_size
+	row_bytes = hidden_size * np.dtype(np.float32).itemsize
+	rows = min(chunk_size, (max_memory - 2 * JSON_BUFFER_SIZE) // row_bytes)
+	if rows < 1:
+		raise MemoryError(f"A memory cap of {max_memory} bytes cannot hold a single row of {hidden_size} activations")
+	return rows
+
+
+def convert_json_dataset(input_file, point_file, vocab_file, chunk_size=4096, max_memory=None):
+	"""
+	Streams a -dataset.json file into a float32 <point_file> and a <vocab_file>,
+	buffering at most one chunk of rows at a time
+	"""
+	with open(input_file, 'r') as f, VocabWriter(vocab_file) as vocab:
+		entries = iter_json_array(f, buffer_size=JSON_BUFFER_SIZE)
+		writer = None
+		progress = tqdm(unit=" tokens")
+		for key, activations in entries:
+			if writer is None:
+				hidden_size = len(activations)
+				rows = chunk_rows(hidden_size, chunk_size, max_memory)
+				chunk = np.empty((rows, hidden_size), dtype=np.float32)
+				writer = NpyRowWriter(point_file, hidden_size)
+				filled = 0
+			chunk[filled] = activations
+			vocab.append(key)
+			filled += 1
+			if filled == rows:
+				writer.write(chunk)
+				progress.update(filled)
+				filled = 0
+		if writer is None:
+			raise ValueError(f"{input_file} contains no tokens")
+		writer.write(chunk[:filled])
+		progress.update(filled)
+		progress.close()
+		writer.close()
+	return writer.num_rows
+
+
+def convert_concept_dataset(input_file, point_file, vocab_file, chunk_size=4096):
+	"""
+	Copies the activations of a concept dataset into a float32 <point_file> chunk by chunk
+	"""
+	dataset = ConceptDataset(input_file)
+	with NpyRowWriter(point_file, dataset.hidden_size) as writer:
+		for start in tqdm(range(0, len(dataset), chunk_size), unit=" chunks"):
+			writer.write(dataset.activations[start:start + chunk_size])
+	save_vocab(dataset.keys(), vocab_file)
+	return len(dataset)
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--input-file","-i", help="path to the -dataset.json file or .cxd concept dataset")
+	parser.add_argument("--output-path","-o", default="./", help="output path")
+	parser.add_argument("--output-vocab-file","-v", default=None, help="output vocab file name")
+	parser.add_argument("--output-point-file","-p", default=None, help="output points file name")
+	parser.add_argument("--chunk-size", type=int, default=4096, help="rows buffered before they are written")
+	parser.add_argument("--max-memory", type=float, default=None, help="hard cap in MB on the row buffer, lowers --chunk-size if needed")
+	args = parser.parse_args()
+
+	input_file = args.input_file
+	output_vocab_file = args.output_vocab_file or args.output_path+"/processed-vocab.npy"
+	output_point_file = args.output_point_file or args.output_path+"/processed-point.npy"
+	max_memory = int(args.max_memory * 2**20) if args.max_memory is not None else None
+
+	print("Reading "+input_file)
 	print("vocab file: {}".format(output_vocab_file))
-	np.save(output_vocab_file,tokens)
-if output_point_file == None:
-	fname=output_path+"/processed-point.npy"
-	print("point file: {}".format(fname))
-	np.save(output_path+"/processed-point.npy",points)
-else:	
 	print("point file: {}".format(output_point_file))
-	np.save(output_point_file,points)
-print("Written vocab file and point file")	
+	if is_concept_dataset(input_file):
+		num_tokens = convert_concept_dataset(input_file, output_point_file, output_vocab_file, args.chunk_size)
+	else:
+		num_tokens = convert_json_dataset(input_file, output_point_file, output_vocab_file, args.chunk_size, max_memory)
+	print("Written vocab file and point file ({} tokens)".format(num_tokens))
+
 
+if __name__ == "__main__":
+	main()
@@ -1,65 +1,205 @@
-import codecs
 import argparse
+import bisect
 import json
+import os
+import struct
+from collections import Counter
+from multiprocessing import Pool
 
-parser = argparse.ArgumentParser()
-
-parser.add_argument('--input-file', type=str, required=True)
-parser.add_argument('--output-file', type=str, default="output_activatons.json")
-
-args = parser.parse_args()
-
-files = (args.input_file).split(',')
-
-wordCount = {}
-
-for file in files:
-    f = codecs.open(file, encoding="utf-8")
-    print ("Reading file: ", file)
-    for line in f.readlines():
-        words = line.strip().split(' ')
-        for word in words:
-            if word in wordCount:
-                wordCount[word] += 1
-
-            else:
-                wordCount[word] = 1
-
-print ("Saving output file")        
-with open(args.output_file, 'w') as fp:
-    json.dump(wordCount, fp)
-
-print ("######### Singletons #############")
-
-print ([k for k,v in wordCount.items() if v < 2])
-
-print ("#####################################")
-
-print ("Types in vocab: ", len(wordCount))
-print ("Tokens in vocab: ", sum(wordCount.values()))
-
-lessthan5=0
-lessthan4=0
-lessthan3=0
-lessthan2=0
-
-for k,v in wordCount.items():
-    if v < 2:
-        lessthan5+=1
-        lessthan4+=1
-        lessthan3+=1
-        lessthan2+=1
-    elif v < 3:
-        lessthan5+=1
-        lessthan4+=1
-        lessthan3+=1
-    elif v < 4:
-        lessthan5+=1
-        lessthan4+=1
-    elif v < 5:
-        lessthan5+=1
-       
-print ("Types less than 2: ", lessthan2) 
-print ("Types less than 3: ", lessthan3)
-print ("Types less than 4: ", lessthan4)
-print ("Types less than 5: ", lessthan5)
+import numpy as np
+
+VOCAB_MAGIC = b"CXVOCAB\0"
+VOCAB_VERSION = 1
+# magic, version, reserved, number of words, size of the utf-8 blob
+VOCAB_HEADER = struct.Struct("<8sIIQQ")
+
+
+def split_ranges(file, range_size):
+    """
+    Splits <file> into (file, start, end) byte ranges of about <range_size>
+    bytes, each starting at the beginning of a line
+    """
+    size = os.path.getsize(file)
+    boundaries = [0]
+    with open(file, 'rb') as f:
+        while boundaries[-1] + range_size < size:
+            f.seek(boundaries[-1] + range_size)
+            f.readline()
+            if f.tell() >= size:
+                break
+            boundaries.append(f.tell())
+    boundaries.append(size)
+    return [(file, start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def count_range(task):
+    """
+    Counts the space separated words of the lines in one (file, start, end) byte range
+    """
+    file, start, end = task
+    counts = Counter()
+    with open(file, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    for line in text.splitlines():
+        counts.update(line.strip().split(' '))
+    return counts
+
+
+def count_words(files, workers=None, range_size=64 * 2**20):
+    """
+    Counts words over all <files> on a pool of <workers> processes. Files are
+    split into line-aligned byte ranges and the partial counts are merged in
+    input order, so the result matches a sequential pass
+    """
+    tasks = [task for file in files for task in split_ranges(file, range_size)]
+    word_count = Counter()
+    if workers == 1 or len(tasks) <= 1:
+        for counts in map(count_range, tasks):
+            word_count.update(counts)
+        return word_count
+    with Pool(workers) as pool:
+        for counts in pool.imap(count_range, tasks):
+            word_count.update(counts)
+    return word_count
+
+
+def write_vocab_counts(path, word_count):
+    """
+    Writes <word_count> as a binary vocabulary sorted by the utf-8 bytes of the
+    words: a header, int64 counts, uint64 offsets and the concatenated words
+    """
+    items = sorted((word.encode('utf-8'), count) for word, count in word_count.items())
+    counts = np.array([count for _, count in items], dtype='<i8')
+    lengths = np.array([len(word) for word, _ in items], dtype='<u8')
+    offsets = np.concatenate([np.zeros(1, dtype='<u8'), np.cumsum(lengths, dtype='<u8')])
+    blob = b"".join(word for word, _ in items)
+    with open(path, 'wb') as fp:
+        fp.write(VOCAB_HEADER.pack(VOCAB_MAGIC, VOCAB_VERSION, 0, len(items), len(blob)))
+        fp.write(counts.tobytes())
+        fp.write(offsets.tobytes())
+        fp.write(blob)
+
+
+class VocabCounts:
+    """
+    Memory-mapped reader for the binary vocabulary written by write_vocab_counts;
+    word lookups are binary searches over the sorted words
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            magic, version, _, n, blob_size = VOCAB_HEADER.unpack(fp.read(VOCAB_HEADER.size))
+        if magic != VOCAB_MAGIC:
+            raise ValueError(f"{path} is not a binary vocabulary file")
+        if version > VOCAB_VERSION:
+            raise ValueError(f"Unsupported vocabulary version {version}")
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        start = VOCAB_HEADER.size
+        self.counts = data[start:start + 8 * n].view('<i8')
+        start += 8 * n
+        self.offsets = data[start:start + 8 * (n + 1)].view('<u8')
+        start += 8 * (n + 1)
+        self._blob = data[start:start + blob_size]
+        self._words = _WordView(self)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def word_bytes(self, i):
+        return bytes(self._blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def word(self, i):
+        return self.word_bytes(i).decode('utf-8')
+
+    def words(self):
+        for i in range(len(self)):
+            yield self.word(i)
+
+    def __contains__(self, word):
+        return self._find(word) is not None
+
+    def __getitem__(self, word):
+        i = self._find(word)
+        if i is None:
+            raise KeyError(word)
+        return int(self.counts[i])
+
+    def get(self, word, default=None):
+        i = self._find(word)
+        return default if i is None else int(self.counts[i])
+
+    def _find(self, word):
+        key = word.encode('utf-8')
+        i = bisect.bisect_left(self._words, key)
+        if i < len(self) and self._words[i] == key:
+            return i
+        return None
+
+    def to_dict(self):
+        return {word: int(count) for word, count in zip(self.words(), self.counts)}
+
+
+class _WordView:
+    """
+    Sequence of the encoded words of a VocabCounts, for bisect
+    """
+    def __init__(self, vocab):
+        self.vocab = vocab
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __getitem__(self, i):
+        return self.vocab.word_bytes(i)
+
+
+def threshold_histogram(counts, cutoffs):
+    """
+    Returns the number of word types whose count is below each cutoff
+    """
+    sorted_counts = np.sort(np.asarray(counts))
+    return dict(zip(cutoffs, np.searchsorted(sorted_counts, cutoffs, side='left').tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--input-file', type=str, required=True, help="comma separated list of text files")
+    parser.add_argument('--output-file', type=str, default="output_activatons.json")
+    parser.add_argument('--vocab-file', type=str, default=None,
+                        help="binary vocabulary with counts, <output-file>.vocab.bin by default")
+    parser.add_argument('--workers', type=int, default=None, help="counting processes, all cores by default")
+    parser.add_argument('--range-size', type=int, default=64, help="size in MB of the file ranges counted by one task")
+    parser.add_argument('--cutoffs', type=str, default="2,3,4,5", help="comma separated counts to report types below")
+    parser.add_argument('--singletons-file', type=str, default=None, help="write the words seen once to this file")
+
+    args = parser.parse_args()
+
+    files = (args.input_file).split(',')
+    cutoffs = [int(c) for c in args.cutoffs.split(',')]
+    vocab_file = args.vocab_file or args.output_file + ".vocab.bin"
+
+    print ("Reading files: ", files)
+    wordCount = count_words(files, workers=args.workers, range_size=args.range_size * 2**20)
+
+    print ("Saving output file")
+    with open(args.output_file, 'w') as fp:
+        json.dump(wordCount, fp)
+    write_vocab_counts(vocab_file, wordCount)
+    print ("Saved binary vocabulary: ", vocab_file)
+
+    counts = np.fromiter(wordCount.values(), dtype=np.int64, count=len(wordCount))
+    print ("Singletons: ", int(np.count_nonzero(counts < 2)))
+    if args.singletons_file:
+        with open(args.singletons_file, 'w', encoding='utf-8') as fp:
+            fp.writelines(k + "\n" for k, v in wordCount.items() if v < 2)
+
+    print ("Types in vocab: ", len(wordCount))
+    print ("Tokens in vocab: ", int(counts.sum()))
+
+    for cutoff, types in threshold_histogram(counts, cutoffs).items():
+        print (f"Types less than {cutoff}: ", types)
+
+
+if __name__ == '__main__':
+    main()
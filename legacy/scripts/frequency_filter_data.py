@@ -1,6 +1,25 @@
+"""
+Frequency based filtering of a token dataset, one record at a time
+
+Drops words below --minimum-frequency or above --delete-frequency and keeps at
+most --maximum-frequency occurrences of every other word. With --sampling first
+the first occurrences are kept; with --sampling reservoir a seeded uniform
+sample of each word's occurrences is kept instead, at the cost of a second,
+key-only pass over the input.
+
+Inputs may be -dataset.json files, .cxd concept datasets or <prefix>-point.npy
+files (with their <prefix>-vocab.npy); the frequency file may be the JSON dict
+or the .vocab.bin file written by frequency_count.py.
+"""
+
 import argparse
 import json
+import random
 
+import numpy as np
+
+from concept_dataset import DTYPES, iter_dataset, iter_dataset_keys, iter_json_array, open_dataset_writer
+from frequency_count import VocabCounts
 
 
 def get_pieces(line):
@@ -13,116 +32,210 @@ def get_pieces(line):
     pieces.append(line[:end_idx])
     return list(reversed(pieces))
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--input-file', type=str, required=True)
-parser.add_argument('--frequency-file', type=str, required=True)
-parser.add_argument('--sentence-file', type=str, required=True)
-parser.add_argument('--minimum-frequency', type=int, default=5)
-parser.add_argument('--maximum-frequency', type=int, default=50)
-parser.add_argument('--delete-frequency', type=int, default=500000)
-parser.add_argument('--output-file', type=str, default="output_activatons.json")
 
-args = parser.parse_args()
+def load_frequencies(frequency_file):
+    """
+    Loads word counts from a JSON dict or a binary vocabulary file
+    """
+    if frequency_file.endswith(".bin"):
+        vocab = VocabCounts(frequency_file)
+        return vocab, len(vocab), int(vocab.counts.sum())
+    with open(frequency_file) as f:
+        wordCount = json.load(f)
+    return wordCount, len(wordCount), sum(wordCount.values())
+
+
+def copy_sentences(sentence_files, output_file):
+    """
+    Concatenates the JSON sentence lists into <output_file> and returns the number of sentences per file
+    """
+    files_size = []
+    with open(output_file, 'w') as out:
+        out.write("[")
+        total = 0
+        for file in sentence_files:
+            filesize = 0
+            with open(file) as f:
+                for line in iter_json_array(f):
+                    out.write((", " if total else "") + json.dumps(line.strip(), ensure_ascii=False))
+                    filesize += 1
+                    total += 1
+            files_size.append(filesize)
+        out.write("]")
+    return files_size
+
+
+class FrequencyFilter:
+    """
+    Decides record by record whether a word occurrence is kept and tracks the skip counters
+    """
+    def __init__(self, wordCount, min_freq, max_freq, del_freq, sampling="first", seed=0):
+        self.wordCount = wordCount
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        self.del_freq = del_freq
+        self.sampling = sampling
+        self.seed = seed
+        self.currCount = {}
+        self.selected = None
+        self.maxskip, self.minskip, self.delskip = 0, 0, 0
+        self.maxskips, self.minskips, self.delskips = set(), set(), set()
+
+    def eligible(self, word):
+        """
+        Returns None for words kept subject to the max frequency, or the reason they are dropped
+        """
+        count = self.wordCount.get(word)
+        if count is not None and count > self.del_freq:
+            return "del"
+        if count is None or count < self.min_freq:
+            return "min"
+        return None
+
+    def sample(self, keys):
+        """
+        Draws, for every eligible word, a seeded uniform reservoir of at most
+        max_freq of its occurrences among <keys> (the keys of all input records)
+        """
+        rng = random.Random(self.seed)
+        reservoirs = {}
+        seen = {}
+        for idx, key in enumerate(keys):
+            word = get_pieces(key)[0]
+            if self.eligible(word) is not None:
+                continue
+            n = seen.get(word, 0) + 1
+            seen[word] = n
+            reservoir = reservoirs.setdefault(word, [])
+            if len(reservoir) < self.max_freq:
+                reservoir.append(idx)
+            else:
+                j = rng.randrange(n)
+                if j < self.max_freq:
+                    reservoir[j] = idx
+        self.selected = np.sort(np.fromiter((idx for r in reservoirs.values() for idx in r), dtype=np.int64))
+        self._next = 0
+
+    def keep(self, idx, word):
+        """
+        Returns True if the occurrence of <word> at record <idx> is kept
+        """
+        reason = self.eligible(word)
+        if reason == "del":
+            self.delskip += 1
+            self.delskips.add(word)
+            return False
+        if reason == "min":
+            self.minskip += 1
+            self.minskips.add(word)
+            return False
+
+        if self.sampling == "reservoir":
+            while self._next < len(self.selected) and self.selected[self._next] < idx:
+                self._next += 1
+            kept = self._next < len(self.selected) and self.selected[self._next] == idx
+        else:
+            kept = self.currCount.get(word, 0) < self.max_freq
+        if kept:
+            self.currCount[word] = self.currCount.get(word, 0) + 1
+        else:
+            self.maxskip += 1
+            self.maxskips.add(word)
+        return kept
+
+
+def filter_datasets(dataset_files, files_size, word_filter, output_prefix, output_format="json", dtype="float32"):
+    """
+    Streams the records of every dataset file through <word_filter>, renumbering
+    word counts and sentence indices across files, and writes the kept ones
+    """
+    if word_filter.sampling == "reservoir":
+        word_filter.sample(key for file in dataset_files for key in iter_dataset_keys(file))
+
+    writer = None
+    dataset_wordcount = {}
+    dataset_sentencecount = 0
+    idx = 0
+    for file_idx, file in enumerate(dataset_files):
+        print ("Loading ", file)
+        for key, activations in iter_dataset(file):
+            word, _, d_sentencecount, label_idx = get_pieces(key)
+            dataset_wordcount[word] = dataset_wordcount.get(word, 0) + 1
+            d_sentencecount = int(d_sentencecount) + dataset_sentencecount
+            if word_filter.keep(idx, word):
+                if writer is None:
+                    writer = open_dataset_writer(output_prefix, output_format, len(activations), dtype=dtype)
+                writer.append(word+"|||"+str(dataset_wordcount[word])+"|||"+str(d_sentencecount)+"|||"+label_idx, activations)
+            idx += 1
+        dataset_sentencecount += files_size[file_idx]
+
+    if writer is None:
+        print("No tokens left after filtering, no dataset written")
+        return 0
+    writer.close()
+    return writer.num_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input-file', type=str, required=True,
+                        help="comma separated -dataset.json files, .cxd datasets or <prefix>-point.npy files")
+    parser.add_argument('--frequency-file', type=str, required=True, help="JSON word counts or a .vocab.bin file")
+    parser.add_argument('--sentence-file', type=str, required=True)
+    parser.add_argument('--minimum-frequency', type=int, default=5)
+    parser.add_argument('--maximum-frequency', type=int, default=50)
+    parser.add_argument('--delete-frequency', type=int, default=500000)
+    parser.add_argument('--output-file', type=str, default="output_activatons.json")
+    parser.add_argument('--output-format', choices=['json', 'cxd', 'npy'], default='json',
+                        help="json writes <output>-dataset.json, cxd the binary <output>-dataset.cxd and "
+                             "npy <output>-point.npy with <output>-vocab.npy")
+    parser.add_argument('--dtype', choices=DTYPES, default='float32', help="activation dtype of the cxd and npy outputs")
+    parser.add_argument('--sampling', choices=['first', 'reservoir'], default='first',
+                        help="keep the first or a uniform random sample of --maximum-frequency occurrences per word")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the reservoir sampling")
+    parser.add_argument('--verbose', action='store_true', help="also list the skipped word types")
+
+    args = parser.parse_args()
+
+    datasetfiles = (args.input_file).split(',')
+    min_freq = args.minimum_frequency
+    max_freq = args.maximum_frequency
+    del_freq = args.delete_frequency
+
+    print ("Min: ", min_freq, " Max: ", max_freq, " Del: ", del_freq, " Sampling: ", args.sampling)
 
-datasetfiles = (args.input_file).split(',')
-min_freq = args.minimum_frequency
-max_freq = args.maximum_frequency
-del_freq = args.delete_frequency
+    print ("Loading frequency")
+    wordCount, num_types, num_tokens = load_frequencies(args.frequency_file)
+    print("Len of word dict: {}".format(num_types))
 
-print ("Min: ", min_freq, " Max: ", max_freq, " Del: ", del_freq)
+    files_size = copy_sentences((args.sentence_file).split(','),
+                                args.output_file+"_min_"+str(min_freq)+"_max_"+str(max_freq)+'-sentences.json')
+    print ("file sizes", dict(enumerate(files_size)))
 
-wordCount = {}
-with open(args.frequency_file) as f:
-    print ("Loading frequency")
-    wordCount = json.load(f)
-print("Len of word dict: {}".format(len(wordCount)))
-currCount = {}
-output = []
-maxskip = 0
-maxskips = set()
-minskip = 0
-minskips = set()
-delskip = 0
-delskips = set()
-
-dataset_wordcount = {}
-dataset_sentencecount = 0
-
-files_size = {}
-# concatenate all sentence files
-files = (args.sentence_file).split(',')
-sentences = []
-for idx,file in enumerate(files):
-    f = open(file)
-    filesize = 0
-    data= json.load(f)
-    for line in data:
-        sentences.append(line.strip())
-        filesize +=1
-    files_size[idx] = filesize
-print ("file sizes", files_size)
-
-with open(args.output_file+"_min_"+str(min_freq)+"_max_"+str(max_freq)+'-sentences.json', 'w') as fp:
-    json.dump(sentences, fp, ensure_ascii=False)
-
-for idx, file in enumerate(datasetfiles):
-    print ("Loading ", file)
-    with open(file) as f:
-        dataset = json.load(f)
-        for entry in dataset:
-            #print ("Old entry", entry[0])
-            word, d_wordcount, d_sentencecount, label_idx = get_pieces(entry[0])
-            #word, d_wordcount, d_sentencecount, label_idx = entry[0].split('|||')
-            d_sentencecount = int(d_sentencecount)
-            #print (word, d_wordcount, d_sentencecount, label_idx)
-            if word in dataset_wordcount:
-                dataset_wordcount[word] +=1
-            else:
-                dataset_wordcount[word] = 1
-            d_sentencecount += dataset_sentencecount
-            entry = (word+"|||"+str(dataset_wordcount[word])+"|||"+str(d_sentencecount)+"|||"+label_idx, entry[1])
-            #print ("New entry", entry)
-            if word in wordCount and wordCount[word] > del_freq: # skipping most frequent words
-                print("Delete word {}".format(word))
-                delskip +=1
-                delskips.add(word)
-                continue
-            if word in wordCount and wordCount[word] >= min_freq:
-                if word in currCount:
-                    if currCount[word] <max_freq:
-                        output.append(entry)
-                        currCount[word] += 1
-                    else:
-                        print ("Crossed max frequency :", entry[0])
-                        maxskip +=1
-                        maxskips.add(word)
-                else:
-                    currCount[word] = 1
-                    output.append(entry)
-            else:
-                print ("Skipping word with low frequency: ", entry[0])
-                minskip +=1
-                minskips.add(word)
-    dataset_sentencecount += files_size[idx]
+    word_filter = FrequencyFilter(wordCount, min_freq, max_freq, del_freq, sampling=args.sampling, seed=args.seed)
+    output_prefix = args.output_file+"_min_"+str(min_freq)+"_max_"+str(max_freq)+"_del_"+str(del_freq)
+    print("Writing datasets...")
+    kept = filter_datasets(datasetfiles, files_size, word_filter, output_prefix, args.output_format, args.dtype)
 
-print("Writing datasets...")
-with open(args.output_file+"_min_"+str(min_freq)+"_max_"+str(max_freq)+"_del_"+str(del_freq)+"-dataset.json", 'w') as fp:
-    json.dump(output, fp, ensure_ascii=False)
+    if args.verbose:
+        print ("Limit Max types: ", word_filter.maxskips)
+        print ("Skipped Min types: ", word_filter.minskips)
+        print ("Skipped frequent types: ", word_filter.delskips)
 
+    print ("Total word types before dropping: ", num_types)
+    print ("Total word tokens before dropping: ", num_tokens)
 
-print ("Limit Max types: ", maxskips)
-print ("Skipped Min types: ", minskips)
-print ("Skipped frequent types: ", delskips)
+    print ("Tokens kept: ", kept)
+    print ("Tokens skipped based on Max freq: ", word_filter.maxskip)
+    print ("Tokens skipped based on Min freq: ", word_filter.minskip)
+    print ("Tokens skipped based on Del freq: ", word_filter.delskip)
+    print ("Types skipped based on Max freq: ", len(word_filter.maxskips))
+    print ("Types skipped based on Min freq: ", len(word_filter.minskips))
+    print ("Types skipped based on Del freq: ", len(word_filter.delskips))
 
-print ("Total word types before dropping: ", len(wordCount))
-print ("Total word tokens before dropping: ", sum(wordCount.values()))
+    print ("Remaining Tokens: ", num_tokens - word_filter.maxskip - word_filter.minskip - word_filter.delskip)
+    print ("Remaining Types: ", num_types - len(word_filter.minskips) - len(word_filter.delskips))
 
-print ("Tokens skipped based on Max freq: ", maxskip)
-print ("Tokens skipped based on Min freq: ", minskip)
-print ("Tokens skipped based on Del freq: ", delskip)
-print ("Types skipped based on Max freq: ", len(maxskips))
-print ("Types skipped based on Min freq: ", len(minskips))
-print ("Types skipped based on Del freq: ", len(delskips))
 
-print ("Remaining Tokens: ", sum(wordCount.values()) - maxskip - minskip - delskip)
-print ("Remaining Types: ", len(wordCount) - len(minskips) - len(delskips))
+if __name__ == '__main__':
+    main()
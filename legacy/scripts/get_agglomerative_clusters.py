@@ -1,12 +1,13 @@
 import numpy as np
-from sklearn.cluster import AgglomerativeClustering
-from collections import defaultdict
-from sklearn.decomposition import PCA
-from sklearn import manifold
+import os
+import sys
 import time
-import codecs
 import argparse
-import dill as pickle
+
+# Cut the tree with the clustering package at the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from clustering.agglomerative import build_linkage, cut_linkage_many
+from clustering.writer import write_clusters
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--vocab-file","-v", help="output vocab file with complete path")
@@ -23,7 +24,7 @@ outputpath = args.output_path
 
 Ks = [int(k) for k in args.cluster.split(',')]
 print ("Cluster input ",Ks)
-if range:
+if args.range:
 	tmp = list(range(Ks[0], Ks[1]+1, Ks[2]))
 	Ks = tmp
 
@@ -31,30 +32,20 @@ print ("Run for the following cluster sizes", Ks)
 
 vocab = np.load(vocab_file)
 points = np.load(point_file)
-			
-for K in Ks:
-	starttime = time.time()
-	print("Perform "+str(K)+" Clustering!")
-	clustering = AgglomerativeClustering(n_clusters=K,compute_distances=True).fit(points)
-
-	fn = outputpath+'/model-'+str(K)+'-agglomerative-clustering.pkl'
-	with open(f"{fn}", "wb") as fp:
-		pickle.dump(clustering,fp)
-		#np.save(fn,clustering)
-				
-	clusters = defaultdict(list)
-	for i,label in enumerate(clustering.labels_):
-		clusters[clustering.labels_[i]].append(vocab[i])
-
-	print("Write "+str(K)+" Clusters!")	
-	target = open(outputpath+'/clusters-'+str(K)+'.txt','w')
-				
+
+# Ward's tree does not depend on K: build it once and cut it for every K
+starttime = time.time()
+print("Build Ward linkage!")
+linkage_matrix = build_linkage(points, outputpath)
+print("Linkage: Time-taken: "+str(time.time()-starttime)+" sec")
+
+starttime = time.time()
+for K, labels in cut_linkage_many(linkage_matrix, sorted(Ks)):
+	print("Write "+str(K)+" Clusters!")
 	#Write Clusters	 (Word|||WordID|||SentID|||TokenID|||ClusterID)
-	for key in clusters.keys():
-		for word in clusters[key]:
-			target.write(word+"|||"+str(key)+"\n")
-	target.close()
-				
+	write_clusters(vocab, labels, outputpath+'/clusters-'+str(K)+'.txt')
+
 	endtime = time.time()
 	diff = endtime-starttime
 	print(str(K)+": Time-taken: "+str(diff)+" sec")
+	starttime = endtime
@@ -1,46 +1,123 @@
 from argparse import ArgumentParser
+from itertools import islice
+
+import torch
 from transformers import AutoTokenizer, AutoModelForTokenClassification, TokenClassificationPipeline
 
+def first_subword_positions(word_ids, num_words):
+	"""
+	Returns the position of the first subword of every word given the
+	word_ids() of its encoding, -1 for words that were truncated away
+	"""
+	positions = [-1] * num_words
+	for position, word_idx in enumerate(word_ids):
+		if word_idx is not None and positions[word_idx] < 0:
+			positions[word_idx] = position
+	return positions
+
+def load_word_tokenizer(model_name):
+	"""
+	Loads the fast tokenizer of <model_name> for pre-split words: word_ids() needs a
+	fast tokenizer, and byte-level BPE models (RoBERTa, GPT-2) only accept pre-split
+	words with add_prefix_space
+	"""
+	tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True, add_prefix_space=True)
+	if not tokenizer.is_fast:
+		raise ValueError(f"{model_name} has no fast tokenizer, which batched labelling needs to map subwords to words; "
+			"use --pipeline instead")
+	return tokenizer
+
+def label_sentences(model, tokenizer, sentences, batch_size=32):
+	"""
+	Labels every word of <sentences> (lists of words) with the prediction for its
+	first subword. Sentences are tokenized once, run through the model in batches
+	of similar length and returned in their original order
+	"""
+	encodings = tokenizer(sentences, is_split_into_words=True, truncation=True)
+	id2label = model.config.id2label
+	order = sorted(range(len(sentences)), key=lambda i: len(encodings["input_ids"][i]))
+	labels = [None] * len(sentences)
+
+	for start in range(0, len(order), batch_size):
+		batch_idx = order[start:start + batch_size]
+		features = [{key: encodings[key][i] for key in encodings.keys()} for i in batch_idx]
+		batch = tokenizer.pad(features, return_tensors="pt")
+		with torch.no_grad():
+			predictions = model(**batch).logits.argmax(dim=-1).tolist()
+
+		for i, prediction in zip(batch_idx, predictions):
+			positions = first_subword_positions(encodings.word_ids(i), len(sentences[i]))
+			if min(positions, default=0) < 0:
+				raise ValueError(f"Sentence {i} is longer than the model's maximum input length")
+			labels[i] = [id2label[prediction[position]] for position in positions]
+	return labels
+
+def label_with_pipeline(pipeline, tokenizer, fp, ofp):
+	"""
+	Labels one line at a time through a TokenClassificationPipeline
+	"""
+	for line_idx, line in enumerate(fp):
+		line = line.strip()
+		print(f"Line {line_idx}: {line[:80]}")
+		outputs = pipeline(line)
+
+		original_tokens = line.split(" ")
+
+		# Pick first per subword
+		idx_to_pick = []
+		current_idx = 0
+		for token in original_tokens:
+			idx_to_pick.append(current_idx)
+			current_idx += len(tokenizer.tokenize(token))
+
+		labels = []
+		for word_idx, label_idx in enumerate(idx_to_pick):
+			token_prediction = outputs[label_idx]
+			assert original_tokens[word_idx].startswith(token_prediction["word"]), \
+				f"Original word: {original_tokens[word_idx]}, First subword: {token_prediction['word']}"
+		
+			labels.append(token_prediction["entity"])
+
+		assert len(labels) == len(original_tokens)
+		
+		ofp.write(" ".join(labels) + "\n")
+
 def main():
 	parser = ArgumentParser()
 	parser.add_argument("model_name", help="Model identifier")
 	parser.add_argument("sentence_file", help="Path to a file with one sentence per line")
 	parser.add_argument("output_file", help="Path to output file with one labels for every token in the sentence_file")
+	parser.add_argument("--batch-size", type=int, default=32, help="Sentences per forward pass")
+	parser.add_argument("--sort-window", type=int, default=100,
+		help="Number of batches read at once and sorted by length before batching")
+	parser.add_argument("--pipeline", action="store_true",
+		help="Label one line at a time with TokenClassificationPipeline instead of batching")
 
 	args = parser.parse_args()
 
-	# Load model and build pipeline
-	tokenizer = AutoTokenizer.from_pretrained(args.model_name)
+	# Load model
 	model = AutoModelForTokenClassification.from_pretrained(args.model_name)
-	pipeline = TokenClassificationPipeline(model, tokenizer, ignore_labels=[])
+	model.eval()
 
 	with open(args.sentence_file) as fp, \
 		open(args.output_file, "w") as ofp:
-		for line_idx, line in enumerate(fp):
-			line = line.strip()
-			print(f"Line {line_idx}: {line[:80]}")
-			outputs = pipeline(line)
-
-			original_tokens = line.split(" ")
-
-			# Pick first per subword
-			idx_to_pick = []
-			current_idx = 0
-			for token in original_tokens:
-				idx_to_pick.append(current_idx)
-				current_idx += len(tokenizer.tokenize(token))
-
-			labels = []
-			for word_idx, label_idx in enumerate(idx_to_pick):
-				token_prediction = outputs[label_idx]
-				assert original_tokens[word_idx].startswith(token_prediction["word"]), \
-					f"Original word: {original_tokens[word_idx]}, First subword: {token_prediction['word']}"
-			
-				labels.append(token_prediction["entity"])
-
-			assert len(labels) == len(original_tokens)
-			
-			ofp.write(" ".join(labels) + "\n")
+		if args.pipeline:
+			tokenizer = AutoTokenizer.from_pretrained(args.model_name)
+			pipeline = TokenClassificationPipeline(model, tokenizer, ignore_labels=[])
+			label_with_pipeline(pipeline, tokenizer, fp, ofp)
+			return
+
+		tokenizer = load_word_tokenizer(args.model_name)
+
+		num_lines = 0
+		while True:
+			window = [line.strip().split(" ") for line in islice(fp, args.batch_size * args.sort_window)]
+			if not window:
+				break
+			for labels in label_sentences(model, tokenizer, window, args.batch_size):
+				ofp.write(" ".join(labels) + "\n")
+			num_lines += len(window)
+			print(f"Labelled {num_lines} lines")
 
 if __name__ == '__main__':
-	main()
\ No newline at end of file
+	main()
@@ -0,0 +1,78 @@
+# tests/test_artifacts.py
+import os
+import unittest
+import tempfile
+import importlib.util
+import numpy as np
+from clustering.artifacts import save_artifact, load_artifact, read_cluster_file, FORMAT_VERSION
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_tool(name, path):
+    """Import a standalone tool module by file path, as running it from its own directory would."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class TestArtifacts(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vocab = np.array([f"wörd{i}|||1|||{i}|||0" for i in range(50)])
+        self.labels = rng.integers(0, 5, size=50)
+        self.children = np.stack([np.arange(49), np.arange(1, 50)], axis=1)
+        self.distances = np.linspace(0, 1, 49)
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            path = save_artifact(os.path.join(output_path, "model.npz"), self.labels, self.vocab,
+                                 self.children, self.distances, {"n_clusters": 5})
+            artifact = load_artifact(path)
+
+            self.assertEqual(artifact.version, FORMAT_VERSION)
+            self.assertIsInstance(artifact.labels, np.memmap)
+            self.assertEqual(artifact.labels.dtype, np.int32)
+            np.testing.assert_array_equal(artifact.labels, self.labels)
+            np.testing.assert_array_equal(artifact.children, self.children)
+            np.testing.assert_array_equal(artifact.distances, self.distances)
+            self.assertEqual(artifact.params, {"n_clusters": 5})
+            self.assertEqual(artifact.vocab(), list(self.vocab))
+            self.assertEqual(artifact.key(7), self.vocab[7])
+            self.assertEqual(artifact.cluster_lines()[3], f"{self.vocab[3]}|||{self.labels[3]}")
+            np.testing.assert_array_equal(artifact.clusters()[2], np.flatnonzero(self.labels == 2))
+            del artifact
+
+    def test_optional_members(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            artifact = load_artifact(save_artifact(os.path.join(output_path, "model.npz"), self.labels))
+            self.assertIsNone(artifact.children)
+            self.assertEqual(artifact.vocab(), [])
+            self.assertEqual(artifact.params, {})
+            del artifact
+
+    def test_read_cluster_file(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            cluster_file = os.path.join(output_path, "clusters-5.txt")
+            with open(cluster_file, 'w', encoding='utf-8') as f:
+                f.write("\n".join(f"{key}|||{label}" for key, label in zip(self.vocab, self.labels)))
+            vocab, labels = read_cluster_file(cluster_file)
+        self.assertEqual(vocab, list(self.vocab))
+        np.testing.assert_array_equal(labels, self.labels)
+
+    def test_tools_read_artifacts(self):
+        alignment = load_tool("alignment_updated", "alignment/alignment_updated.py")
+        annotation = load_tool("annotation_utils", "annotation/TransformersConceptNet_Visualization/utils.py")
+        with tempfile.TemporaryDirectory() as output_path:
+            cluster_file = os.path.join(output_path, "clusters-5.txt")
+            with open(cluster_file, 'w', encoding='utf-8') as f:
+                f.write("".join(f"{key}|||{label}\n" for key, label in zip(self.vocab, self.labels)))
+            artifact_file = save_artifact(os.path.join(output_path, "clusters-5.npz"), self.labels, self.vocab)
+
+            self.assertEqual(alignment.load_clusters(artifact_file), alignment.load_clusters(cluster_file))
+            self.assertEqual(annotation.cluster_read(artifact_file), annotation.cluster_read(cluster_file))
+            self.assertEqual(annotation.load_all_cluster_data(artifact_file),
+                             annotation.load_all_cluster_data(cluster_file))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+# tests/test_benchmark.py
+import unittest
+import tempfile
+from clustering.benchmark import run_benchmarks, load_results, compare_results
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run_and_compare(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            records = run_benchmarks([300], ['agglomerative', 'leaders-exact'], output_path, num_dims=16, num_clusters=4,
+                                     time_budget=120, generator='blobs')
+            self.assertEqual([r["status"] for r in records], ['ok', 'ok'])
+            for record in records:
+                self.assertGreater(record["ari"], 0.9)
+                self.assertIn("fit", record["phases"])
+                self.assertGreater(record["peak_rss_mb"], 0)
+
+            # An impossible memory budget kills the run and skips the backend at larger sizes
+            over_budget = run_benchmarks([200, 300], ['agglomerative'], output_path, f"{output_path}/small.jsonl",
+                                         num_dims=16, num_clusters=4, memory_budget=1)
+            self.assertEqual([r["status"] for r in over_budget], ['memory', 'skipped'])
+
+            results = load_results(f"{output_path}/results.jsonl")
+        self.assertEqual(compare_results(results, results), [])
+
+        slower = {key: dict(record, seconds=record["seconds"] * 2 + 1, ari=record["ari"] - 0.1)
+                  for key, record in results.items()}
+        regressions = compare_results(slower, results)
+        self.assertEqual(len(regressions), 4)
+        failed = {key: dict(record, status='timeout') for key, record in results.items()}
+        self.assertEqual(len(compare_results(failed, results)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,12 @@
+# tests/test_cli.py
+import unittest
+from clustering.cli import parse_cluster_sizes
+
+class TestCli(unittest.TestCase):
+
+    def test_parse_cluster_sizes(self):
+        self.assertEqual(parse_cluster_sizes("5,10,15"), [5, 10, 15])
+        self.assertEqual(parse_cluster_sizes("5,20,5", is_range=True), [5, 10, 15, 20])
+
+if __name__ == '__main__':
+    unittest.main()
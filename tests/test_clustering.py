@@ -1,7 +1,14 @@
 # tests/test_clustering.py
 import unittest
+import os
+import tempfile
+from unittest import mock
 import numpy as np
-from clustering.agglomerative import perform_agglomerative_clustering, create_linkage_matrix
+from scipy.cluster.hierarchy import fcluster
+from clustering import agglomerative
+from clustering.agglomerative import perform_agglomerative_clustering, create_linkage_matrix, build_linkage, cut_linkage, agglomerative_sweep, exact_knn, build_sparse_linkage
+from clustering.artifacts import load_artifact
+from clustering.label_mapping import map_labels
 
 class TestClustering(unittest.TestCase):
 
@@ -22,5 +29,62 @@ class TestClustering(unittest.TestCase):
         # Test linkage matrix shape
         self.assertEqual(linkage_matrix.shape, (99, 4))
 
+    def test_cut_linkage(self):
+        points = np.random.rand(200, 5)
+        linkage_matrix = build_linkage(points)
+
+        for K in [1, 2, 7, 50, 200]:
+            labels = cut_linkage(linkage_matrix, K)
+            self.assertEqual(len(set(labels)), K)
+            # Same partition as scipy's maxclust criterion
+            scipy_labels = fcluster(linkage_matrix, t=K, criterion='maxclust') - 1
+            np.testing.assert_array_equal(map_labels(labels, scipy_labels), scipy_labels)
+
+    def test_agglomerative_sweep(self):
+        points = np.random.rand(50, 5)
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(50)])
+        with tempfile.TemporaryDirectory() as output_path:
+            cluster_files = agglomerative_sweep(points, vocab, [2, 5, 10], output_path)
+
+            self.assertTrue(os.path.exists(f"{output_path}/agg_linkage_matrix.npy"))
+            for K, cluster_file in zip([2, 5, 10], cluster_files):
+                with open(cluster_file) as f:
+                    lines = f.read().splitlines()
+                self.assertEqual(len(lines), 50)
+                self.assertEqual(len({line.split("|||")[-1] for line in lines}), K)
+
+    def test_agglomerative_cluster(self):
+        points = np.random.rand(50, 5)
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(50)])
+        with tempfile.TemporaryDirectory() as output_path, \
+                mock.patch.object(agglomerative, "output_file", os.path.join(output_path, "log.txt")):
+            labels, linkage_matrix = agglomerative.agglomerative_cluster(points, vocab, 5, output_path)
+
+            np.testing.assert_allclose(linkage_matrix, np.load(f"{output_path}/agg_linkage_matrix.npy"))
+            np.testing.assert_array_equal(map_labels(fcluster(linkage_matrix, t=5, criterion='maxclust'), labels), labels)
+            artifact = load_artifact(f"{output_path}/model-5-agglomerative-clustering.npz")
+            np.testing.assert_array_equal(artifact.labels, labels)
+            np.testing.assert_array_equal(artifact.children, linkage_matrix[:, :2])
+            del artifact
+
+    def test_exact_knn(self):
+        points = np.random.rand(100, 5)
+        neighbors = exact_knn(points, 4, block_size=16)
+
+        dist = ((points[:, None] - points[None, :]) ** 2).sum(-1)
+        np.fill_diagonal(dist, np.inf)
+        np.testing.assert_array_equal(neighbors, dist.argsort(axis=1)[:, :4])
+
+    def test_build_sparse_linkage(self):
+        points = np.random.rand(100, 5)
+        linkage_matrix = build_sparse_linkage(points, n_neighbors=5)
+
+        self.assertEqual(linkage_matrix.shape, (99, 4))
+        self.assertEqual(linkage_matrix[-1, 3], 100)
+        self.assertEqual(len(set(cut_linkage(linkage_matrix, 8))), 8)
+
+        # A complete connectivity graph gives the unconstrained Ward tree
+        np.testing.assert_allclose(np.sort(build_sparse_linkage(points, n_neighbors=99)[:, 2]), build_linkage(points)[:, 2])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,29 @@
+# tests/test_create_data_multi_layer.py
+import os
+import sys
+import unittest
+import importlib.util
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "legacy", "scripts"))
+
+@unittest.skipUnless(importlib.util.find_spec("neurox"), "the legacy data scripts need NeuroX")
+class TestCreateDataMultiLayer(unittest.TestCase):
+
+    def test_float_layer_count(self):
+        from create_data_multi_layer import load_layer_activations, parse_layers
+
+        class JsonLoader:
+            # NeuroX returns the layer count of json activation files as a float
+            def load_activations(self, activation_file, num_neurons_per_layer=None):
+                return [np.zeros((3, 13 * 4), dtype=np.float32)], 13.0
+
+        activations, num_layers, hidden_size = load_layer_activations("activations.json", loader=JsonLoader())
+        self.assertEqual((num_layers, hidden_size), (13, 4))
+        self.assertIsInstance(num_layers, int)
+        self.assertIsInstance(hidden_size, int)
+        self.assertEqual(parse_layers(None, 13.0), list(range(13)))
+        self.assertEqual(parse_layers("0-2,12", num_layers), [0, 1, 2, 12])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# tests/test_dedup.py
+import unittest
+import tempfile
+import numpy as np
+from scipy.cluster.hierarchy import linkage
+import os
+from clustering.dedup import (collapse_exact_duplicates, collapse_near_duplicates, deduplicate, expand_labels, load_dedup,
+                              expand_members)
+from clustering.agglomerative import weighted_ward_linkage, dedup_agglomerative_cluster, dedup_agglomerative_sweep
+from clustering.leaders import leaders_cluster
+from clustering.writer import read_labels
+
+class TestDedup(unittest.TestCase):
+
+    def test_collapse_exact_duplicates(self):
+        points = np.array([[1.0, 2.0], [0.0, 1.0], [1.0, 2.0], [-0.0, 1.0], [1.00001, 2.0]])
+        representatives, weights, mapping = collapse_exact_duplicates(points)
+
+        self.assertEqual(len(representatives), 3)
+        np.testing.assert_array_equal(weights, [2, 2, 1])
+        np.testing.assert_array_equal(representatives[mapping][:4], points[:4])
+
+        # Rounding merges the last row as well
+        representatives, weights, mapping = collapse_exact_duplicates(points, decimals=3)
+        np.testing.assert_array_equal(weights, [3, 2])
+
+    def test_collapse_near_duplicates(self):
+        points = np.array([[0.0, 0.0], [0.05, 0.0], [1.0, 1.0], [1.0, 1.05], [0.0, 0.08]])
+        representatives, weights, mapping = collapse_near_duplicates(points, threshold=0.1, block_size=2)
+
+        np.testing.assert_array_equal(mapping, [0, 0, 1, 1, 0])
+        np.testing.assert_array_equal(weights, [3, 2])
+        np.testing.assert_array_equal(representatives, points[[0, 2]])
+
+        # The first-match order does not depend on the block size
+        points = np.random.default_rng(0).normal(size=(500, 3))
+        expected = collapse_near_duplicates(points, threshold=0.5, block_size=1)
+        for block_size in [7, 1024]:
+            for result, reference in zip(collapse_near_duplicates(points, threshold=0.5, block_size=block_size), expected):
+                np.testing.assert_array_equal(result, reference)
+
+    def test_expand_labels(self):
+        points = np.repeat(np.random.rand(20, 3), 5, axis=0)
+        representatives, weights, mapping = deduplicate(points)
+
+        self.assertEqual(len(representatives), 20)
+        labels = expand_labels(np.arange(20), mapping)
+        self.assertEqual(len(labels), 100)
+        np.testing.assert_array_equal(representatives[labels], points)
+
+    def test_dedup_agglomerative_cluster(self):
+        rng = np.random.default_rng(0)
+        unique = rng.normal(size=(40, 4)) + rng.integers(0, 3, size=(40, 1)) * 10
+        rows = rng.integers(0, 40, size=200)
+        points = unique[rows] + rng.normal(scale=1e-4, size=(200, 4))
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(200)])
+
+        with tempfile.TemporaryDirectory() as output_path:
+            labels = dedup_agglomerative_cluster(points, vocab, 3, output_path, threshold=0.01)
+            with open(f"{output_path}/clusters-agg-3.txt") as f:
+                lines = f.read().splitlines()
+            sidecar = read_labels(f"{output_path}/clusters-agg-3.txt", mmap_mode=None)
+            representatives, weights, mapping = load_dedup(output_path)
+            self.assertTrue(os.path.exists(f"{output_path}/agg_linkage_matrix.npy"))
+            cluster_files = dedup_agglomerative_sweep(points, vocab, [2, 3], output_path, threshold=0.01)
+            np.testing.assert_array_equal(read_labels(cluster_files[1], mmap_mode=None), labels)
+
+        self.assertEqual(len(representatives), len(np.unique(rows)))
+        self.assertEqual(weights.sum(), 200)
+        self.assertEqual(len(lines), 200)
+        self.assertEqual(sorted(line.split("|||")[2] for line in lines), sorted(str(i) for i in range(200)))
+        np.testing.assert_array_equal(sidecar, labels)
+        # Copies of a row share a representative, and labels are expanded through the mapping
+        self.assertEqual(len(np.unique(labels)), 3)
+        for row in np.unique(rows):
+            self.assertEqual(len(np.unique(mapping[rows == row])), 1)
+        representative_labels = np.empty(len(representatives), dtype=labels.dtype)
+        representative_labels[mapping] = labels
+        np.testing.assert_array_equal(expand_labels(representative_labels, mapping), labels)
+
+    def test_leaders_on_unique_rows(self):
+        rng = np.random.default_rng(0)
+        rows = rng.integers(0, 30, size=150)
+        points = (rng.normal(size=(30, 3)) + rng.integers(0, 3, size=(30, 1)) * 10)[rows]
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(150)])
+        representatives, weights, mapping = deduplicate(points)
+
+        with tempfile.TemporaryDirectory() as output_path:
+            cluster_file, _ = leaders_cluster(representatives, vocab, 3, output_path, tau=1.0, neighbors='exact',
+                                              mapping=mapping)
+            labels = read_labels(cluster_file, mmap_mode=None)
+            with open(cluster_file) as f:
+                self.assertEqual(len(f.read().splitlines()), 150)
+        self.assertEqual(len(np.unique(labels)), 3)
+        for row in np.unique(rows):
+            self.assertEqual(len(np.unique(labels[rows == row])), 1)
+
+        members = expand_members([np.array([1, 0]), np.array([2])], np.array([0, 2, 1, 0, 2]))
+        self.assertEqual([m.tolist() for m in members], [[0, 2, 3], [1, 4]])
+
+    def test_weighted_ward_linkage(self):
+        points = np.random.rand(30, 4)
+        weights = np.random.randint(1, 4, 30)
+
+        # Unit weights reproduce scipy's Ward linkage
+        np.testing.assert_allclose(weighted_ward_linkage(points, np.ones(30))[:, 2], linkage(points, method='ward')[:, 2])
+
+        # Weights behave like repeated rows
+        expanded = linkage(np.repeat(points, weights, axis=0), method='ward')
+        np.testing.assert_allclose(weighted_ward_linkage(points, weights)[:, 2], expanded[-29:, 2])
+
+if __name__ == '__main__':
+    unittest.main()
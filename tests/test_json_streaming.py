@@ -0,0 +1,66 @@
+# tests/test_json_streaming.py
+import os
+import sys
+import json
+import unittest
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "legacy", "scripts"))
+from concept_dataset import iter_json_array, NpyRowWriter
+from extract_data import convert_json_dataset
+
+class TestJsonStreaming(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # numbers of varying length so elements straddle the read buffer boundaries
+        self.entries = [[f"w{i}|||{i % 3 + 1}|||{i // 4}|||{i % 4}", (rng.normal(size=6) * 10.0 ** rng.integers(-3, 4)).tolist()]
+                        for i in range(23)]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_file = os.path.join(self.tmp_dir.name, "layer-dataset.json")
+        with open(self.json_file, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_iter_json_array(self):
+        with open(self.json_file) as f:
+            expected = json.load(f)
+        for buffer_size in [1, 7, 1 << 20]:
+            with open(self.json_file) as f:
+                self.assertEqual(list(iter_json_array(f, buffer_size=buffer_size)), expected)
+        for text in ["[]", " [ 1 , 2.5e-3 ,\n\"a\" ] "]:
+            with tempfile.TemporaryFile("w+") as f:
+                f.write(text)
+                f.seek(0)
+                self.assertEqual(list(iter_json_array(f, buffer_size=2)), json.loads(text))
+
+    def test_npy_row_writer(self):
+        rows = np.random.default_rng(1).normal(size=(10, 4)).astype(np.float32)
+        point_file = os.path.join(self.tmp_dir.name, "point.npy")
+        expected_file = os.path.join(self.tmp_dir.name, "expected.npy")
+        with NpyRowWriter(point_file, 4) as writer:
+            for start in range(0, 10, 3):
+                writer.write(rows[start:start + 3])
+        np.save(expected_file, rows)
+
+        np.testing.assert_array_equal(np.load(point_file, mmap_mode='r'), np.load(expected_file))
+        with open(point_file, 'rb') as f, open(expected_file, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_convert_json_dataset(self):
+        point_file = os.path.join(self.tmp_dir.name, "layer-point.npy")
+        vocab_file = os.path.join(self.tmp_dir.name, "layer-vocab.npy")
+        num_rows = convert_json_dataset(self.json_file, point_file, vocab_file, chunk_size=5)
+
+        # what json.load + np.save produce
+        with open(self.json_file) as f:
+            data = json.load(f)
+        self.assertEqual(num_rows, len(data))
+        np.testing.assert_array_equal(np.load(point_file), np.array([a for _, a in data], dtype=np.float32))
+        np.testing.assert_array_equal(np.load(vocab_file), np.array([k for k, _ in data]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# tests/test_kmeans.py
+import unittest
+import tempfile
+import numpy as np
+import os
+from clustering.kmeans import streaming_kmeans, assign_labels, streaming_kmeans_cluster, warm_start_centers, elbow_k, kmeans_sweep
+from clustering.writer import read_labels
+
+class TestKMeans(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(5, 6)) * 10
+        self.truth = rng.integers(0, 5, size=2000)
+        self.points = (centers[self.truth] + rng.normal(size=(2000, 6))).astype(np.float32)
+
+    def test_assign_labels(self):
+        centers = self.points[:7]
+        labels, inertia = assign_labels(self.points, centers, block_size=300)
+
+        dist_sq = ((self.points[:, None].astype(np.float64) - centers[None]) ** 2).sum(axis=2)
+        np.testing.assert_array_equal(labels, dist_sq.argmin(axis=1))
+        self.assertAlmostEqual(inertia / dist_sq.min(axis=1).sum(), 1, places=4)
+
+    def test_streaming_kmeans_from_memmap(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            np.save(f"{output_path}/point.npy", self.points)
+            points = np.load(f"{output_path}/point.npy", mmap_mode='r')
+            model, labels = streaming_kmeans(points, 5, batch_size=256, max_iter=3, init_sample=500, keep_labels=True)
+            final_labels, _ = assign_labels(points, model.cluster_centers_)
+
+        # Each true blob maps to exactly one cluster
+        for blob_labels in [labels, final_labels]:
+            self.assertEqual(len(set(zip(self.truth, blob_labels))), 5)
+
+    def test_streaming_kmeans_cluster(self):
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(2000)])
+        with tempfile.TemporaryDirectory() as output_path:
+            cluster_file = streaming_kmeans_cluster(self.points, vocab, 5, output_path, batch_size=512, max_iter=2)
+            self.assertEqual(cluster_file, f"{output_path}/clusters-kmeans-5.txt")
+            with open(cluster_file) as f:
+                out = f.read()
+            labels = read_labels(cluster_file, mmap_mode=None)
+        self.assertEqual(len(out.split()), 2000)
+        self.assertEqual(labels.dtype, np.int32)
+        self.assertEqual(int(out.split()[0].split("|||")[-1]), labels[int(out.split()[0].split("|||")[2])])
+
+    def test_warm_start_centers(self):
+        centers = self.points[:4].astype(np.float64)
+        grown = warm_start_centers(centers, self.points, 6)
+        self.assertEqual(grown.shape, (6, 6))
+        self.assertLess(assign_labels(self.points, grown)[1], assign_labels(self.points, centers)[1])
+
+        shrunk = warm_start_centers(grown, self.points, 3)
+        self.assertEqual(shrunk.shape, (3, 6))
+
+    def test_elbow_k(self):
+        self.assertEqual(elbow_k([2, 3, 4, 5, 6], [100, 40, 10, 8, 7]), 4)
+
+    def test_kmeans_sweep(self):
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(2000)])
+        with tempfile.TemporaryDirectory() as output_path:
+            rows = kmeans_sweep(self.points, vocab, [7, 3, 5], output_path, silhouette_sample=500)
+
+            self.assertEqual([r["K"] for r in rows], [3, 5, 7])
+            for K in [3, 5, 7]:
+                self.assertTrue(os.path.exists(f"{output_path}/clusters-kmeans-{K}.txt"))
+            with open(f"{output_path}/kmeans-sweep.tsv") as f:
+                table = [line.split("\t") for line in f.read().split("\n") if line]
+        self.assertEqual(table[0], ["K", "inertia", "n_iter", "seconds", "silhouette", "elbow"])
+        self.assertEqual(len(table), 4)
+        # The five blobs give the best silhouette
+        self.assertEqual(max(rows, key=lambda r: r["silhouette"])["K"], 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 # tests/test_label_mapping.py
 import unittest
 import numpy as np
-from clustering.label_mapping import map_labels
+from scipy import sparse
+from clustering.label_mapping import map_labels, contingency_table, _match
 
 class TestLabelMapping(unittest.TestCase):
 
@@ -15,5 +16,51 @@ class TestLabelMapping(unittest.TestCase):
         # Check if they are mapped correctly
         self.assertTrue(np.array_equal(mapped_scipy_labels, sklearn_labels))
 
+    def test_map_labels_non_contiguous(self):
+        sklearn_labels = np.array([0, 5, 5, 0, 9, 9, 9])
+        scipy_labels = np.array([-3, 40, 40, -3, 7, 7, 40])
+
+        mapped_scipy_labels, score = map_labels(scipy_labels, sklearn_labels, return_score=True)
+        np.testing.assert_array_equal(mapped_scipy_labels, [0, 5, 5, 0, 9, 9, 5])
+        self.assertAlmostEqual(score, 6 / 7)
+
+    def test_map_labels_different_sizes(self):
+        # The unmatched scipy label gets a new label above the sklearn ones
+        mapped_scipy_labels = map_labels(np.array([1, 1, 2, 2, 3]), np.array([4, 4, 8, 8, 8]))
+        np.testing.assert_array_equal(mapped_scipy_labels, [4, 4, 8, 8, 9])
+
+    def test_sparse_contingency_table(self):
+        rng = np.random.default_rng(0)
+        sklearn_labels = rng.integers(0, 3000, size=20000)
+        permutation = rng.permutation(3000) * 7 + 11
+        scipy_labels = permutation[sklearn_labels]
+
+        table, _, _, _ = contingency_table(scipy_labels, sklearn_labels, dense_cells=1000)
+        self.assertTrue(hasattr(table, 'tocsr'))
+        self.assertEqual(table.sum(), 20000)
+        row_ind, col_ind = _match(table)
+        self.assertEqual(table[row_ind, col_ind].sum(), 20000)
+
+        mapped_scipy_labels, score = map_labels(scipy_labels, sklearn_labels, return_score=True)
+        np.testing.assert_array_equal(mapped_scipy_labels, sklearn_labels)
+        self.assertEqual(score, 1.0)
+
+    def test_sparse_match_is_max_weight(self):
+        # a-x=10, a-y=1, b-x=1: the best assignment keeps a-x and leaves b unmatched
+        table = np.array([[10, 1], [1, 0]])
+        for t in [table, sparse.csr_matrix(table)]:
+            row_ind, col_ind = _match(t)
+            self.assertEqual(np.asarray(t[row_ind, col_ind]).sum(), 10)
+
+        # non-square, non-diagonal tables with unobserved pairs
+        rng = np.random.default_rng(0)
+        for shape in [(7, 4), (5, 9), (12, 12)]:
+            table = rng.integers(0, 20, size=shape) * (rng.random(shape) < 0.4)
+            dense_rows, dense_cols = _match(table)
+            sparse_rows, sparse_cols = _match(sparse.csr_matrix(table))
+            self.assertEqual(len(set(sparse_rows)), len(sparse_rows))
+            self.assertEqual(len(set(sparse_cols)), len(sparse_cols))
+            self.assertEqual(table[sparse_rows, sparse_cols].sum(), table[dense_rows, dense_cols].sum())
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,139 @@
+# tests/test_leaders.py
+import unittest
+import tempfile
+import numpy as np
+from clustering.leaders import exact_leaders, leaders_cluster, radius_leaders, clique_centroids, clique_quality, sharded_leaders, sharded_leaders_cluster
+from clustering.leaders import coarse_shards, reconcile_boundary_cliques
+from clustering.neighbors import ExactNeighbors
+from clustering.writer import read_labels
+
+class Clique:
+    """
+    A clique of follower points for a leader point
+    """
+    def __init__(self, p, j):
+        """
+        Initialize a clique by adding the leader and its index
+        """
+        self.members = [p]
+        self.member_indices = [j]
+        self.centroid = p
+
+    def __len__(self):
+        return len(self.members)
+
+    def add(self, p, j):
+        """
+        Add a new follower to the clique and update the centroid
+        """
+        self.centroid = (self.centroid * len(self.members) + p) / (1 + len(self.members))
+        self.members.append(p)
+        self.member_indices.append(j)
+
+    def dist(self, p):
+        """
+        Returns the distance of point p to the centroid of the clique
+        """
+        return np.linalg.norm(p - self.centroid)
+
+def reference_leaders(points, tau):
+    """The original per-point, per-clique loop."""
+    cliques = []
+    for j, p in enumerate(points):
+        for c in cliques:
+            if c.dist(p) < tau:
+                c.add(p, j)
+                break
+        else:
+            cliques.append(Clique(p, j))
+    return cliques
+
+class TestLeaders(unittest.TestCase):
+
+    def test_exact_leaders_matches_reference(self):
+        rng = np.random.default_rng(0)
+        points = rng.normal(size=(600, 6)) + rng.integers(0, 4, size=(600, 1)) * 3
+
+        for tau in [1.0, 2.5]:
+            cliques = reference_leaders(points, tau)
+            centroids, counts, labels = exact_leaders(points, tau, block_size=64)
+
+            self.assertEqual(len(centroids), len(cliques))
+            np.testing.assert_array_equal(counts, [len(c) for c in cliques])
+            for c, clique in enumerate(cliques):
+                np.testing.assert_array_equal(np.flatnonzero(labels == c), clique.member_indices)
+                np.testing.assert_allclose(centroids[c], clique.centroid)
+
+    def test_leaders_cluster_fast_backends(self):
+        rng = np.random.default_rng(0)
+        points = rng.normal(size=(300, 4)) * 0.1 + rng.integers(0, 3, size=(300, 1)) * 5
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(300)])
+
+        outputs = []
+        for neighbors, neighbor_args in [('exact', {}), ('ivf', {'n_lists': 5, 'n_probe': 5})]:
+            with tempfile.TemporaryDirectory() as output_path:
+                cluster_file, tau = leaders_cluster(points, vocab, 3, output_path, tau=1.0, neighbors=neighbors,
+                                                    batch_size=32, **neighbor_args)
+                with open(cluster_file) as f:
+                    out = f.read()
+                labels = read_labels(cluster_file, mmap_mode=None)
+            lines = {line.split("|||")[2]: int(line.split("|||")[-1]) for line in out.split()}
+            self.assertEqual(len(lines), 300)
+            self.assertEqual(len(set(lines.values())), 3)
+            # the sidecar agrees with the text file
+            np.testing.assert_array_equal(labels, [lines[str(i)] for i in range(300)])
+            outputs.append(out)
+        # Probing every list makes the ivf index exact
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_sharded_leaders_matches_sequential_quality(self):
+        rng = np.random.default_rng(0)
+        points = rng.normal(size=(3000, 8)) + rng.integers(0, 10, size=(3000, 1)) * 2
+        tau = 2.5
+
+        join_order, counts, _ = radius_leaders(points, ExactNeighbors(points), tau, verbose=False)
+        sequential = clique_quality(points, np.split(join_order, np.cumsum(counts)[:-1]), clique_centroids(points, join_order, counts))
+
+        centroids, member_indices, shard_counts = sharded_leaders(points, tau, num_shards=4, workers=2)
+        sharded = clique_quality(points, member_indices, centroids)
+
+        # Every point lands in exactly one clique
+        np.testing.assert_array_equal(np.sort(np.concatenate(member_indices)), np.arange(3000))
+        self.assertEqual(len(shard_counts), 4)
+        self.assertGreaterEqual(sum(shard_counts), len(centroids))
+        self.assertLess(abs(sharded["num_cliques"] - sequential["num_cliques"]) / sequential["num_cliques"], 0.1)
+        self.assertLess(abs(sharded["mean_radius"] - sequential["mean_radius"]) / sequential["mean_radius"], 0.1)
+
+        # Probing every list makes the ivf shards exact
+        ivf_centroids, ivf_members, _ = sharded_leaders(points, tau, num_shards=4, workers=2, neighbors='ivf',
+                                                        n_lists=4, n_probe=4)
+        np.testing.assert_allclose(ivf_centroids, centroids)
+        with self.assertRaises(ValueError):
+            sharded_leaders(points, tau, num_shards=4, neighbors='annoy', save_file='shard.ann')
+
+    def test_reconcile_boundary_cliques_batches(self):
+        rng = np.random.default_rng(1)
+        points = rng.normal(size=(2000, 6))
+        shard_centroids, shards = coarse_shards(points, 4, 0)
+        clique_shards = np.concatenate([np.full(len(shard), s) for s, shard in enumerate(shards)])
+        leaders = np.concatenate(shards)
+        target = reconcile_boundary_cliques(points, shard_centroids, clique_shards, leaders, 1.0)
+        self.assertGreater((target != np.arange(len(target))).sum(), 0)
+        for batch_size in [1, 37]:
+            np.testing.assert_array_equal(
+                reconcile_boundary_cliques(points, shard_centroids, clique_shards, leaders, 1.0, batch_size), target)
+
+    def test_sharded_leaders_cluster_searches_tau(self):
+        rng = np.random.default_rng(0)
+        points = rng.normal(size=(1000, 4)) + rng.integers(0, 5, size=(1000, 1)) * 4
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(1000)])
+        with tempfile.TemporaryDirectory() as output_path:
+            _, tau, _ = sharded_leaders_cluster(points, vocab, 5, output_path, num_shards=2, workers=2,
+                                                target_cliques=100, tau_sample=1000)
+            _, quantile_tau, _ = sharded_leaders_cluster(points, vocab, 5, output_path, num_shards=2, workers=2)
+        join_order, counts, _ = radius_leaders(points, ExactNeighbors(points), tau, verbose=False)
+        self.assertLess(abs(len(counts) - 100), 10)
+        self.assertNotEqual(tau, quantile_tau)
+
+if __name__ == '__main__':
+    unittest.main()
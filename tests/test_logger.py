@@ -1,19 +1,80 @@
+# tests/test_logger.py
+import os
+import time
+import unittest
+import tempfile
 import numpy as np
-from clustering.logger import log_start_time, log_environment, log_end_time, log_cluster_summary
+from clustering.logger import (log_start_time, log_environment, log_input_data_summary, log_runtime, log_end_time,
+                               log_cluster_summary, memory_profile, RunTelemetry, phase, timed_iter, read_runs)
 
-# Simulate a clustering process
-output_file = "cluster_log.txt"
-points = np.random.rand(100, 5)
-vocab = np.array([f"word_{i}" for i in range(100)])
+class TestLogger(unittest.TestCase):
 
-# Log the environment
-log_start_time(output_file)
-log_environment(output_file)
-log_input_data_summary(points, vocab, output_file)
+    def test_text_log(self):
+        # Simulate a clustering process
+        points = np.random.rand(100, 5)
+        vocab = np.array([f"word_{i}" for i in range(100)])
+        with tempfile.TemporaryDirectory() as output_path:
+            output_file = os.path.join(output_path, "cluster_log.txt")
 
-# Simulate clusters
-clusters = {0: ["word_0", "word_1"], 1: ["word_2", "word_3"]}
-log_cluster_summary(clusters, output_file)
+            # Log the environment
+            log_start_time(output_file)
+            log_environment(output_file)
+            log_input_data_summary(points, vocab, output_file)
+            start_time = time.time()
+            log_runtime(start_time, start_time + 1.5, output_file)
 
-# End logging
-log_end_time(output_file)
+            # Simulate clusters
+            clusters = {0: ["word_0", "word_1"], 1: ["word_2", "word_3"]}
+            log_cluster_summary(clusters, output_file)
+
+            # End logging
+            log_end_time(output_file)
+
+            with open(output_file) as f:
+                log = f.read()
+        self.assertIn("Points Shape: (100, 5)", log)
+        self.assertIn("Clustering Runtime: 1.50 seconds", log)
+        self.assertIn("Cluster 1: 2 items", log)
+
+    def test_run_telemetry(self):
+        points = np.zeros((20, 3), dtype=np.float32)
+        with tempfile.TemporaryDirectory() as output_path:
+            output_file = os.path.join(output_path, "telemetry.jsonl")
+            for run_id in range(2):
+                with RunTelemetry(output_file, "test", {"K": 5, "run": run_id}) as run:
+                    run.set_input(points, ["w"] * 20)
+                    with phase("fit"):
+                        pass
+                    self.assertEqual(list(timed_iter("cut", range(3))), [0, 1, 2])
+                    with phase("fit"):
+                        pass
+            # Outside a run phases are no-ops
+            with phase("fit"):
+                pass
+            runs = read_runs(output_file)
+
+        self.assertEqual(len(runs), 2)
+        record = runs[1]
+        self.assertEqual(record["params"], {"K": 5, "run": 1})
+        self.assertEqual(record["input"], {"shape": [20, 3], "dtype": "float32", "memmap": False, "vocab_size": 20})
+        self.assertEqual(set(record["phases"]), {"fit", "cut"})
+        self.assertEqual(record["status"], "ok")
+        self.assertIn("numpy", record["environment"])
+        self.assertGreaterEqual(record["total_seconds"], record["phases"]["fit"])
+
+    def test_failed_run_is_recorded(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            output_file = os.path.join(output_path, "telemetry.jsonl")
+            with self.assertRaises(ValueError):
+                with RunTelemetry(output_file, "test"):
+                    raise ValueError("boom")
+            self.assertEqual(read_runs(output_file)[0]["status"], "ValueError")
+
+    def test_memory_profile_is_opt_in(self):
+        def f():
+            return 1
+        os.environ.pop("CONCEPTX_MEMORY_PROFILE", None)
+        self.assertIs(memory_profile(f), f)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+# tests/test_neighbors.py
+import unittest
+import numpy as np
+from clustering.neighbors import build_neighbors
+
+class TestNeighbors(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.points = rng.normal(size=(500, 8)).astype(np.float32)
+        self.queries = [0, 7, 250, 499]
+        self.dist = np.linalg.norm(self.points[self.queries, None].astype(np.float64) - self.points[None], axis=2)
+
+    def test_exact_radius_neighbors(self):
+        index = build_neighbors('exact', self.points, block_size=64)
+        for q, row, (neighbours, dists) in zip(self.queries, self.dist, index.radius_neighbors(self.queries, 3.0)):
+            self.assertEqual(neighbours[0], q)
+            self.assertEqual(set(neighbours), set(np.flatnonzero(row <= 3.0)))
+            self.assertTrue(np.all(np.diff(dists) >= 0))
+
+    def test_exact_kneighbors(self):
+        index = build_neighbors('exact', self.points, block_size=64)
+        neighbours, dists = index.kneighbors(self.queries, 5)
+        np.testing.assert_array_equal(neighbours, self.dist.argsort(axis=1)[:, :5])
+        np.testing.assert_allclose(dists, np.sort(self.dist, axis=1)[:, :5], atol=1e-5)
+
+    def test_ivf_matches_exact_when_probing_all_lists(self):
+        exact = build_neighbors('exact', self.points)
+        ivf = build_neighbors('ivf', self.points, n_lists=10, n_probe=10)
+        for (a, _), (b, _) in zip(exact.radius_neighbors(self.queries, 3.0), ivf.radius_neighbors(self.queries, 3.0)):
+            self.assertEqual(set(a), set(b))
+        np.testing.assert_array_equal(exact.kneighbors(self.queries, 5)[0], ivf.kneighbors(self.queries, 5)[0])
+
+    def test_annoy_radius_neighbors(self):
+        index = build_neighbors('annoy', self.points, n_trees=20, n_jobs=2, initial_k=4)
+        for q, row, (neighbours, dists) in zip(self.queries, self.dist, index.radius_neighbors(self.queries, 3.0)):
+            # Approximate: no false positives, and the point itself is found
+            self.assertIn(q, neighbours)
+            self.assertTrue(set(neighbours) <= set(np.flatnonzero(row <= 3.0 + 1e-5)))
+
+if __name__ == '__main__':
+    unittest.main()
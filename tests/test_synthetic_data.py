@@ -1,6 +1,7 @@
 import unittest
-from clustering.synthetic_data import generate_synthetic_data, save_synthetic_data
+from clustering.synthetic_data import generate_synthetic_data, save_synthetic_data, write_synthetic_data, generate_activations
 import numpy as np
+import tempfile
 
 class TestSyntheticData(unittest.TestCase):
 
@@ -25,5 +26,60 @@ class TestSyntheticData(unittest.TestCase):
         np.testing.assert_array_equal(points, loaded_points)
         np.testing.assert_array_equal(vocab, loaded_vocab)
 
+    def test_write_synthetic_data(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            # a chunk size that does not divide the points
+            labels = write_synthetic_data(f"{output_path}/points.npy", f"{output_path}/vocab.npy", num_points=250,
+                                          num_dims=8, num_clusters=3, center_scale=10.0, chunk_size=64)
+            points = np.load(f"{output_path}/points.npy")
+            vocab = np.load(f"{output_path}/vocab.npy")
+
+        self.assertEqual(points.shape, (250, 8))
+        self.assertEqual(points.dtype, np.float32)
+        self.assertEqual(vocab[249], "word_249|||1|||249|||0")
+        self.assertEqual(labels.shape, (250,))
+        # points of a blob are much closer to their own mean than to the other blobs' means
+        means = np.array([points[labels == c].mean(axis=0) for c in range(3)])
+        nearest = ((points[:, None] - means[None]) ** 2).sum(-1).argmin(axis=1)
+        np.testing.assert_array_equal(nearest, labels)
+
+    def test_generate_activations(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            labels = generate_activations(f"{output_path}/points.npy", f"{output_path}/vocab.npy", num_points=3000,
+                                          num_dims=16, num_clusters=3, vocab_size=200, anisotropy=4.0, rank=4,
+                                          center_scale=20.0, mean_sentence_length=10, chunk_size=1000)
+            points = np.load(f"{output_path}/points.npy")
+            vocab = np.load(f"{output_path}/vocab.npy")
+
+        self.assertEqual(points.shape, (3000, 16))
+        self.assertEqual(labels.shape, (3000,))
+        keys = [key.split("|||") for key in vocab]
+        words = [word for word, _, _, _ in keys]
+
+        # counts number the occurrences of each word 1, 2, 3, ... in data order
+        pairs = [(word, int(count)) for word, count, _, _ in keys]
+        self.assertEqual(len(set(pairs)), len(pairs))
+        seen = {}
+        for word, count in pairs:
+            seen[word] = seen.get(word, 0) + 1
+            self.assertEqual(count, seen[word])
+
+        # word frequencies follow Zipf's law
+        frequencies = {word: words.count(word) for word in set(words)}
+        self.assertGreater(frequencies["word0"], 5 * frequencies.get("word20", 0))
+
+        # tokens are numbered within consecutive sentences
+        sentences = np.array([int(s) for _, _, s, _ in keys])
+        tokens = np.array([int(t) for _, _, _, t in keys])
+        self.assertTrue(np.all(np.diff(sentences) >= 0))
+        self.assertTrue(np.all(tokens[np.flatnonzero(np.diff(sentences)) + 1] == 0))
+        self.assertTrue(np.all(np.diff(tokens)[np.diff(sentences) == 0] == 1))
+
+        # each concept spreads anisotropically around its centre: 4 axes up to 4x the noise
+        stds = np.linalg.svd(points[labels == 0] - points[labels == 0].mean(axis=0), compute_uv=False)
+        stds /= np.sqrt((labels == 0).sum())
+        self.assertGreater(stds[0], 3 * stds[-1])
+        self.assertLess(stds[4], 1.5 * stds[-1])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+# tests/test_tau.py
+import os
+import json
+import unittest
+import tempfile
+import numpy as np
+from clustering.neighbors import build_neighbors
+from clustering.tau import estimate_tau, search_tau, load_cached_tau, save_cached_tau, tau_cache_file, _radius_clique_count
+from clustering.leaders import leaders_cluster
+
+class TestTau(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.points = rng.normal(size=(300, 5))
+
+    def test_estimate_tau_small_dataset(self):
+        # Fewer points than the default sample size
+        index = build_neighbors('exact', self.points)
+        tau, quantiles = estimate_tau(index, len(self.points), seed=1)
+
+        dist = np.linalg.norm(self.points[:, None] - self.points[None], axis=2)
+        np.fill_diagonal(dist, np.inf)
+        self.assertAlmostEqual(tau, np.median(dist.min(axis=1)))
+        self.assertEqual(sorted(quantiles), [0.1, 0.25, 0.5, 0.75, 0.9])
+        self.assertEqual(estimate_tau(index, len(self.points), seed=1), (tau, quantiles))
+
+    def test_search_tau(self):
+        tau = search_tau(self.points, target_cliques=60, sample_size=300)
+        dist = np.linalg.norm(self.points[:, None] - self.points[None], axis=2)
+        self.assertLessEqual(abs(_radius_clique_count(dist, tau) - 60), 3)
+
+        tau = search_tau(self.points, target_ratio=0.2, sample_size=300, is_fast=False)
+        self.assertGreater(tau, 0)
+
+    def test_tau_cache(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            cache_file = tau_cache_file(f"{output_path}/leaders_.ann")
+            self.assertEqual(cache_file, f"{output_path}/leaders_.tau.json")
+            self.assertIsNone(load_cached_tau(cache_file, {"seed": 0}))
+            save_cached_tau(cache_file, 1.5, {"seed": 0})
+            self.assertEqual(load_cached_tau(cache_file, {"seed": 0}), 1.5)
+            self.assertIsNone(load_cached_tau(cache_file, {"seed": 1}))
+
+    def test_leaders_cluster_estimates_and_caches_tau(self):
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(300)])
+        with tempfile.TemporaryDirectory() as output_path:
+            _, tau = leaders_cluster(self.points, vocab, 3, output_path, neighbors='exact')
+            self.assertTrue(os.path.exists(f"{output_path}/leaders_.tau.json"))
+            _, cached_tau = leaders_cluster(self.points, vocab, 3, output_path, neighbors='exact')
+            self.assertEqual(tau, cached_tau)
+
+    def test_tau_cache_is_keyed_on_data_and_neighbors(self):
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(300)])
+        other = np.random.default_rng(1).normal(scale=3, size=(300, 5))
+        with tempfile.TemporaryDirectory() as output_path, tempfile.TemporaryDirectory() as fresh_path:
+            leaders_cluster(self.points, vocab, 3, output_path, neighbors='exact')
+            # Same size and settings, different points
+            _, tau = leaders_cluster(other, vocab, 3, output_path, neighbors='exact')
+            _, fresh_tau = leaders_cluster(other, vocab, 3, fresh_path, neighbors='exact')
+            self.assertEqual(tau, fresh_tau)
+
+            leaders_cluster(other, vocab, 3, output_path, neighbors='ivf', n_lists=4, n_probe=2)
+            with open(f"{output_path}/leaders_.tau.json") as f:
+                params = json.load(f)["params"]
+            self.assertEqual(params["neighbors"], {"method": "ivf", "n_lists": 4, "n_probe": 2})
+            self.assertEqual(len(params["data"]), 32)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# tests/test_two_stage.py
+import unittest
+import tempfile
+import numpy as np
+from clustering.two_stage import fit_micro_clusterer, assign_micro_clusters, two_stage_cluster
+
+class TestTwoStage(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(4, 8)) * 20
+        self.truth = np.repeat(np.arange(4), 250)
+        self.points = centers[self.truth] + rng.normal(size=(1000, 8))
+
+    def test_assign_micro_clusters(self):
+        for method in ['kmeans', 'birch']:
+            model = fit_micro_clusterer(self.points, n_micro=50, method=method, chunk_size=128, threshold=2.0)
+            centroids, weights, labels = assign_micro_clusters(model, self.points, chunk_size=128)
+
+            self.assertEqual(weights.sum(), 1000)
+            self.assertEqual(len(labels), 1000)
+            np.testing.assert_array_equal(np.bincount(labels), weights)
+            np.testing.assert_allclose(centroids[3], self.points[labels == 3].mean(axis=0))
+
+    def test_two_stage_cluster(self):
+        vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(1000)])
+        with tempfile.TemporaryDirectory() as output_path:
+            cluster_files = two_stage_cluster(self.points, vocab, [4], output_path, n_micro=40, chunk_size=200)
+
+            with open(cluster_files[0]) as f:
+                labels = {line.split("|||")[2]: int(line.split("|||")[-1]) for line in f.read().splitlines()}
+        labels = np.array([labels[str(i)] for i in range(1000)])
+
+        # Every well separated blob ends up in its own cluster
+        self.assertEqual(len(set(labels)), 4)
+        for blob in range(4):
+            self.assertEqual(len(set(labels[self.truth == blob])), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+# tests/test_writer.py
+import os
+import unittest
+import tempfile
+import numpy as np
+from clustering.writer import write_clusters, grouped_order, read_labels, labels_file_for
+
+class TestWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.vocab = np.array([f"w{i}|||1|||{i}|||0" for i in range(10)])
+        self.labels = np.array([3, 1, 3, 0, 1, 1, 3, 0, 2, 2])
+
+    def test_grouped_order(self):
+        np.testing.assert_array_equal(grouped_order(self.labels), [0, 2, 6, 1, 4, 5, 3, 7, 8, 9])
+        np.testing.assert_array_equal(grouped_order(self.labels, sort_labels=True), [3, 7, 1, 4, 5, 8, 9, 0, 2, 6])
+
+    def test_write_clusters(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            cluster_file = os.path.join(output_path, "clusters-agg-4.txt")
+            # a chunk size that does not divide the vocab
+            self.assertEqual(write_clusters(self.vocab, self.labels, cluster_file, chunk_lines=3), cluster_file)
+            with open(cluster_file) as f:
+                lines = f.read().splitlines()
+            labels = read_labels(cluster_file, mmap_mode=None)
+            self.assertTrue(os.path.exists(f"{output_path}/clusters-agg-4.labels.npy"))
+            self.assertEqual(labels_file_for(cluster_file), f"{output_path}/clusters-agg-4.labels.npy")
+
+        self.assertEqual(lines, [f"{self.vocab[i]}|||{self.labels[i]}" for i in grouped_order(self.labels)])
+        self.assertEqual(labels.dtype, np.int32)
+        np.testing.assert_array_equal(labels, self.labels)
+
+    def test_length_mismatch(self):
+        with tempfile.TemporaryDirectory() as output_path:
+            with self.assertRaises(ValueError):
+                write_clusters(self.vocab[:5], self.labels, os.path.join(output_path, "clusters.txt"))
+
+if __name__ == '__main__':
+    unittest.main()